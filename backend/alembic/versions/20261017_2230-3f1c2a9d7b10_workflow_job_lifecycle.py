@@ -0,0 +1,47 @@
+"""workflow job lifecycle columns
+
+Revision ID: 3f1c2a9d7b10
+Revises: 
+Create Date: 2026-10-17 22:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9d7b10'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 表由应用启动时 create_all 创建，新库上列可能已存在，因此使用 IF NOT EXISTS
+    op.execute("ALTER TABLE workflow_history ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR")
+    op.execute("ALTER TABLE workflow_history ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0")
+    op.execute("ALTER TABLE workflow_history ADD COLUMN IF NOT EXISTS error TEXT")
+    op.execute("ALTER TABLE workflow_history ADD COLUMN IF NOT EXISTS started_at TIMESTAMP WITH TIME ZONE")
+    op.execute("ALTER TABLE workflow_history ADD COLUMN IF NOT EXISTS finished_at TIMESTAMP WITH TIME ZONE")
+    op.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'uq_workflow_history_user_idempotency'
+            ) THEN
+                ALTER TABLE workflow_history
+                    ADD CONSTRAINT uq_workflow_history_user_idempotency UNIQUE (user_id, idempotency_key);
+            END IF;
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    op.drop_constraint("uq_workflow_history_user_idempotency", "workflow_history", type_="unique")
+    op.drop_column("workflow_history", "finished_at")
+    op.drop_column("workflow_history", "started_at")
+    op.drop_column("workflow_history", "error")
+    op.drop_column("workflow_history", "attempts")
+    op.drop_column("workflow_history", "idempotency_key")
@@ -0,0 +1,64 @@
+"""workflow payload compression columns
+
+Revision ID: c52d0e7f4a18
+Revises: 8a4e6b2c91d3
+Create Date: 2026-10-17 23:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c52d0e7f4a18'
+down_revision: Union[str, None] = '8a4e6b2c91d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 只加可空列；旧行的预览和长度在这里补齐 (历史列表立即可用)，
+    # zstd 压缩由 python -m app.compact_payloads 在后台分批完成
+    op.execute("""
+        ALTER TABLE workflow_history
+            ADD COLUMN IF NOT EXISTS input_blob BYTEA,
+            ADD COLUMN IF NOT EXISTS output_blob BYTEA,
+            ADD COLUMN IF NOT EXISTS input_preview TEXT,
+            ADD COLUMN IF NOT EXISTS output_preview TEXT,
+            ADD COLUMN IF NOT EXISTS input_size INTEGER,
+            ADD COLUMN IF NOT EXISTS output_size INTEGER
+    """)
+    op.alter_column("workflow_history", "input_data", existing_type=sa.Text(), nullable=True)
+    # 与 app.payloads.make_preview 一致：按字符截断，超出部分以省略号结尾
+    op.execute(sa.text("""
+        UPDATE workflow_history SET
+            input_preview = CASE WHEN char_length(input_data) > :chars
+                THEN left(input_data, :chars) || '…' ELSE input_data END,
+            input_size = char_length(input_data),
+            output_preview = CASE WHEN char_length(output_data) > :chars
+                THEN left(output_data, :chars) || '…' ELSE output_data END,
+            output_size = char_length(output_data)
+        WHERE input_blob IS NULL AND output_blob IS NULL
+    """).bindparams(chars=settings.payload_preview_chars))
+
+
+def downgrade() -> None:
+    # 已压缩的行无法在 SQL 中还原，需先用 python -m app.compact_payloads --restore 解压
+    op.execute("""
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM workflow_history 
+                WHERE (input_data IS NULL AND input_blob IS NOT NULL)
+                   OR (output_data IS NULL AND output_blob IS NOT NULL)
+            ) THEN
+                RAISE EXCEPTION 'workflow_history 仍有压缩行，请先执行 python -m app.compact_payloads --restore';
+            END IF;
+        END $$;
+    """)
+    op.alter_column("workflow_history", "input_data", existing_type=sa.Text(), nullable=False)
+    for column in ("output_size", "input_size", "output_preview", "input_preview", "output_blob", "input_blob"):
+        op.drop_column("workflow_history", column)
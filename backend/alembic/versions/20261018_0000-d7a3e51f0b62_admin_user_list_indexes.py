@@ -0,0 +1,54 @@
+"""admin user list indexes
+
+Revision ID: d7a3e51f0b62
+Revises: c52d0e7f4a18
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3e51f0b62'
+down_revision: Union[str, None] = 'c52d0e7f4a18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BTREE_INDEXES = {
+    "ix_users_created_id": "users (created_at DESC, id DESC)",
+    "ix_users_email_lower": "users (lower(email) text_pattern_ops)",
+    "ix_users_username_lower": "users (lower(username) text_pattern_ops)",
+}
+
+TRGM_INDEXES = {
+    "ix_users_email_trgm": "users USING gin (email gin_trgm_ops)",
+    "ix_users_username_trgm": "users USING gin (username gin_trgm_ops)",
+}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    trgm_available = bind.execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).scalar() is not None
+
+    # CONCURRENTLY 不能在事务中执行；大表上建索引不阻塞写入
+    with op.get_context().autocommit_block():
+        for name, definition in BTREE_INDEXES.items():
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}")
+
+        # 子串搜索 (ILIKE '%q%') 的三元组索引；数据库未提供 pg_trgm 时跳过，子串搜索退化为顺序扫描
+        if trgm_available:
+            op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for name, definition in TRGM_INDEXES.items():
+                op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in [*TRGM_INDEXES, *BTREE_INDEXES]:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,69 @@
+"""workflow run events and hourly rollups
+
+Revision ID: e84b19c3a7f5
+Revises: d7a3e51f0b62
+Create Date: 2026-10-18 00:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e84b19c3a7f5'
+down_revision: Union[str, None] = 'd7a3e51f0b62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 表由应用启动时 create_all 创建，新库上可能已存在，因此使用 IF NOT EXISTS
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS workflow_run_events (
+            id BIGSERIAL PRIMARY KEY,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            app_id VARCHAR NOT NULL,
+            user_id INTEGER,
+            source VARCHAR NOT NULL,
+            status VARCHAR NOT NULL,
+            wall_ms INTEGER NOT NULL,
+            dify_elapsed_ms INTEGER,
+            total_tokens INTEGER,
+            total_steps INTEGER,
+            workflow_run_id VARCHAR
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_workflow_run_events_created_brin
+        ON workflow_run_events USING brin (created_at)
+    """)
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS workflow_run_rollups (
+            id SERIAL PRIMARY KEY,
+            dimension VARCHAR NOT NULL,
+            key VARCHAR NOT NULL,
+            hour TIMESTAMP WITH TIME ZONE NOT NULL,
+            runs INTEGER NOT NULL,
+            failed INTEGER NOT NULL,
+            wall_ms_total BIGINT NOT NULL,
+            wall_ms_p50 INTEGER,
+            wall_ms_p95 INTEGER,
+            dify_ms_p50 INTEGER,
+            dify_ms_p95 INTEGER,
+            total_tokens BIGINT NOT NULL,
+            total_steps BIGINT NOT NULL,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            CONSTRAINT uq_workflow_run_rollups_dimension_key_hour UNIQUE (dimension, key, hour)
+        )
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_workflow_run_rollups_dimension_hour
+        ON workflow_run_rollups (dimension, hour)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table("workflow_run_rollups")
+    op.drop_table("workflow_run_events")
@@ -0,0 +1,48 @@
+"""products captured by the browser extension
+
+Revision ID: f2c6d8a4b913
+Revises: e84b19c3a7f5
+Create Date: 2026-10-18 01:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c6d8a4b913'
+down_revision: Union[str, None] = 'e84b19c3a7f5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 表由应用启动时 create_all 创建，新库上可能已存在，因此使用 IF NOT EXISTS
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            id SERIAL PRIMARY KEY,
+            asin VARCHAR(10) NOT NULL,
+            marketplace VARCHAR(3) NOT NULL,
+            url TEXT,
+            title TEXT NOT NULL,
+            price NUMERIC(12, 2),
+            currency VARCHAR(3),
+            rating FLOAT,
+            review_count INTEGER,
+            images JSONB NOT NULL DEFAULT '[]'::jsonb,
+            bullets JSONB NOT NULL DEFAULT '[]'::jsonb,
+            reviews JSONB NOT NULL DEFAULT '[]'::jsonb,
+            description TEXT,
+            content_hash BYTEA NOT NULL,
+            captured_by INTEGER,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            CONSTRAINT uq_products_asin_marketplace UNIQUE (asin, marketplace)
+        )
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table("products")
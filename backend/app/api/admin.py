@@ -1,12 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, List, Optional, Tuple
 from pydantic import BaseModel
+from datetime import datetime, timedelta, timezone
+import asyncio
+import csv
+import io
+import json
 
-from app.database import get_db
+from app.config import settings
+from app.database import AsyncSessionLocal, get_db
 from app.api.auth import get_current_user
 from app.schemas.user import User
 from app.models import User as UserModel
+from app.services.admin_users import EXPORT_FIELDS, build_user_query, fetch_user_page, user_row
+from app.services.run_rollups import fetch_series, fetch_summary
+from app.services.stats import stats_service
+from app.services.user_cache import user_cache
 
 router = APIRouter()
 
@@ -27,30 +39,44 @@ def check_admin_access(current_user: UserModel):
         )
 
 
+SORT_PATTERN = "^(created_at|email|username|id)$"
+ORDER_PATTERN = "^(asc|desc)$"
+MATCH_PATTERN = "^(prefix|contains)$"
+
+
 @router.get("/admin/users")
 async def get_all_users(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    sort: str = Query("created_at", pattern=SORT_PATTERN),
+    order: str = Query("desc", pattern=ORDER_PATTERN),
+    q: Optional[str] = Query(None, max_length=100, description="按邮箱或用户名搜索"),
+    match: str = Query("prefix", pattern=MATCH_PATTERN),
+    is_admin: Optional[int] = Query(None, ge=0, le=1),
+    is_active: Optional[int] = Query(None, ge=0, le=1),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
-    获取所有用户列表（管理员权限）
+    获取用户列表（管理员权限，keyset 分页；next_cursor 为空表示没有下一页）
     """
     check_admin_access(current_user)
+    limit = min(limit or settings.admin_users_page_size, settings.admin_users_max_page_size)
     try:
-        users = db.query(UserModel).all()
-        return {
-            "data": [
-                {
-                    "id": str(user.id),
-                    "email": user.email,
-                    "username": user.username,
-                    "created_at": user.created_at.isoformat() if user.created_at else None,
-                    "is_admin": user.is_admin,
-                    "status": "active" if user.is_active == 1 else "inactive"
-                }
-                for user in users
-            ]
-        }
+        rows, next_cursor = await fetch_user_page(
+            db,
+            limit,
+            cursor=cursor,
+            sort=sort,
+            order=order,
+            q=q,
+            match=match,
+            is_admin=is_admin,
+            is_active=is_active
+        )
+        return {"data": [user_row(row) for row in rows], "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -58,18 +84,70 @@ async def get_all_users(
         )
 
 
+async def _export_rows(query, export_format: str) -> AsyncIterator[bytes]:
+    """服务端游标逐批读取，每批编码后立即写出，内存占用与总行数无关"""
+    if export_format == "csv":
+        # BOM 便于 Excel 正确识别 UTF-8
+        yield "\ufeff".encode("utf-8")
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        yield buffer.getvalue().encode("utf-8")
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=settings.admin_export_batch_size))
+        async for rows in result.partitions():
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+                writer.writerows(user_row(row) for row in rows)
+                yield buffer.getvalue().encode("utf-8")
+            else:
+                yield "".join(
+                    json.dumps(user_row(row), ensure_ascii=False) + "\n" for row in rows
+                ).encode("utf-8")
+
+
+@router.get("/admin/users/export")
+async def export_users(
+    export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    sort: str = Query("created_at", pattern=SORT_PATTERN),
+    order: str = Query("desc", pattern=ORDER_PATTERN),
+    q: Optional[str] = Query(None, max_length=100),
+    match: str = Query("prefix", pattern=MATCH_PATTERN),
+    is_admin: Optional[int] = Query(None, ge=0, le=1),
+    is_active: Optional[int] = Query(None, ge=0, le=1),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    导出用户列表（管理员权限，CSV / NDJSON 流式输出，筛选条件与列表接口相同）
+    """
+    check_admin_access(current_user)
+    query = build_user_query(sort=sort, order=order, q=q, match=match, is_admin=is_admin, is_active=is_active)
+    media_type = "text/csv; charset=utf-8" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _export_rows(query, export_format),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="users.{export_format}"',
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
 @router.post("/admin/grant-admin")
 async def grant_admin(
     request: GrantAdminRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     授权用户为管理员（管理员权限）
     """
     check_admin_access(current_user)
     try:
-        user = db.query(UserModel).filter(UserModel.id == request.user_id).first()
+        user = await db.get(UserModel, request.user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -77,14 +155,16 @@ async def grant_admin(
             )
 
         user.is_admin = 1
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
+        await user_cache.invalidate(user.email)
+        await stats_service.invalidate_users()
 
         return {"message": f"用户 {user.username} 已被授予管理员权限"}
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"授权管理员失败: {str(e)}"
@@ -95,14 +175,14 @@ async def grant_admin(
 async def revoke_admin(
     request: GrantAdminRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     撤销用户管理员权限（管理员权限）
     """
     check_admin_access(current_user)
     try:
-        user = db.query(UserModel).filter(UserModel.id == request.user_id).first()
+        user = await db.get(UserModel, request.user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -117,14 +197,16 @@ async def revoke_admin(
             )
 
         user.is_admin = 0
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
+        await user_cache.invalidate(user.email)
+        await stats_service.invalidate_users()
 
         return {"message": f"用户 {user.username} 的管理员权限已被撤销"}
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"撤销管理员权限失败: {str(e)}"
@@ -135,14 +217,14 @@ async def revoke_admin(
 async def update_user_status(
     request: UpdateUserStatusRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     更新用户状态（激活/禁用）（管理员权限）
     """
     check_admin_access(current_user)
     try:
-        user = db.query(UserModel).filter(UserModel.id == request.user_id).first()
+        user = await db.get(UserModel, request.user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -157,15 +239,17 @@ async def update_user_status(
             )
 
         user.is_active = request.is_active
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
+        await user_cache.invalidate(user.email)
+        await stats_service.invalidate_users()
 
         status_text = "激活" if user.is_active == 1 else "禁用"
         return {"message": f"用户 {user.username} 已被{status_text}"}
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"更新用户状态失败: {str(e)}"
@@ -174,16 +258,16 @@ async def update_user_status(
 
 @router.delete("/admin/users/{user_id}")
 async def delete_user(
-    user_id: str,
+    user_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     删除用户（管理员权限）
     """
     check_admin_access(current_user)
     try:
-        user = db.query(UserModel).filter(UserModel.id == user_id).first()
+        user = await db.get(UserModel, user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -197,14 +281,16 @@ async def delete_user(
                 detail="不能删除自己的账户"
             )
 
-        db.delete(user)
-        db.commit()
+        await db.delete(user)
+        await db.commit()
+        await user_cache.invalidate(user.email)
+        await stats_service.invalidate_users(deleted=True)
 
         return {"message": "用户删除成功"}
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"删除用户失败: {str(e)}"
@@ -213,27 +299,75 @@ async def delete_user(
 
 @router.get("/admin/stats")
 async def get_admin_stats(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
     """
-    获取系统统计数据（管理员权限）
+    获取系统统计数据（管理员权限，Redis 缓存；Dify 数据库不可用时 Dify 相关字段为 null）
     """
     check_admin_access(current_user)
     try:
-        total_users = db.query(UserModel).count()
-        active_users = db.query(UserModel).filter(UserModel.is_active == 1).count()
-        admin_users = db.query(UserModel).filter(UserModel.is_admin == 1).count()
-
+        users, dify = await asyncio.gather(stats_service.user_stats(), stats_service.dify_stats())
         return {
-            "total_users": total_users,
-            "active_users": active_users,
-            "admin_users": admin_users,
-            "total_apps": 0,  # TODO: 从 Dify 获取应用数量
-            "system_status": "healthy"
+            "total_users": users["total_users"],
+            "active_users": users["active_users"],
+            "admin_users": users["admin_users"],
+            "total_apps": dify["total_apps"] if dify else None,
+            "total_runs": dify["total_runs"] if dify else None,
+            "succeeded_runs": dify["succeeded_runs"] if dify else None,
+            "failed_runs": dify["failed_runs"] if dify else None,
+            "user_growth": users["user_growth"],
+            "run_series": dify["run_series"] if dify else [],
+            "system_status": "healthy" if dify else "degraded"
         }
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"获取统计数据失败: {str(e)}"
         )
+
+
+def _analytics_range(since: Optional[datetime], until: Optional[datetime]) -> Tuple[datetime, datetime]:
+    """默认最近 24 小时；不带时区的时间按 UTC 处理"""
+    until = until or datetime.now(timezone.utc)
+    since = since or until - timedelta(hours=24)
+    since, until = (value if value.tzinfo else value.replace(tzinfo=timezone.utc) for value in (since, until))
+    if since >= until:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="since 必须早于 until")
+    return since, until
+
+
+@router.get("/admin/analytics/runs")
+async def get_run_analytics(
+    dimension: str = Query("app", pattern="^(app|user)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    sort: str = Query("runs", pattern="^(runs|failed|tokens|p95)$"),
+    limit: int = Query(20, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    按应用或用户汇总区间内的运行数、失败数、耗时与 token（管理员权限，数据来自小时汇总，约有一个汇总周期的延迟）
+    """
+    check_admin_access(current_user)
+    since, until = _analytics_range(since, until)
+    data = await fetch_summary(db, dimension, since, until, sort, limit)
+    return {"since": since.isoformat(), "until": until.isoformat(), "data": data}
+
+
+@router.get("/admin/analytics/runs/series")
+async def get_run_analytics_series(
+    dimension: str = Query("all", pattern="^(app|user|all)$"),
+    key: str = Query("", description="应用 ID 或用户 ID；dimension=all 时留空"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    某个应用 / 用户 (或全部运行) 的逐小时运行数、p50/p95 耗时与 token（管理员权限）
+    """
+    check_admin_access(current_user)
+    since, until = _analytics_range(since, until)
+    data = await fetch_series(db, dimension, "" if dimension == "all" else key, since, until)
+    return {"since": since.isoformat(), "until": until.isoformat(), "data": data}
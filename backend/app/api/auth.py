@@ -1,31 +1,35 @@
-import httpx
 import logging
 from fastapi import APIRouter, Depends, HTTPException, status, Response
 from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import jwt
 from datetime import datetime, timedelta
 from typing import Optional
 
 from app.database import get_db
 from app.models import User as UserModel
-from app.schemas.user import UserCreate, UserLogin, Token, User
+from app.schemas.user import UserCreate, UserLogin, Token, User, CurrentUser
 from app.config import settings
+from app.services.dify_client import dify_client
+from app.services.passwords import password_hasher
+from app.services.stats import stats_service
+from app.services.user_cache import user_cache
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -47,7 +51,22 @@ def verify_token_data(token: str) -> Optional[dict]:
         return None
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+async def resolve_user(email: str, db: AsyncSession) -> Optional[CurrentUser]:
+    """按 JWT subject (邮箱) 解析用户，优先命中缓存"""
+    user = await user_cache.get(email)
+    if user is not None:
+        return user
+
+    generation = await user_cache.generation(email)
+    db_user = await db.scalar(select(UserModel).where(UserModel.email == email))
+    if db_user is None:
+        return None
+    user = CurrentUser.model_validate(db_user)
+    await user_cache.set(email, user, generation)
+    return user
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> CurrentUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -61,33 +80,38 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except jwt.JWTError:
         raise credentials_exception
 
-    user = db.query(UserModel).filter(UserModel.email == email).first()
+    user = await resolve_user(email, db)
     if user is None:
         raise credentials_exception
+    if user.is_active != 1:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="账户已被禁用"
+        )
     return user
 
 
 @router.post("/register", response_model=Token)
-async def register(user: UserCreate, response: Response, db: Session = Depends(get_db)):
-    db_user = db.query(UserModel).filter(UserModel.email == user.email).first()
+async def register(user: UserCreate, response: Response, db: AsyncSession = Depends(get_db)):
+    db_user = await db.scalar(select(UserModel).where(UserModel.email == user.email))
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
 
-    db_user = db.query(UserModel).filter(UserModel.username == user.username).first()
+    db_user = await db.scalar(select(UserModel).where(UserModel.username == user.username))
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already taken"
         )
 
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     
-    # 检查是否为第一个注册用户
-    user_count = db.query(UserModel).count()
-    is_admin = 1 if user_count == 0 else 0
+    # 检查是否为第一个注册用户 (EXISTS 只需读取一行)
+    has_users = await db.scalar(select(exists().select_from(UserModel)))
+    is_admin = 0 if has_users else 1
     
     db_user = UserModel(
         email=user.email,
@@ -96,75 +120,75 @@ async def register(user: UserCreate, response: Response, db: Session = Depends(g
         is_admin=is_admin
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    await stats_service.invalidate_users()
 
     # 如果是管理员，尝试同步初始化 Dify
     if is_admin == 1:
         try:
-            async with httpx.AsyncClient() as client:
-                # 1. 调用 Dify 初始化接口
-                response = await client.post(
-                    f"{settings.dify_base_url}/console/api/setup",
-                    json={
-                        "email": user.email,
-                        "name": user.username,
-                        "password": user.password
-                    },
-                    timeout=10.0
+            # 1. 调用 Dify 初始化接口
+            response = await dify_client.console.post(
+                "/console/api/setup",
+                json={
+                    "email": user.email,
+                    "name": user.username,
+                    "password": user.password
+                },
+                timeout=dify_client.timeout("console")
+            )
+
+            dify_token = None
+
+            # 2. 如果初始化成功 (201) 或 已经初始化 (403)，尝试登录获取 Token
+            if response.status_code in [200, 201, 403]:
+                if response.status_code == 403:
+                    logger.info("Dify already initialized. Attempting login...")
+                else:
+                    logger.info("Dify admin initialized successfully")
+
+                # 登录获取 Dify Token
+                login_res = await dify_client.console.post(
+                    "/console/api/login",
+                    json={"email": user.email, "password": user.password},
+                    timeout=dify_client.timeout("console")
                 )
-                
-                dify_token = None
-                
-                # 2. 如果初始化成功 (201) 或 已经初始化 (403)，尝试登录获取 Token
-                if response.status_code in [200, 201, 403]:
-                    if response.status_code == 403:
-                        logging.info("Dify already initialized. Attempting login...")
-                    else:
-                        logging.info("Dify admin initialized successfully")
-                    
-                    # 登录获取 Dify Token
-                    login_res = await client.post(
-                        f"{settings.dify_base_url}/console/api/login",
-                        json={"email": user.email, "password": user.password},
-                        timeout=10.0
-                    )
-                    
-                    if login_res.status_code == 200:
-                        dify_token = login_res.json().get("data", {}).get("access_token")
-                        logging.info("Dify login successful")
-                    else:
-                        logging.warning(f"Dify login failed: {login_res.status_code}")
-                        
+
+                if login_res.status_code == 200:
+                    dify_token = login_res.json().get("data", {}).get("access_token")
+                    logger.info("Dify login successful")
                 else:
-                    logging.warning(f"Dify init failed: {response.status_code} - {response.text}")
-                    # 如果 Dify 初始化失败 (比如密码不符合要求)，我们记录日志，但不阻断 AMZ 注册
-                    # 因为用户后续可以在 Dify 界面手动处理
-
-                # 3. 如果获取到了 Token，检查并创建默认工作区
-                if dify_token:
-                    # 获取工作区列表
-                    workspaces_res = await client.get(
-                        f"{settings.dify_base_url}/console/api/workspaces",
-                        headers={"Authorization": f"Bearer {dify_token}"},
-                        timeout=10.0
-                    )
-                    
-                    if workspaces_res.status_code == 200:
-                        workspaces = workspaces_res.json().get("workspaces", [])
-                        if not workspaces:
-                            # 只有当没有工作区时才创建
-                            await client.post(
-                                f"{settings.dify_base_url}/console/api/workspaces",
-                                headers={"Authorization": f"Bearer {dify_token}"},
-                                json={"name": "AMZ Workspace"},
-                                timeout=10.0
-                            )
-                            logging.info("Default AMZ Workspace created in Dify")
-                        else:
-                            logging.info(f"Dify workspaces already exist: {len(workspaces)}")
+                    logger.warning("Dify login failed: %s", login_res.status_code)
+
+            else:
+                logger.warning("Dify init failed: %s - %s", response.status_code, response.text)
+                # 如果 Dify 初始化失败 (比如密码不符合要求)，我们记录日志，但不阻断 AMZ 注册
+                # 因为用户后续可以在 Dify 界面手动处理
+
+            # 3. 如果获取到了 Token，检查并创建默认工作区
+            if dify_token:
+                # 获取工作区列表
+                workspaces_res = await dify_client.console.get(
+                    "/console/api/workspaces",
+                    headers={"Authorization": f"Bearer {dify_token}"},
+                    timeout=dify_client.timeout("console")
+                )
+
+                if workspaces_res.status_code == 200:
+                    workspaces = workspaces_res.json().get("workspaces", [])
+                    if not workspaces:
+                        # 只有当没有工作区时才创建
+                        await dify_client.console.post(
+                            "/console/api/workspaces",
+                            headers={"Authorization": f"Bearer {dify_token}"},
+                            json={"name": "AMZ Workspace"},
+                            timeout=dify_client.timeout("console")
+                        )
+                        logger.info("Default AMZ Workspace created in Dify")
+                    else:
+                        logger.info("Dify workspaces already exist: %s", len(workspaces))
         except Exception as e:
-            logging.error(f"Failed to sync with Dify: {e}")
+            logger.error("Failed to sync with Dify: %s", e)
 
     access_token = create_access_token(data={"sub": user.email})
     
@@ -191,15 +215,26 @@ async def register(user: UserCreate, response: Response, db: Session = Depends(g
 
 
 @router.post("/login", response_model=Token)
-async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(UserModel).filter(UserModel.email == user_credentials.email).first()
-    if not user or not verify_password(user_credentials.password, user.hashed_password):
+async def login(user_credentials: UserLogin, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(UserModel).where(UserModel.email == user_credentials.email))
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await password_hasher.verify_and_update(
+            user_credentials.password, user.hashed_password
+        )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # bcrypt 参数调整后，用本次登录的明文密码透明升级旧哈希
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+        await db.refresh(user)
+
     access_token = create_access_token(data={"sub": user.email})
     
     # 构造响应数据
@@ -230,6 +265,5 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
 
 
 @router.get("/setup-status")
-async def get_setup_status(db: Session = Depends(get_db)):
-    user_count = db.query(UserModel).count()
-    return {"has_admin": user_count > 0}
+async def get_setup_status():
+    return {"has_admin": await stats_service.has_users()}
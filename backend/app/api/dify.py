@@ -1,123 +1,91 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import OperationalError, DatabaseError
-from typing import Dict, Any, List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Any, List, Optional
+import hashlib
 import httpx
+import json
 import logging
+import time
 
 from app.database import get_db
+from app.http_cache import etag_matches
 from app.config import settings
 from app.api.auth import get_current_user
 from app.schemas.user import User
 from app.models import DifyApp
+from app.schemas.dify import BatchRunRequest
+from app.services.api_keys import api_key_registry
+from app.services.dify_batch import run_batch
+from app.services.dify_catalogue import dify_catalogue
+from app.services.dify_client import dify_client
+from app.services.dify_console import console_tokens
+from app.services.dify_limiter import dify_limiter
+from app.services.dify_resilience import gateway_error
+from app.services.rate_limit import rate_limiter
+from app.services.run_events import elapsed_ms, run_events
+from app.services.stats import stats_service
+from app.services.result_cache import BYPASS_HEADER, app_version, is_bypass, result_cache
+from app.services.dify_stream import (
+    SSE_HEADERS,
+    WorkflowStreamResult,
+    record_stream_run,
+    relay_workflow_stream,
+    save_stream_history,
+)
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
-# 创建 Dify 数据库连接 (仅用于读取列表，保持高性能)
-try:
-    dify_engine = create_engine(settings.dify_db_url, pool_pre_ping=True)
-except Exception as e:
-    logger.error(f"创建 Dify 数据库连接失败: {e}")
-    dify_engine = None
-
 router = APIRouter()
 
 
 async def get_dify_admin_token() -> str:
     """
-    获取 Dify 管理员 Token (用于调用 Console API)
+    获取 Dify 管理员 Token (用于调用 Console API)，由 console_tokens 缓存并提前刷新
     """
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{settings.dify_base_url}/console/api/login",
-                json={
-                    "email": settings.dify_admin_email,
-                    "password": settings.dify_admin_password,
-                    "provider": "email"
-                },
-                timeout=10.0
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Dify 登录失败: {response.text}")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="无法认证 Dify 管理员账户"
-                )
-                
-            data = response.json()
-            return data.get("data", {}).get("access_token")
-    except httpx.RequestError as e:
-        logger.error(f"Dify 连接失败: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="无法连接到 Dify 服务"
-        )
+    return await console_tokens.get_token()
 
 
-def get_dify_apps_from_db() -> List[Dict[str, Any]]:
-    """直接从 Dify 数据库读取应用列表"""
-    if dify_engine is None:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Dify 数据库连接未初始化"
-        )
-    
-    try:
-        with dify_engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT
-                    id,
-                    name,
-                    mode,
-                    description,
-                    status,
-                    icon,
-                    created_at,
-                    updated_at
-                FROM apps
-                ORDER BY created_at DESC
-            """))
-
-            apps = []
-            for row in result:
-                apps.append({
-                    "id": str(row.id),
-                    "name": row.name,
-                    "mode": row.mode,
-                    "description": row.description,
-                    "status": row.status,
-                    "icon": row.icon,
-                    "created_at": row.created_at.isoformat() if row.created_at else None,
-                    "updated_at": row.updated_at.isoformat() if row.updated_at else None,
-                })
-            return apps
-    except (OperationalError, DatabaseError) as e:
-        logger.error(f"数据库操作失败: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="无法连接到 Dify 数据库，请确保 Dify 服务正在运行"
-        )
-    except Exception as e:
-        logger.error(f"读取 Dify 应用时出错: {e}")
-        return []
+async def _catalogue_response(request: Request, build_payload, **filters) -> Response:
+    """
+    查询应用目录并附带 ETag；快照版本与查询参数都未变化时返回 304
+    """
+    apps, next_cursor, version = await dify_catalogue.list_apps(**filters)
+    digest = hashlib.sha1(f"{version}?{request.url.query}".encode()).hexdigest()
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=build_payload(apps, next_cursor), headers=headers)
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    return [field.strip() for field in fields.split(",") if field.strip()] if fields else None
 
 
 @router.get("/dify/test")
-async def test_dify_connection():
+async def test_dify_connection(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000)
+):
     """
     测试 Dify 数据库连接（临时测试端点，不需要认证）
     """
     try:
-        apps = get_dify_apps_from_db()
-        return {
-            "status": "success",
-            "count": len(apps),
-            "apps": apps
-        }
+        return await _catalogue_response(
+            request,
+            lambda apps, next_cursor: {
+                "status": "success",
+                "count": len(apps),
+                "apps": apps,
+                "next_cursor": next_cursor
+            },
+            limit=limit
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -127,14 +95,31 @@ async def test_dify_connection():
 
 @router.get("/dify/apps")
 async def get_dify_apps(
+    request: Request,
+    mode: Optional[str] = None,
+    app_status: Optional[str] = Query(None, alias="status"),
+    name_prefix: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = Query(None, description="逗号分隔的返回字段，如 id,name,mode"),
     current_user: User = Depends(get_current_user)
 ):
     """
-    获取 Dify 应用列表（直接从数据库读取）
+    获取 Dify 应用列表（应用目录快照，支持游标分页、筛选与字段投影）
     """
     try:
-        apps = get_dify_apps_from_db()
-        return {"apps": apps}
+        return await _catalogue_response(
+            request,
+            lambda apps, next_cursor: {"apps": apps, "next_cursor": next_cursor},
+            mode=mode,
+            app_status=app_status,
+            name_prefix=name_prefix,
+            cursor=cursor,
+            limit=limit,
+            fields=_parse_fields(fields)
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -142,6 +127,18 @@ async def get_dify_apps(
         )
 
 
+async def _catalogue_summary(app_id: str) -> Optional[Dict[str, Any]]:
+    app = await dify_catalogue.get_app(app_id)
+    if not app:
+        return None
+    return {
+        "id": app["id"],
+        "name": app["name"],
+        "mode": app["mode"],
+        "description": app["description"]
+    }
+
+
 @router.get("/dify/apps/{app_id}")
 async def get_dify_app(
     app_id: str,
@@ -151,38 +148,36 @@ async def get_dify_app(
     获取单个 Dify 应用详情
     """
     try:
-        async with httpx.AsyncClient() as client:
-            # 尝试使用 API Key 访问 (Service API)
-            response = await client.get(
-                f"{settings.dify_api_url}/apps/{app_id}",
-                headers={
-                    "Authorization": f"Bearer {settings.dify_api_key}",
-                    "Content-Type": "application/json"
-                },
-                timeout=30.0
-            )
-            # 如果 Service API 失败，可能需要使用 Console API (TODO: 完善 Console API 读取)
-            response.raise_for_status()
-            return response.json()
+        # 尝试使用 API Key 访问 (Service API)
+        response = await dify_client.service.get(
+            f"/apps/{app_id}",
+            headers={
+                "Authorization": f"Bearer {settings.dify_api_key}",
+                "Content-Type": "application/json"
+            },
+            timeout=dify_client.timeout("service")
+        )
+        # 如果 Service API 失败，可能需要使用 Console API (TODO: 完善 Console API 读取)
+        response.raise_for_status()
+        return response.json()
     except httpx.HTTPStatusError as e:
         # 如果是 404，可能是 API Key 权限问题或 App 不存在
-        # 降级：从数据库读取基本信息
+        # 降级：从应用目录快照读取基本信息
         if e.response.status_code == 404:
-             with dify_engine.connect() as conn:
-                result = conn.execute(text("SELECT * FROM apps WHERE id = :id"), {"id": app_id})
-                row = result.fetchone()
-                if row:
-                    return {
-                        "id": str(row.id),
-                        "name": row.name,
-                        "mode": row.mode,
-                        "description": row.description
-                    }
+            app = await _catalogue_summary(app_id)
+            if app:
+                return app
         
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Dify API 错误: {e.response.text if e.response else str(e)}"
         )
+    except httpx.RequestError as e:
+        # Dify 不可达 / 熔断 / 超时：同样降级到应用目录快照
+        app = await _catalogue_summary(app_id)
+        if app:
+            return app
+        raise gateway_error(e, f"Dify 暂不可用: {str(e)}")
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -194,40 +189,68 @@ async def get_dify_app(
 async def run_dify_app(
     app_id: str,
     inputs: Dict[str, Any],
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    result_cache_mode: Optional[str] = Header(None, alias=BYPASS_HEADER),
+    current_user: User = Depends(get_current_user)
 ):
     """
-    运行 Dify 应用
+    运行 Dify 应用 (开启结果缓存时，相同版本与 inputs 的重复运行直接返回缓存结果)
     """
+    await rate_limiter.check(current_user.id, app_id)
     try:
-        # 1. 查找应用的 API Key
-        dify_app = db.query(DifyApp).filter(DifyApp.app_id == app_id).first()
+        # 1. 查找应用的 API Key (进程内注册表，未登记的应用使用全局 Key)
+        dify_app = await api_key_registry.resolve(app_id)
         api_key = dify_app.api_key if dify_app else settings.dify_api_key
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{settings.dify_api_url}/workflows/run",
-                json={"inputs": inputs, "response_mode": "blocking", "user": current_user.email},
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                timeout=60.0
-            )
-            
+        async def run() -> Dict[str, Any]:
+            async with dify_limiter.slot():
+                started = time.perf_counter()
+                body: Dict[str, Any] = {}
+                try:
+                    dify_response = await dify_client.service.post(
+                        "/workflows/run",
+                        json={"inputs": inputs, "response_mode": "blocking", "user": current_user.email},
+                        headers={
+                            "Authorization": f"Bearer {api_key}",
+                            "Content-Type": "application/json"
+                        },
+                        timeout=dify_client.timeout("workflow_run")
+                    )
+                    if dify_response.status_code == 200:
+                        body = dify_response.json()
+                finally:
+                    data = body.get("data") or {}
+                    run_events.record(
+                        "run", app_id, current_user.id, data.get("status") or "failed", elapsed_ms(started), data
+                    )
+
             # 如果是 404/401 且使用了默认 Key，可能是因为这个应用需要自己的 Key
-            if response.status_code in [401, 403, 404] and not dify_app:
+            if dify_response.status_code in [401, 403, 404] and not dify_app:
                 # 尝试从 Console API 获取 (如果有权限 - 暂时不支持自动获取旧应用的 Key)
                 pass
 
-            response.raise_for_status()
-            return response.json()
+            dify_response.raise_for_status()
+            return body
+
+        result, cache_state = await result_cache.get_or_run(
+            app_id,
+            await app_version(app_id),
+            inputs,
+            run,
+            bypass=is_bypass(result_cache_mode),
+            should_cache=lambda body: (body.get("data") or {}).get("status") == "succeeded"
+        )
+        response.headers[BYPASS_HEADER] = cache_state
+        return result
+    except HTTPException:
+        raise
     except httpx.HTTPStatusError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Dify API 错误: {e.response.text if e.response else str(e)}"
         )
+    except httpx.RequestError as e:
+        raise gateway_error(e, f"调用 Dify 失败: {str(e)}")
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -235,21 +258,84 @@ async def run_dify_app(
         )
 
 
+@router.post("/dify/apps/{app_id}/run/stream")
+async def run_dify_app_stream(
+    app_id: str,
+    inputs: Dict[str, Any],
+    current_user: User = Depends(get_current_user)
+):
+    """
+    流式运行 Dify 应用 (SSE)，结束后写入运行历史
+    """
+    await rate_limiter.check(current_user.id, app_id)
+    dify_app = await api_key_registry.resolve(app_id)
+    api_key = dify_app.api_key if dify_app else settings.dify_api_key
+    name = dify_app.name if dify_app else app_id
+    user_id, user_email = current_user.id, current_user.email
+    input_data = json.dumps(inputs, ensure_ascii=False)
+    slot = await dify_limiter.acquire()
+
+    async def event_source():
+        result = WorkflowStreamResult()
+        try:
+            async for chunk in relay_workflow_stream(api_key, inputs, user_email, result):
+                yield chunk
+        finally:
+            slot.release()
+            record_stream_run(app_id, user_id, result)
+            await save_stream_history(user_id, name, input_data, result)
+
+    # 客户端在生成器开始前断开时 finally 不会执行，由后台任务兜底归还槽位
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+        background=BackgroundTask(slot.release)
+    )
+
+
+@router.post("/dify/apps/{app_id}/run/batch")
+async def run_dify_app_batch(
+    app_id: str,
+    batch: BatchRunRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    批量运行 Dify 应用，按完成顺序以 NDJSON 逐行返回结果
+    """
+    if len(batch.items) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单批最多 {settings.batch_max_items} 项"
+        )
+    # 单项由 batch 令牌桶限速，这里只按用户计一次请求
+    await rate_limiter.check(current_user.id)
+
+    dify_app = await api_key_registry.resolve(app_id)
+    api_key = dify_app.api_key if dify_app else settings.dify_api_key
+    name = batch.name or (dify_app.name if dify_app else app_id)
+    concurrency = min(batch.concurrency or settings.batch_default_concurrency, settings.batch_max_concurrency)
+
+    return StreamingResponse(
+        run_batch(app_id, api_key, name, batch.items, concurrency, current_user.id, current_user.email),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/dify/apps")
 async def create_dify_app(
     app_data: Dict[str, Any],
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     创建 Dify 应用（通过 Dify Console API）
     自动创建应用 -> 生成 API Key -> 保存到数据库
     """
+    await rate_limiter.check(current_user.id)
     try:
-        # 1. 获取管理员 Token
-        token = await get_dify_admin_token()
-        
-        # 2. 准备数据
+        # 1. 准备数据 (管理员 Token 由 console_tokens 注入)
         payload = {
             "name": app_data.get("name", "新应用"),
             "description": app_data.get("description", ""),
@@ -258,63 +344,65 @@ async def create_dify_app(
             "icon_background": app_data.get("icon_background", "#3B82F6")
         }
         
-        # 3. 调用 Dify Console API 创建应用
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{settings.dify_base_url}/console/api/apps",
+        # 2. 调用 Dify Console API 创建应用 (与运行请求共用并发槽位)
+        async with dify_limiter.slot():
+            response = await console_tokens.request(
+                "POST",
+                "/console/api/apps",
                 json=payload,
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json"
-                },
-                timeout=30.0
+                headers={"Content-Type": "application/json"},
+                timeout=dify_client.timeout("service")
             )
-            
+
             if response.status_code not in [200, 201]:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail=f"Dify 创建应用失败: {response.text}"
                 )
-            
+
             app_info = response.json()
             app_id = app_info.get("id")
-            
-            # 4. 为新应用创建 API Key
-            key_response = await client.post(
-                f"{settings.dify_base_url}/console/api/apps/{app_id}/api-keys",
+
+            # 3. 为新应用创建 API Key
+            key_response = await console_tokens.request(
+                "POST",
+                f"/console/api/apps/{app_id}/api-keys",
                 json={},
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json"
-                },
-                timeout=30.0
+                headers={"Content-Type": "application/json"},
+                timeout=dify_client.timeout("service")
             )
-            
-            if key_response.status_code not in [200, 201]:
-                # 如果创建 Key 失败，但应用创建成功，这很尴尬。
-                # 记录错误但不阻断返回（用户可以手动去生成）
-                logger.error(f"创建 API Key 失败: {key_response.text}")
-                api_key = settings.dify_api_key # Fallback? No, likely won't work.
-            else:
-                key_data = key_response.json()
-                api_key = key_data.get("token")
-                
-                # 5. 保存到数据库
-                new_dify_app = DifyApp(
-                    app_id=app_id,
-                    name=app_info.get("name"),
-                    api_key=api_key
-                )
-                db.add(new_dify_app)
-                db.commit()
-                db.refresh(new_dify_app)
-            
-            return app_info
+
+        if key_response.status_code not in [200, 201]:
+            # 如果创建 Key 失败，但应用创建成功，这很尴尬。
+            # 记录错误但不阻断返回（用户可以手动去生成）
+            logger.error("创建 API Key 失败: %s", key_response.text)
+            api_key = settings.dify_api_key # Fallback? No, likely won't work.
+        else:
+            key_data = key_response.json()
+            api_key = key_data.get("token")
+
+            # 4. 保存到数据库
+            new_dify_app = DifyApp(
+                app_id=app_id,
+                name=app_info.get("name"),
+                api_key=api_key
+            )
+            db.add(new_dify_app)
+            await db.commit()
+            await db.refresh(new_dify_app)
+            await api_key_registry.invalidate(app_id)
+
+        dify_catalogue.mark_stale()
+        await stats_service.invalidate_dify()
+        return app_info
 
     except HTTPException as e:
         raise e
+    except httpx.RequestError as e:
+        logger.error("创建应用时 Dify 不可用: %s", e)
+        raise gateway_error(e, f"Dify 暂不可用: {str(e)}")
     except Exception as e:
-        logger.error(f"创建应用未知错误: {str(e)}")
+        logger.error("创建应用未知错误: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"系统内部错误: {str(e)}"
@@ -1,12 +1,15 @@
+import base64
+import hashlib
+import hmac
+import logging
 import time
 import uuid
-from typing import Dict
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.responses import RedirectResponse, JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from authlib.jose import jwt, JsonWebKey
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 # from authlib.oauth2.rfc6749 import Grants  # Removed unused import causing error
 from authlib.integrations.starlette_client import OAuth
 
@@ -14,40 +17,51 @@ from app.database import get_db
 from app.config import settings
 from app.schemas.user import User
 from app.models import User as UserModel # Import UserModel
-from app.api.auth import get_current_user, create_access_token, verify_token_data
+from app.api.auth import get_current_user, create_access_token, verify_token_data, resolve_user
+from app.http_cache import StaticDocument
+from app.services.oidc_codes import auth_codes
+from app.services.oidc_keys import oidc_keys
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# 简单的内存 Code 存储 (生产环境请使用 Redis)
-AUTH_CODES: Dict[str, dict] = {}
+PKCE_METHODS = ("plain", "S256")
+
+
+def verify_pkce(code_verifier: str, code_challenge: str, method: str) -> bool:
+    """RFC 7636：S256 为 BASE64URL(SHA256(verifier)) 去掉填充"""
+    if method == "S256":
+        digest = hashlib.sha256(code_verifier.encode("ascii")).digest()
+        code_verifier = base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+    return hmac.compare_digest(code_verifier, code_challenge)
+
+# Discovery 与 JWKS 在启动时构建并序列化一次，Dify 轮询时只比较 ETag
+# issuer / token / userinfo / jwks 供 Dify 后端 (容器内) 访问，authorize 供用户浏览器访问
+OPENID_CONFIGURATION = StaticDocument({
+    "issuer": settings.oidc_issuer,
+    "authorization_endpoint": f"{settings.oidc_public_url}/api/oauth/authorize",
+    "token_endpoint": f"{settings.oidc_issuer}/api/oauth/token",
+    "userinfo_endpoint": f"{settings.oidc_issuer}/api/oauth/userinfo",
+    "jwks_uri": f"{settings.oidc_issuer}/api/oauth/jwks",
+    "response_types_supported": ["code"],
+    "subject_types_supported": ["public"],
+    "id_token_signing_alg_values_supported": oidc_keys.algorithms,
+    "code_challenge_methods_supported": list(PKCE_METHODS),
+}, max_age=settings.oidc_discovery_max_age)
+
+JWKS = StaticDocument(oidc_keys.jwks(), max_age=settings.oidc_jwks_max_age)
 
-# 简单的 OIDC 配置
-OIDC_ISSUER = f"{settings.dify_api_url.replace('/v1', '')}"  # e.g., http://localhost:8000
-JWK_KEY = {"kty": "oct", "k": settings.secret_key[:32], "alg": "HS256", "kid": "1"}
 
 @router.get("/.well-known/openid-configuration")
-async def openid_configuration():
-    print("SSO: Dify requested openid-configuration")
-    # 容器内访问地址 (Dify 后端使用)
-    internal_base_url = "http://host.docker.internal:8800"
-    # 浏览器访问地址 (用户浏览器使用)
-    external_base_url = "http://localhost:8800"
-    
-    return {
-        "issuer": internal_base_url,
-        "authorization_endpoint": f"{external_base_url}/api/oauth/authorize",
-        "token_endpoint": f"{internal_base_url}/api/oauth/token",
-        "userinfo_endpoint": f"{internal_base_url}/api/oauth/userinfo",
-        "jwks_uri": f"{internal_base_url}/api/oauth/jwks",
-        "response_types_supported": ["code"],
-        "subject_types_supported": ["public"],
-        "id_token_signing_alg_values_supported": ["HS256"],
-    }
+async def openid_configuration(request: Request):
+    return OPENID_CONFIGURATION.response(request)
+
 
 @router.get("/oauth/jwks")
-async def jwks():
-    print("SSO: JWKS requested")
-    return {"keys": [JWK_KEY]}
+async def jwks(request: Request):
+    return JWKS.response(request)
+
 
 @router.get("/oauth/authorize")
 async def authorize(
@@ -57,9 +71,14 @@ async def authorize(
     redirect_uri: str,
     scope: str = "openid profile email",
     state: str = None,
-    db: Session = Depends(get_db)
+    nonce: str = None,
+    code_challenge: str = None,
+    code_challenge_method: str = "plain",
+    db: AsyncSession = Depends(get_db)
 ):
-    print(f"SSO Authorize Request: redirect_uri={redirect_uri}")
+    logger.debug("SSO authorize: client_id=%s redirect_uri=%s", client_id, redirect_uri)
+    if code_challenge and code_challenge_method not in PKCE_METHODS:
+        raise HTTPException(status_code=400, detail="Unsupported code_challenge_method")
     # 1. 尝试从 Cookie 中获取 access_token
     token = request.cookies.get("access_token")
     user = None
@@ -77,14 +96,13 @@ async def authorize(
             payload = jose_jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
             email = payload.get("sub")
             if email:
-                user = db.query(UserModel).filter(UserModel.email == email).first()
+                user = await resolve_user(email, db)
         except Exception as e:
-            print(f"Token validation failed: {e}")
-            pass
+            logger.info("SSO authorize: token validation failed: %s", e)
 
     # 2. 如果用户未登录，重定向到前端登录页
     if not user:
-        print("SSO: User not logged in, redirecting to login page")
+        logger.debug("SSO authorize: user not logged in, redirecting to login page")
         # 登录成功后，前端应该重定向回这个 URL (request.url)
         # 关键修复：确保 redirect 参数被 URL 编码，否则可能被前端截断
         import urllib.parse
@@ -97,20 +115,23 @@ async def authorize(
     # 3. 用户已登录，生成授权码
     auth_code = f"code_{uuid.uuid4()}"
     
-    # 存入内存 (有效期 10 分钟)
-    AUTH_CODES[auth_code] = {
+    # 存入授权码存储 (有效期 settings.oidc_code_ttl，只能兑换一次)
+    await auth_codes.save(auth_code, {
         "user_id": user.id,
-        "expires_at": time.time() + 600,
+        "client_id": client_id,
+        "redirect_uri": redirect_uri,
         "scope": scope,
-        "nonce": None # 如果 URL 中有 nonce 也应该存下来
-    }
+        "nonce": nonce,
+        "code_challenge": code_challenge,
+        "code_challenge_method": code_challenge_method if code_challenge else None
+    })
     
     # 4. 重定向回 Dify (带上 code 和 state)
     redirect_to = f"{redirect_uri}?code={auth_code}"
     if state:
         redirect_to += f"&state={state}"
         
-    print(f"SSO: Redirecting back to Dify: {redirect_to}")
+    logger.debug("SSO authorize: redirecting back to %s for user %s", redirect_uri, user.id)
     return RedirectResponse(redirect_to)
 
 from fastapi.responses import RedirectResponse, JSONResponse
@@ -118,7 +139,7 @@ from fastapi.responses import RedirectResponse, JSONResponse
 @router.post("/oauth/token")
 async def token(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # 获取表单数据
     form = await request.form()
@@ -127,35 +148,39 @@ async def token(
     client_id = form.get("client_id")
     client_secret = form.get("client_secret")
     redirect_uri = form.get("redirect_uri")
+    code_verifier = form.get("code_verifier")
 
     if grant_type != "authorization_code":
         raise HTTPException(status_code=400, detail="Invalid grant_type")
         
-    print(f"SSO: Token exchange - Code: {code}")
-    # 验证 Code
-    code_data = AUTH_CODES.get(code)
+    # 验证并消费 Code (原子取出，只能用一次；过期由存储的 TTL 负责)
+    code_data = await auth_codes.take(code) if code else None
     if not code_data:
-        print(f"SSO Token: Invalid code {code}")
+        logger.info("SSO token: invalid or expired code %s", (code or "")[:12])
         raise HTTPException(status_code=400, detail="Invalid or expired code")
-        
-    if code_data["expires_at"] < time.time():
-        del AUTH_CODES[code]
-        raise HTTPException(status_code=400, detail="Code expired")
-        
+
+    if client_id and code_data.get("client_id") and client_id != code_data["client_id"]:
+        raise HTTPException(status_code=400, detail="client_id mismatch")
+    if redirect_uri and redirect_uri != code_data.get("redirect_uri"):
+        raise HTTPException(status_code=400, detail="redirect_uri mismatch")
+
+    if code_data.get("code_challenge"):
+        if not code_verifier or not verify_pkce(
+            code_verifier, code_data["code_challenge"], code_data["code_challenge_method"]
+        ):
+            raise HTTPException(status_code=400, detail="Invalid code_verifier")
+
     # 获取用户
     user_id = code_data["user_id"]
-    user = db.query(UserModel).filter(UserModel.id == user_id).first()
+    user = await db.get(UserModel, user_id)
     if not user:
         raise HTTPException(status_code=400, detail="User not found")
-        
-    # 消费 Code (只能用一次)
-    del AUTH_CODES[code]
     
     now = int(time.time())
     
     id_token_payload = {
         # 必须与 Dify 配置的 OIDC_ISSUER 严格一致
-        "iss": "http://host.docker.internal:8800",
+        "iss": settings.oidc_issuer,
         "sub": str(user.id),
         "aud": client_id,
         "exp": now + 3600,
@@ -164,15 +189,17 @@ async def token(
         "email": user.email,
         "preferred_username": user.username
     }
+    if code_data.get("nonce"):
+        id_token_payload["nonce"] = code_data["nonce"]
     
-    id_token = jwt.encode({"alg": "HS256", "kid": "1"}, id_token_payload, JWK_KEY)
+    id_token = oidc_keys.sign(id_token_payload)
     
-    print("SSO: Token generated successfully")
+    logger.debug("SSO token: issued id_token for user %s (kid=%s)", user.id, oidc_keys.active.kid)
     return {
         "access_token": create_access_token({"sub": user.email}),
         "token_type": "Bearer",
         "expires_in": 3600,
-        "id_token": id_token.decode('utf-8')
+        "id_token": id_token
     }
 
 @router.get("/oauth/userinfo")
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.auth import get_current_user
+from app.database import get_db
+from app.schemas.product import ProductIngestRequest, ProductIngestResponse
+from app.schemas.user import User
+from app.services.product_ingest import ingest_products
+
+router = APIRouter()
+
+
+@router.post(
+    "/ingest",
+    response_model=ProductIngestResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": ProductIngestRequest.model_json_schema()}},
+        }
+    },
+)
+async def ingest(
+    request: Request,
+    run: bool = Query(False, description="为新增或内容变化的商品创建工作流任务"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    批量写入采集的商品 (按 ASIN + 站点去重)；内容未变化的商品不写库、不触发运行，
+    items 只列出新增与变化的商品 (以及 run=true 时重新入队的商品)
+    """
+    # 直接由 pydantic 解析 JSON 字节，省去 json.loads 生成中间对象再逐项校验的一遍
+    try:
+        batch = ProductIngestRequest.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+    return await ingest_products(db, batch.items, current_user.id, run=run)
@@ -1,59 +1,171 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-import httpx
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer_group
+from starlette.background import BackgroundTask
+from typing import List, Optional, Tuple, Union
 from datetime import datetime
 
 from app.database import get_db
 from app.models import User, WorkflowHistory
-from app.schemas.workflow import WorkflowCreate, WorkflowResponse, WorkflowRunResponse
+from app.schemas.workflow import (
+    WorkflowCreate,
+    WorkflowSave,
+    WorkflowResponse,
+    WorkflowRunResponse,
+    WorkflowHistoryPage,
+    JobResponse,
+)
 from app.api.auth import get_current_user
 from app.config import settings
-import redis
-import json
+from app.services import job_queue
+from app.services.dify_limiter import dify_limiter
+from app.services.dify_resilience import gateway_error
+from app.services.dify_runs import DifyRunError, extract_output_text, run_workflow_blocking
+from app.services.preprocess import input_preprocessor
+from app.services.rate_limit import rate_limiter
+from app.services.result_cache import BYPASS_HEADER, default_app_id, default_app_version, is_bypass, result_cache
+from app.services.workflow_history import fetch_history_page
+from app.services.dify_stream import (
+    SSE_HEADERS,
+    WorkflowStreamResult,
+    record_stream_run,
+    relay_workflow_stream,
+    save_stream_history,
+)
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-redis_client = redis.from_url(settings.redis_url)
+
+# 旧版 /history 返回的固定条数，已有调用方依赖该行为
+LEGACY_HISTORY_LIMIT = 50
+
+
+async def call_dify_api(input_data: str, user_id: int, bypass_cache: bool = False) -> Tuple[str, str]:
+    """
+    调用Dify API执行工作流，返回 (输出文本, 结果缓存状态)；
+    失败时抛出 DifyRunError (超时、熔断等原始异常在 __cause__ 中)，不再把错误文本当作输出返回
+    """
+    # 缓存键取原始输入：命中时不做预处理，预处理逻辑变化也不影响已缓存的结果
+    inputs = {"query": input_data}
+
+    async def run():
+        query = await input_preprocessor.compact(input_data)
+        async with dify_limiter.slot():
+            return await run_workflow_blocking({"query": query}, user_id=user_id)
+
+    data, cache_state = await result_cache.get_or_run(
+        default_app_id(),
+        await default_app_version(),
+        inputs,
+        run,
+        bypass=bypass_cache,
+        # 与 /dify/apps/{app_id}/run 一致：stopped / partial-succeeded 等结果不缓存
+        should_cache=lambda data: data.get("status") == "succeeded"
+    )
+    return extract_output_text(data), cache_state
+
+
+def _job_response(job: WorkflowHistory) -> JobResponse:
+    return JobResponse(
+        job_id=job.id,
+        status=job.status,
+        attempts=job.attempts or 0,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at
+    )
+
+
+async def _find_by_idempotency_key(db: AsyncSession, user_id: int, key: str) -> Optional[WorkflowHistory]:
+    return await db.scalar(
+        select(WorkflowHistory).where(
+            WorkflowHistory.user_id == user_id,
+            WorkflowHistory.idempotency_key == key
+        )
+    )
 
 
-async def call_dify_api(input_data: str) -> str:
-    """调用Dify API执行工作流"""
+async def enqueue_workflow_job(
+    workflow: WorkflowCreate,
+    user_id: int,
+    idempotency_key: Optional[str],
+    db: AsyncSession
+) -> JobResponse:
+    """创建 queued 状态的历史记录并投递到任务队列；相同幂等键返回已有任务"""
+    if idempotency_key:
+        existing = await _find_by_idempotency_key(db, user_id, idempotency_key)
+        if existing:
+            return _job_response(existing)
+
+    job = WorkflowHistory(
+        user_id=user_id,
+        name=workflow.name,
+        input_data=workflow.input_data,
+        status="queued",
+        idempotency_key=idempotency_key
+    )
+    db.add(job)
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{settings.dify_api_url}/workflows/run",
-                headers={
-                    "Authorization": f"Bearer {settings.dify_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "inputs": {
-                        "query": input_data
-                    },
-                    "response_mode": "blocking",
-                    "user": "amz-user"
-                }
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("data", {}).get("outputs", {}).get("text", "工作流执行成功")
-            else:
-                return f"Dify API返回错误: {response.status_code}"
+        await db.commit()
+    except IntegrityError:
+        # 并发请求使用了同一个幂等键
+        await db.rollback()
+        return _job_response(await _find_by_idempotency_key(db, user_id, idempotency_key))
+    await db.refresh(job)
+
+    try:
+        await job_queue.enqueue(job.id)
     except Exception as e:
-        return f"调用Dify API时发生错误: {str(e)}"
+        logger.error("任务 %s 入队失败: %s", job.id, e)
+        job.status = "failed"
+        job.error = f"任务入队失败: {str(e)}"
+        await db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="任务队列不可用，请稍后重试"
+        )
+    return _job_response(job)
 
 
-@router.post("/run", response_model=WorkflowRunResponse)
+@router.post("/run", response_model=Union[WorkflowRunResponse, JobResponse])
 async def run_workflow(
     workflow: WorkflowCreate,
+    response: Response,
+    run_async: bool = Query(False, alias="async"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    result_cache_mode: Optional[str] = Header(None, alias=BYPASS_HEADER),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """执行工作流"""
+    """执行工作流；async=true 时入队并立即返回任务 ID (202)"""
+    if run_async:
+        response.status_code = status.HTTP_202_ACCEPTED
+        return await enqueue_workflow_job(workflow, current_user.id, idempotency_key, db)
+
+    await rate_limiter.check(current_user.id, default_app_id())
     try:
-        output_data = await call_dify_api(workflow.input_data)
-        
+        output_data, cache_state = await call_dify_api(workflow.input_data, current_user.id, is_bypass(result_cache_mode))
+    except DifyRunError as e:
+        # 失败同样记入历史，状态为 failed
+        db.add(WorkflowHistory(
+            user_id=current_user.id,
+            name=workflow.name,
+            input_data=workflow.input_data,
+            status="failed",
+            error=str(e)
+        ))
+        await db.commit()
+        raise gateway_error(e, f"工作流执行失败: {str(e)}")
+
+    try:
+        response.headers[BYPASS_HEADER] = cache_state
+
         workflow_history = WorkflowHistory(
             user_id=current_user.id,
             name=workflow.name,
@@ -63,8 +175,8 @@ async def run_workflow(
         )
         
         db.add(workflow_history)
-        db.commit()
-        db.refresh(workflow_history)
+        await db.commit()
+        await db.refresh(workflow_history)
         
         return WorkflowRunResponse(
             output_data=output_data,
@@ -77,11 +189,94 @@ async def run_workflow(
         )
 
 
+@router.post("/run/stream")
+async def run_workflow_stream(
+    workflow: WorkflowCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """流式执行工作流 (SSE)，结束后写入历史记录"""
+    user_id = current_user.id
+    # 在返回响应前完成准入，超限时客户端收到 429/503 而不是一个报错的事件流
+    await rate_limiter.check(user_id, default_app_id())
+    query = await input_preprocessor.compact(workflow.input_data)
+    slot = await dify_limiter.acquire()
+
+    async def event_source():
+        result = WorkflowStreamResult()
+        try:
+            async for chunk in relay_workflow_stream(
+                settings.dify_api_key, {"query": query}, "amz-user", result
+            ):
+                yield chunk
+        finally:
+            slot.release()
+            record_stream_run(default_app_id(), user_id, result)
+            await save_stream_history(user_id, workflow.name, workflow.input_data, result)
+
+    # 客户端在生成器开始前断开时 finally 不会执行，由后台任务兜底归还槽位
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+        background=BackgroundTask(slot.release)
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job_status(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """查询后台任务状态"""
+    job = await db.scalar(
+        select(WorkflowHistory).where(
+            WorkflowHistory.id == job_id,
+            WorkflowHistory.user_id == current_user.id
+        )
+    )
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+    return _job_response(job)
+
+
+@router.get("/jobs/{job_id}/result", response_model=WorkflowRunResponse)
+async def get_job_result(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取后台任务结果，任务未结束时返回 409"""
+    job = await db.scalar(
+        select(WorkflowHistory).where(
+            WorkflowHistory.id == job_id,
+            WorkflowHistory.user_id == current_user.id
+        ).options(undefer_group("payload"))
+    )
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+    if job.status in ("queued", "running"):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"任务尚未完成，当前状态: {job.status}"
+        )
+    return WorkflowRunResponse(
+        output_data=job.output_data if job.status == "completed" else (job.error or ""),
+        status=job.status
+    )
+
+
 @router.post("/save", response_model=WorkflowResponse)
 async def save_workflow(
-    workflow: WorkflowCreate,
+    workflow: WorkflowSave,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """保存工作流结果"""
     try:
@@ -94,8 +289,9 @@ async def save_workflow(
         )
         
         db.add(workflow_history)
-        db.commit()
-        db.refresh(workflow_history)
+        await db.commit()
+        # 只刷新服务端默认值，避免过期已在内存中的大字段
+        await db.refresh(workflow_history, attribute_names=["created_at"])
         
         return workflow_history
     except Exception as e:
@@ -107,16 +303,59 @@ async def save_workflow(
 
 @router.get("/history", response_model=List[WorkflowResponse])
 async def get_workflow_history(
+    status_filter: Optional[str] = Query(None, alias="status"),
+    name: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """获取工作流历史记录"""
+    """获取工作流历史记录 (旧版接口：最近 50 条，含完整输入输出；翻页请用 /v2/history)"""
     try:
-        workflows = db.query(WorkflowHistory).filter(
-            WorkflowHistory.user_id == current_user.id
-        ).order_by(WorkflowHistory.created_at.desc()).limit(50).all()
-        
-        return workflows
+        items, _ = await fetch_history_page(
+            db,
+            limit=LEGACY_HISTORY_LIMIT,
+            user_id=current_user.id,
+            status=status_filter,
+            name=name,
+            created_from=created_from,
+            created_to=created_to,
+            with_payload=True
+        )
+        return items
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取历史记录失败: {str(e)}"
+        )
+
+
+@router.get("/v2/history", response_model=WorkflowHistoryPage)
+async def get_workflow_history_page(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    status_filter: Optional[str] = Query(None, alias="status"),
+    name: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取工作流历史记录 (游标分页，按创建时间倒序)"""
+    try:
+        items, next_cursor = await fetch_history_page(
+            db,
+            limit=min(limit or settings.history_page_size, settings.history_max_page_size),
+            user_id=current_user.id,
+            cursor=cursor,
+            status=status_filter,
+            name=name,
+            created_from=created_from,
+            created_to=created_to
+        )
+        return WorkflowHistoryPage(items=items, next_cursor=next_cursor)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -128,13 +367,15 @@ async def get_workflow_history(
 async def get_workflow(
     workflow_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """获取特定工作流"""
-    workflow = db.query(WorkflowHistory).filter(
-        WorkflowHistory.id == workflow_id,
-        WorkflowHistory.user_id == current_user.id
-    ).first()
+    """获取特定工作流 (含完整输入输出)"""
+    workflow = await db.scalar(
+        select(WorkflowHistory).where(
+            WorkflowHistory.id == workflow_id,
+            WorkflowHistory.user_id == current_user.id
+        ).options(undefer_group("payload"))
+    )
     
     if not workflow:
         raise HTTPException(
@@ -149,13 +390,15 @@ async def get_workflow(
 async def delete_workflow(
     workflow_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """删除工作流"""
-    workflow = db.query(WorkflowHistory).filter(
-        WorkflowHistory.id == workflow_id,
-        WorkflowHistory.user_id == current_user.id
-    ).first()
+    workflow = await db.scalar(
+        select(WorkflowHistory).where(
+            WorkflowHistory.id == workflow_id,
+            WorkflowHistory.user_id == current_user.id
+        )
+    )
     
     if not workflow:
         raise HTTPException(
@@ -163,7 +406,7 @@ async def delete_workflow(
             detail="工作流不存在"
         )
     
-    db.delete(workflow)
-    db.commit()
+    await db.delete(workflow)
+    await db.commit()
     
     return {"message": "工作流已删除"}
@@ -0,0 +1,150 @@
+"""
+缓存基础设施
+
+- TTLCache: 进程内带过期时间的 LRU 缓存
+- redis_client: 共享的异步 Redis 客户端 (settings.redis_url)
+- release_lock: 只释放自己持有的 SET NX 锁 (比较令牌后删除)
+- invalidation_bus: 基于 Redis pub/sub 的跨进程缓存失效广播
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import redis.asyncio as aioredis
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+redis_client = aioredis.from_url(settings.redis_url)
+
+INVALIDATION_CHANNEL = "amz:cache:invalidate"
+
+# 锁已过期并被其他进程重新获取时，值不再是自己的令牌，不能删除
+_RELEASE_LOCK = redis_client.register_script("""
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+""")
+
+
+async def release_lock(key: str, token: str) -> bool:
+    return bool(await _RELEASE_LOCK(keys=[key], args=[token]))
+
+
+class TTLCache:
+    """进程内 LRU 缓存，超过 maxsize 淘汰最久未使用的条目，条目过期后视为不存在"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def take(self, key: Hashable) -> Optional[Any]:
+        """读取并删除 (单次使用的条目)"""
+        value = self.get(key)
+        self._data.pop(key, None)
+        return value
+
+    def sweep(self) -> int:
+        """清理所有已过期条目，返回清理数量"""
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._data.items() if expires_at < now]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class InvalidationBus:
+    """
+    跨 worker 的缓存失效通知
+
+    各模块通过 subscribe(kind, handler) 注册本地失效回调，
+    publish(kind, key) 会广播到所有进程 (包括自己)。
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable[[str], None]]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, kind: str, handler: Callable[[str], None]):
+        self._handlers.setdefault(kind, []).append(handler)
+
+    def _dispatch(self, kind: str, key: str):
+        for handler in self._handlers.get(kind, []):
+            try:
+                handler(key)
+            except Exception as e:
+                logger.error("缓存失效回调执行失败 (%s): %s", kind, e)
+
+    async def publish(self, kind: str, key: str):
+        # 先清理本进程，Redis 不可用时至少保证当前 worker 一致
+        self._dispatch(kind, key)
+        try:
+            await redis_client.publish(INVALIDATION_CHANNEL, json.dumps({"kind": kind, "key": key}))
+        except Exception as e:
+            logger.warning("广播缓存失效消息失败: %s", e)
+
+    async def _listen(self):
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    data = json.loads(message["data"])
+                    self._dispatch(data["kind"], data["key"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("缓存失效订阅中断，1 秒后重连: %s", e)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+invalidation_bus = InvalidationBus()
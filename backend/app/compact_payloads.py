@@ -0,0 +1,104 @@
+"""
+工作流大字段后台压缩迁移
+
+把 workflow_history 旧版明文列 (input_data / output_data) 分批压缩进 *_blob 列
+(预览和长度已由迁移补齐)。每批独立提交，使用 FOR UPDATE SKIP LOCKED，
+可与线上写入并行、可多实例并行、中断后重跑即从剩余行继续。
+一轮扫描会跳过被锁定的行，因此重复扫描直到某一轮没有可处理的行，最后报告仍未处理的行数。
+
+用法 (在 backend 目录下，先执行 alembic upgrade head):
+    python -m app.compact_payloads --batch 500 --sleep 0.1
+    python -m app.compact_payloads --restore    # 降级前解压回明文列
+"""
+import argparse
+import logging
+import time
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import undefer_group
+
+from app.config import settings
+from app.database import SessionLocal
+from app.logging_config import setup_logging
+from app.models import WorkflowHistory
+
+logger = logging.getLogger("app.compact_payloads")
+
+
+def _pending(restore: bool):
+    if restore:
+        return or_(
+            (WorkflowHistory.legacy_input.is_(None)) & (WorkflowHistory.input_blob.isnot(None)),
+            (WorkflowHistory.legacy_output.is_(None)) & (WorkflowHistory.output_blob.isnot(None)),
+        )
+    return or_(WorkflowHistory.legacy_input.isnot(None), WorkflowHistory.legacy_output.isnot(None))
+
+
+def _process(row: WorkflowHistory, restore: bool):
+    if restore:
+        row.legacy_input = row.input_data
+        row.legacy_output = row.output_data
+        row.input_blob = row.output_blob = None
+        return
+    # setter 会压缩正文、写入预览并清空明文列
+    if row.legacy_input is not None:
+        row.input_data = row.legacy_input
+    if row.legacy_output is not None:
+        row.output_data = row.legacy_output
+
+
+def _run_pass(batch: int, sleep: float, restore: bool) -> int:
+    """按 id 顺序扫描一轮，被其他事务锁定的行本轮跳过"""
+    total = 0
+    last_id = 0
+    while True:
+        with SessionLocal() as db:
+            rows = db.scalars(
+                select(WorkflowHistory)
+                .where(WorkflowHistory.id > last_id, _pending(restore))
+                .order_by(WorkflowHistory.id)
+                .limit(batch)
+                .options(undefer_group("payload"))
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not rows:
+                break
+            for row in rows:
+                _process(row, restore)
+            last_id = rows[-1].id
+            db.commit()
+        total += len(rows)
+        logger.info("已处理 %s 行 (id <= %s)", total, last_id)
+        if sleep:
+            time.sleep(sleep)
+    return total
+
+
+def run(batch: int, sleep: float, restore: bool = False) -> int:
+    total = 0
+    while True:
+        processed = _run_pass(batch, sleep, restore)
+        total += processed
+        if not processed:
+            break
+    with SessionLocal() as db:
+        remaining = db.scalar(select(func.count()).select_from(WorkflowHistory).where(_pending(restore)))
+    if remaining:
+        logger.warning("仍有 %s 行被其他事务锁定未处理，请稍后重跑", remaining)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="压缩 workflow_history 旧版明文大字段")
+    parser.add_argument("--batch", type=int, default=settings.payload_compaction_batch)
+    parser.add_argument("--sleep", type=float, default=0.0, help="每批之间休眠秒数，降低对线上库的压力")
+    parser.add_argument("--restore", action="store_true", help="反向操作：解压回明文列 (降级前使用)")
+    args = parser.parse_args()
+
+    setup_logging()
+    total = run(args.batch, args.sleep, args.restore)
+    logger.info("完成，共处理 %s 行", total)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,54 @@
+import logging
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from app.instrumentation import instrument_engine
 
+# 同步引擎：仅供 Alembic 迁移与离线脚本使用，请求处理一律走异步引擎
 engine = create_engine(settings.database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def to_async_url(url: str) -> str:
+    """将 postgresql:// 或 postgresql+psycopg2:// 转为 asyncpg 驱动的 URL"""
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+async_engine = create_async_engine(
+    to_async_url(settings.database_url),
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_recycle=settings.db_pool_recycle,
+    pool_timeout=settings.db_pool_timeout,
+    pool_pre_ping=True,
+)
+instrument_engine("app", async_engine)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+# Dify 数据库连接 (仅用于读取列表，保持高性能)
+try:
+    dify_engine = create_async_engine(
+        to_async_url(settings.dify_db_url),
+        pool_size=settings.dify_db_pool_size,
+        max_overflow=settings.dify_db_max_overflow,
+        pool_recycle=settings.db_pool_recycle,
+        pool_timeout=settings.db_pool_timeout,
+        pool_pre_ping=True,
+    )
+    instrument_engine("dify", dify_engine)
+except Exception as e:
+    logging.getLogger(__name__).error("创建 Dify 数据库连接失败: %s", e)
+    dify_engine = None
+
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
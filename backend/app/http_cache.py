@@ -0,0 +1,30 @@
+"""
+HTTP 条件请求工具 (ETag / If-None-Match / Cache-Control)
+"""
+import hashlib
+import json
+from typing import Any
+
+from fastapi import Request, Response, status
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates or "*" in candidates
+
+
+class StaticDocument:
+    """预先序列化的 JSON 文档，携带强 ETag；请求时只比较 ETag 并返回同一份 bytes"""
+
+    def __init__(self, payload: Any, max_age: int):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+        self.headers = {"ETag": self.etag, "Cache-Control": f"public, max-age={max_age}"}
+
+    def response(self, request: Request) -> Response:
+        if etag_matches(request, self.etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=self.headers)
+        return Response(content=self.body, media_type="application/json", headers=self.headers)
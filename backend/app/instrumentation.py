@@ -0,0 +1,65 @@
+"""
+API 与数据库的耗时埋点 (指标定义见 app.metrics)
+
+- MetricsMiddleware: 纯 ASGI 中间件，按路由模板记录请求耗时
+- instrument_engine: 通过 SQLAlchemy 事件记录 SQL 耗时并注册连接池 gauge
+"""
+import time
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.metrics import DB_POOL_CONNECTIONS, DB_QUERY_DURATION, HTTP_REQUEST_DURATION
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # 路由匹配后 FastAPI 会把 APIRoute 写入 scope；用模板而不是原始路径，避免标签基数爆炸
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status_code),
+            ).observe(time.perf_counter() - started)
+
+
+def instrument_engine(name: str, engine: AsyncEngine):
+    sync_engine = engine.sync_engine
+    histogram = DB_QUERY_DURATION.labels(engine=name)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        histogram.observe(time.perf_counter() - context._query_started)
+
+    # dispose() 会替换连接池，因此每次采集时重新读取 engine.pool
+    states = {
+        "checked_out": lambda: engine.pool.checkedout(),
+        "checked_in": lambda: engine.pool.checkedin(),
+        "overflow": lambda: max(engine.pool.overflow(), 0),
+        "size": lambda: engine.pool.size(),
+    }
+    for state, read in states.items():
+        DB_POOL_CONNECTIONS.labels(engine=name, state=state).set_function(read)
@@ -1,7 +1,24 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import auth, workflows, dify, admin, oauth
-from app.database import engine, Base
+from app.logging_config import setup_logging
+
+# 先于其他模块配置日志，导入期间的日志 (如 OIDC 密钥加载) 也走统一管道
+setup_logging()
+
+from app.api import auth, workflows, dify, admin, oauth, products
+from app.cache import invalidation_bus, redis_client
+from app.database import async_engine, dify_engine, Base
+from app.metrics import CONTENT_TYPE_LATEST, render_metrics
+from app.instrumentation import MetricsMiddleware
+from app.request_context import DeadlineMiddleware, RequestIdMiddleware
+from app.services.api_keys import api_key_registry
+from app.services.dify_client import dify_client
+from app.services.dify_console import console_tokens
+from app.services.passwords import password_hasher
+from app.services.preprocess import input_preprocessor
+from app.services.run_events import run_events
+from app.services.run_rollups import run_rollups
+from app.tracing import setup_tracing, shutdown_tracing
 
 app = FastAPI(title="AMZ Auto AI API", version="1.0.0")
 
@@ -12,19 +29,49 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "X-Result-Cache"],
 )
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(RequestIdMiddleware)
+app.add_middleware(MetricsMiddleware)
+# 最后挂载，使追踪中间件位于最外层
+setup_tracing(app)
 
 app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
 app.include_router(workflows.router, prefix="/api/workflows", tags=["workflows"])
 app.include_router(dify.router, prefix="/api", tags=["dify"])
 app.include_router(admin.router, prefix="/api", tags=["admin"])
 app.include_router(oauth.router, prefix="/api", tags=["oauth"])
+app.include_router(products.router, prefix="/api/products", tags=["products"])
 
 
 
 @app.on_event("startup")
 async def startup_event():
-    Base.metadata.create_all(bind=engine)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await dify_client.start()
+    await invalidation_bus.start()
+    await api_key_registry.warm()
+    await input_preprocessor.warm()
+    await run_events.start()
+    await run_rollups.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await run_rollups.stop()
+    await run_events.stop()
+    await invalidation_bus.stop()
+    await redis_client.aclose()
+    await console_tokens.stop()
+    await dify_client.aclose()
+    password_hasher.shutdown()
+    input_preprocessor.shutdown()
+    await async_engine.dispose()
+    if dify_engine is not None:
+        await dify_engine.dispose()
+    shutdown_tracing()
 
 
 @app.get("/")
@@ -33,16 +80,19 @@ async def root():
 
 
 from sqlalchemy import text
-from app.database import engine, Base, SessionLocal
 
 # ... imports ...
 
 @app.get("/health")
 async def health_check():
     try:
-        db = SessionLocal()
-        db.execute(text("SELECT 1"))
-        db.close()
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
         return {"status": "healthy", "database": "connected"}
     except Exception as e:
         return {"status": "unhealthy", "database": str(e)}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,139 @@
+"""
+Prometheus 指标注册表
+
+所有模块的指标统一在这里定义，避免多处重复注册同名指标。
+"""
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Dify HTTP 连接池
+DIFY_POOL_CONNECTIONS = Gauge(
+    "dify_http_pool_connections",
+    "Dify HTTP 连接池中的连接数",
+    ["api", "state"],
+)
+DIFY_POOL_MAX_CONNECTIONS = Gauge(
+    "dify_http_pool_max_connections",
+    "Dify HTTP 连接池允许的最大连接数",
+    ["api"],
+)
+
+
+def render_metrics() -> bytes:
+    """导出 Prometheus 文本格式的指标"""
+    return generate_latest()
+
+
+# 用户解析缓存
+USER_CACHE_REQUESTS = Counter(
+    "user_cache_requests_total",
+    "get_current_user 缓存查询次数",
+    ["tier", "result"],
+)
+
+# Dify 应用 API Key 注册表
+API_KEY_LOOKUPS = Counter(
+    "dify_api_key_lookups_total",
+    "按 app_id 解析 Dify API Key 的次数 (hit / negative / miss，miss 会查询数据库)",
+    ["result"],
+)
+
+# Dify 准入控制 (并发槽位与拒绝原因)
+DIFY_INFLIGHT = Gauge(
+    "dify_inflight_requests",
+    "正在进行的 Dify 调用数",
+    ["priority"],
+)
+DIFY_QUEUED = Gauge(
+    "dify_queued_requests",
+    "等待 Dify 并发槽位的请求数",
+    ["priority"],
+)
+ADMISSION_REJECTED = Counter(
+    "dify_admission_rejected_total",
+    "被准入控制拒绝的请求数 (rate_limited=429, queue_full / queue_timeout=503)",
+    ["reason"],
+)
+
+# Dify 熔断器与重试
+DIFY_CIRCUIT_STATE = Gauge(
+    "dify_circuit_state",
+    "Dify 熔断器状态 (0=closed, 1=half_open, 2=open)",
+    ["api"],
+)
+DIFY_RETRIES = Counter(
+    "dify_retries_total",
+    "Dify 调用重试次数",
+    ["api"],
+)
+
+# 密码哈希线程池 (执行中 + 排队中)
+PASSWORD_HASH_INFLIGHT = Gauge(
+    "password_hash_inflight",
+    "密码哈希线程池中执行与排队的任务数",
+)
+
+# Dify 运行结果缓存 (命中率 = hit / (hit + miss))
+RESULT_CACHE_REQUESTS = Counter(
+    "dify_result_cache_requests_total",
+    "Dify 运行结果缓存查询次数 (hit / miss / coalesced / bypass)",
+    ["result"],
+)
+
+# 运行事件 (缓冲已满或写库失败时丢弃)
+RUN_EVENTS_DROPPED = Counter(
+    "workflow_run_events_dropped_total",
+    "未能写入 workflow_run_events 的运行事件数",
+)
+
+# 输入预处理 (HTML 压缩)：stage 为 input / output，两者之比即压缩率
+PREPROCESS_CHARS = Counter(
+    "input_preprocess_chars_total",
+    "预处理前后的输入字符数",
+    ["stage"],
+)
+PREPROCESS_DURATION = Histogram(
+    "input_preprocess_duration_seconds",
+    "HTML 输入压缩耗时 (含进程池排队)",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+PREPROCESS_SKIPPED = Counter(
+    "input_preprocess_skipped_total",
+    "未能压缩、原样发送的 HTML 输入数 (saturated / timeout / broken / error / empty)",
+    ["reason"],
+)
+
+# 请求耗时 (route 为路由模板，未匹配的请求统一记为 unmatched)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "API 请求处理耗时 (含流式响应的完整传输时间)",
+    ["method", "route", "status"],
+)
+
+# 数据库
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "单条 SQL 执行耗时",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "SQLAlchemy 连接池状态 (checked_out / checked_in / overflow / size)",
+    ["engine", "state"],
+)
+
+# Dify HTTP 调用：connect (新建连接，含 TLS)、ttfb (发出请求到收到响应头)、total (到响应关闭)
+DIFY_REQUEST_DURATION = Histogram(
+    "dify_http_request_duration_seconds",
+    "Dify HTTP 调用各阶段耗时",
+    ["api", "phase"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+
+# bcrypt 计算耗时 (线程池内，不含排队)
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "bcrypt 哈希/校验耗时",
+    ["op"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0),
+)
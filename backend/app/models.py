@@ -1,11 +1,20 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy import Column, BigInteger, Integer, Float, Numeric, String, DateTime, Text, LargeBinary, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import deferred, relationship
+from sqlalchemy.sql import func, text
 from app.database import Base
+from app.payloads import pack_payload, unpack_payload
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # 管理后台用户列表：按注册时间 keyset 分页；邮箱 / 用户名前缀搜索 (lower(列) LIKE 'q%')
+        # 子串搜索使用的 pg_trgm GIN 索引依赖数据库扩展，只在迁移 d7a3e51f0b62 中创建
+        Index("ix_users_created_id", text("created_at DESC"), text("id DESC")),
+        Index("ix_users_email_lower", text("lower(email) text_pattern_ops")),
+        Index("ix_users_username_lower", text("lower(username) text_pattern_ops")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
@@ -20,17 +29,63 @@ class User(Base):
 
 class WorkflowHistory(Base):
     __tablename__ = "workflow_history"
+    __table_args__ = (
+        UniqueConstraint("user_id", "idempotency_key", name="uq_workflow_history_user_idempotency"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     name = Column(String, nullable=False)
-    input_data = Column(Text, nullable=False)
-    output_data = Column(Text, nullable=True)
-    status = Column(String, default="completed")
+    status = Column(String, default="completed")  # queued / running / completed / failed (同步运行直接 completed)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # 异步任务字段
+    idempotency_key = Column(String, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    # 大字段：zstd 压缩正文延迟加载 (undefer_group("payload"))，列表只读预览和长度
+    input_blob = deferred(Column(LargeBinary, nullable=True), group="payload")
+    output_blob = deferred(Column(LargeBinary, nullable=True), group="payload")
+    input_preview = Column(Text, nullable=True)
+    output_preview = Column(Text, nullable=True)
+    input_size = Column(Integer, nullable=True)
+    output_size = Column(Integer, nullable=True)
+    # 旧版明文列，后台压缩迁移后置为 NULL
+    legacy_input = deferred(Column("input_data", Text, nullable=True), group="payload")
+    legacy_output = deferred(Column("output_data", Text, nullable=True), group="payload")
+
     user = relationship("User", back_populates="workflows")
 
+    @property
+    def input_data(self):
+        return unpack_payload(self.input_blob, self.legacy_input)
+
+    @input_data.setter
+    def input_data(self, value):
+        self.input_blob, self.input_preview, self.input_size = pack_payload(value)
+        self.legacy_input = None
+
+    @property
+    def output_data(self):
+        return unpack_payload(self.output_blob, self.legacy_output)
+
+    @output_data.setter
+    def output_data(self, value):
+        self.output_blob, self.output_preview, self.output_size = pack_payload(value)
+        self.legacy_output = None
+
+
+# 历史记录按用户倒序分页 (keyset: created_at DESC, id DESC)
+Index(
+    "ix_workflow_history_user_created",
+    WorkflowHistory.user_id,
+    WorkflowHistory.created_at.desc(),
+    WorkflowHistory.id.desc(),
+)
+
 
 class DifyApp(Base):
     __tablename__ = "dify_apps"
@@ -40,3 +95,74 @@ class DifyApp(Base):
     name = Column(String, nullable=False)
     api_key = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class WorkflowRunEvent(Base):
+    """每次 Dify 工作流运行一条，只追加不修改；由 run_rollups 汇总后按保留期清理"""
+    __tablename__ = "workflow_run_events"
+    __table_args__ = (
+        # 按时间追加写入，BRIN 索引体积极小，足够支撑按小时范围扫描
+        Index("ix_workflow_run_events_created_brin", "created_at", postgresql_using="brin"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    app_id = Column(String, nullable=False)  # 使用全局 Key 的运行记为 default_app_id()
+    user_id = Column(Integer, nullable=True)  # 不加外键：删除用户不影响历史统计
+    source = Column(String, nullable=False)  # run / stream / batch / workflow / job
+    status = Column(String, nullable=False)  # succeeded / failed / stopped / cancelled
+    wall_ms = Column(Integer, nullable=False)  # 本服务测得的调用耗时
+    dify_elapsed_ms = Column(Integer, nullable=True)  # Dify 返回的 elapsed_time
+    total_tokens = Column(Integer, nullable=True)
+    total_steps = Column(Integer, nullable=True)
+    workflow_run_id = Column(String, nullable=True)
+
+
+class WorkflowRunRollup(Base):
+    """运行事件按小时汇总；dimension 为 app / user / all，key 为应用 ID、用户 ID 或空串"""
+    __tablename__ = "workflow_run_rollups"
+    __table_args__ = (
+        UniqueConstraint("dimension", "key", "hour", name="uq_workflow_run_rollups_dimension_key_hour"),
+        Index("ix_workflow_run_rollups_dimension_hour", "dimension", "hour"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    dimension = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    hour = Column(DateTime(timezone=True), nullable=False)
+    runs = Column(Integer, nullable=False)
+    failed = Column(Integer, nullable=False)
+    wall_ms_total = Column(BigInteger, nullable=False)
+    wall_ms_p50 = Column(Integer, nullable=True)
+    wall_ms_p95 = Column(Integer, nullable=True)
+    dify_ms_p50 = Column(Integer, nullable=True)
+    dify_ms_p95 = Column(Integer, nullable=True)
+    total_tokens = Column(BigInteger, nullable=False)
+    total_steps = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class Product(Base):
+    """采集的商品页，(asin, marketplace) 唯一；content_hash 相同的重复采集不写库"""
+    __tablename__ = "products"
+    __table_args__ = (
+        UniqueConstraint("asin", "marketplace", name="uq_products_asin_marketplace"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    asin = Column(String(10), nullable=False)
+    marketplace = Column(String(3), nullable=False)
+    url = Column(Text, nullable=True)
+    title = Column(Text, nullable=False)
+    price = Column(Numeric(12, 2), nullable=True)
+    currency = Column(String(3), nullable=True)
+    rating = Column(Float, nullable=True)
+    review_count = Column(Integer, nullable=True)
+    images = Column(JSONB, nullable=False, server_default=text("'[]'::jsonb"))
+    bullets = Column(JSONB, nullable=False, server_default=text("'[]'::jsonb"))
+    reviews = Column(JSONB, nullable=False, server_default=text("'[]'::jsonb"))
+    description = Column(Text, nullable=True)
+    content_hash = Column(LargeBinary, nullable=False)  # sha256(规范化 JSON)，不含 url
+    captured_by = Column(Integer, nullable=True)  # 最近一次内容变化的采集用户
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())  # 内容最近一次变化的时间
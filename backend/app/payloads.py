@@ -0,0 +1,42 @@
+"""
+工作流大字段 (input_data / output_data) 压缩存储
+
+正文以 zstd 压缩后写入 *_blob 列，同时保存截断预览和原始字符数，
+历史列表只读取预览；旧版明文列由 python -m app.compact_payloads 在后台迁移。
+"""
+from typing import Any, Dict, Optional, Tuple
+
+import zstandard
+
+from app.config import settings
+
+_compressor = zstandard.ZstdCompressor(level=settings.payload_zstd_level)
+_decompressor = zstandard.ZstdDecompressor()
+
+
+def make_preview(text: Optional[str]) -> Optional[str]:
+    if text is None:
+        return None
+    if len(text) <= settings.payload_preview_chars:
+        return text
+    return text[:settings.payload_preview_chars] + "…"
+
+
+def pack_payload(text: Optional[str]) -> Tuple[Optional[bytes], Optional[str], Optional[int]]:
+    """返回 (压缩正文, 预览, 字符数)"""
+    if text is None:
+        return None, None, None
+    return _compressor.compress(text.encode("utf-8")), make_preview(text), len(text)
+
+
+def unpack_payload(blob: Optional[bytes], legacy: Optional[str] = None) -> Optional[str]:
+    """优先读取压缩列，尚未迁移的旧行回退到明文列"""
+    if blob is None:
+        return legacy
+    return _decompressor.decompress(blob).decode("utf-8")
+
+
+def payload_columns(prefix: str, text: Optional[str]) -> Dict[str, Any]:
+    """批量 insert 时使用的列值，prefix 为 input / output"""
+    blob, preview, size = pack_payload(text)
+    return {f"{prefix}_blob": blob, f"{prefix}_preview": preview, f"{prefix}_size": size}
@@ -0,0 +1,99 @@
+"""
+请求关联 ID (correlation id)
+
+每个 HTTP 请求沿用客户端传入的 X-Request-ID 或生成新 ID，存入 contextvar：
+日志记录自动附带，调用 Dify 时通过请求头继续传递，响应头中返回给调用方。
+
+请求截止时间 (deadline) 同样存入 contextvar：默认 settings.request_deadline 秒，
+客户端可通过 X-Request-Timeout 缩短；下游的 Dify 调用、排队等待都不会超过剩余时间。
+"""
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+from app.config import settings
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+# time.monotonic() 截止时刻；None 表示不限 (后台任务)
+deadline_var: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+class RequestIdMiddleware:
+    """纯 ASGI 中间件 (不缓冲响应体，SSE / NDJSON 流式响应不受影响)"""
+
+    def __init__(self, app):
+        self.app = app
+        self._header = REQUEST_ID_HEADER.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == self._header:
+                # 只接受合理长度的外部 ID，避免日志被注入超长内容
+                request_id = value.decode("latin-1")[:64] or None
+                break
+        request_id = request_id or new_request_id()
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"].append((self._header, request_id.encode("latin-1")))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """当前请求剩余的秒数 (可能为负)；不在请求上下文中时返回 None"""
+    deadline = deadline_var.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class DeadlineMiddleware:
+    """纯 ASGI 中间件：为每个请求设置截止时间"""
+
+    def __init__(self, app):
+        self.app = app
+        self._header = REQUEST_TIMEOUT_HEADER.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = settings.request_deadline
+        for name, value in scope["headers"]:
+            if name == self._header:
+                try:
+                    budget = min(budget, max(float(value), 0.0))
+                except ValueError:
+                    pass
+                break
+        token = deadline_var.set(time.monotonic() + budget)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            deadline_var.reset(token)
+
+
+async def inject_request_id(request):
+    """httpx 请求钩子：把当前关联 ID 带到 Dify"""
+    request_id = request_id_var.get()
+    if request_id and REQUEST_ID_HEADER not in request.headers:
+        request.headers[REQUEST_ID_HEADER] = request_id
@@ -0,0 +1,8 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
+
+
+class BatchRunRequest(BaseModel):
+    items: List[Dict[str, Any]] = Field(..., min_length=1)
+    name: Optional[str] = None
+    concurrency: Optional[int] = Field(None, ge=1)
@@ -0,0 +1,50 @@
+from decimal import Decimal
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from app.config import settings
+
+class ProductReview(BaseModel):
+    author: Optional[str] = None
+    rating: Optional[float] = Field(None, ge=0, le=5)
+    title: Optional[str] = None
+    body: Optional[str] = None
+    date: Optional[str] = None
+
+
+class ProductRawData(BaseModel):
+    """浏览器插件 / 抓取层输出的商品页结构化数据"""
+    asin: str = Field(..., pattern=r"^[A-Z0-9]{10}$")
+    marketplace: str = Field("US", pattern=r"^[A-Z]{2,3}$")
+    url: Optional[str] = None
+    title: str
+    price: Optional[Decimal] = Field(None, ge=0, lt=10 ** 10)
+    currency: Optional[str] = Field(None, max_length=3)
+    images: List[str] = []
+    bullets: List[str] = []
+    description: Optional[str] = None
+    rating: Optional[float] = Field(None, ge=0, le=5)
+    review_count: Optional[int] = Field(None, ge=0)
+    reviews: List[ProductReview] = []
+
+
+class ProductIngestRequest(BaseModel):
+    # 超出上限的批次在校验阶段即被拒绝 (422)
+    items: List[ProductRawData] = Field(..., min_length=1, max_length=settings.product_ingest_max_items)
+
+
+class ProductIngestItem(BaseModel):
+    product_id: int
+    asin: str
+    marketplace: str
+    result: str  # inserted / updated / requeued (内容未变化，重新入队之前入队失败的任务)
+    job_id: Optional[int] = None
+
+
+class ProductIngestResponse(BaseModel):
+    received: int
+    inserted: int
+    updated: int
+    unchanged: int
+    queued: int = 0
+    items: List[ProductIngestItem]
@@ -25,6 +25,11 @@ class User(UserBase):
         from_attributes = True
 
 
+class CurrentUser(User):
+    """get_current_user 返回的用户快照 (可序列化后放入缓存)"""
+    is_active: int
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List, Optional
 
 
 class WorkflowBase(BaseModel):
@@ -11,11 +12,15 @@ class WorkflowCreate(WorkflowBase):
     pass
 
 
+class WorkflowSave(WorkflowBase):
+    output_data: Optional[str] = None
+
+
 class WorkflowResponse(BaseModel):
     id: int
     name: str
     input_data: str
-    output_data: str
+    output_data: Optional[str] = None
     status: str
     created_at: datetime
 
@@ -23,6 +28,36 @@ class WorkflowResponse(BaseModel):
         from_attributes = True
 
 
+class WorkflowSummary(BaseModel):
+    """历史列表项：只含元数据和截断预览，完整内容走 /api/workflows/{id}"""
+    id: int
+    name: str
+    status: str
+    input_preview: Optional[str] = None
+    output_preview: Optional[str] = None
+    input_size: Optional[int] = None
+    output_size: Optional[int] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class WorkflowHistoryPage(BaseModel):
+    items: List[WorkflowSummary]
+    next_cursor: Optional[str] = None
+
+
 class WorkflowRunResponse(BaseModel):
     output_data: str
     status: str
+
+
+class JobResponse(BaseModel):
+    job_id: int
+    status: str
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,137 @@
+"""
+管理后台用户列表：keyset 分页、排序、搜索与流式导出
+
+排序键 (末尾均带唯一列，保证翻页稳定)：
+- created_at: (created_at, id)，索引 ix_users_created_id；created_at 可为 NULL，
+  按 PostgreSQL 默认把 NULL 视为最大值 (ASC NULLS LAST / DESC NULLS FIRST，与索引顺序一致)，
+  游标中 NULL 原样编码，翻页条件显式处理 NULL 行
+- email / username / id: 列本身唯一，直接使用已有的唯一索引
+搜索：
+- prefix (默认): lower(列) LIKE 'q%'，索引 ix_users_email_lower / ix_users_username_lower (text_pattern_ops)
+- contains: 列 ILIKE '%q%'，数据库安装了 pg_trgm 时由迁移创建的 GIN 三元组索引支持
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import ColumnElement, Select, and_, func, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import User
+from app.pagination import decode_cursor, decode_datetime, decode_int, encode_cursor
+
+# 可为 NULL 的排序列
+NULLABLE_KEYS = {User.created_at}
+
+SORT_KEYS = {
+    "created_at": (User.created_at, User.id),
+    "email": (User.email,),
+    "username": (User.username,),
+    "id": (User.id,),
+}
+
+USER_COLUMNS = (User.id, User.email, User.username, User.created_at, User.is_admin, User.is_active)
+
+EXPORT_FIELDS = ["id", "email", "username", "created_at", "is_admin", "status"]
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _decode_key(column, value: Any) -> Any:
+    if value is None and column in NULLABLE_KEYS:
+        return None
+    if column is User.created_at:
+        return decode_datetime(value)
+    if column is User.id:
+        return decode_int(value)
+    if not isinstance(value, str):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的分页游标")
+    return value
+
+
+def build_user_query(
+    sort: str = "created_at",
+    order: str = "desc",
+    q: Optional[str] = None,
+    match: str = "prefix",
+    is_admin: Optional[int] = None,
+    is_active: Optional[int] = None,
+) -> Select:
+    """不含分页条件的列表查询，列表与导出共用"""
+    query = select(*USER_COLUMNS)
+    if q:
+        if match == "contains":
+            pattern = f"%{_escape_like(q)}%"
+            query = query.where(or_(
+                User.email.ilike(pattern, escape="\\"),
+                User.username.ilike(pattern, escape="\\"),
+            ))
+        else:
+            pattern = f"{_escape_like(q.lower())}%"
+            query = query.where(or_(
+                func.lower(User.email).like(pattern, escape="\\"),
+                func.lower(User.username).like(pattern, escape="\\"),
+            ))
+    if is_admin is not None:
+        query = query.where(User.is_admin == is_admin)
+    if is_active is not None:
+        query = query.where(User.is_active == is_active)
+
+    keys = SORT_KEYS[sort]
+    return query.order_by(*(key.desc() if order == "desc" else key.asc() for key in keys))
+
+
+def _after_condition(keys: Tuple, after: List[Any], order: str) -> ColumnElement:
+    """排在游标之后的行；首列可为 NULL 时 NULL 视为最大值 (行值比较遇到 NULL 结果为 NULL，需单独处理)"""
+    def beyond(columns, values):
+        return tuple_(*columns) < tuple_(*values) if order == "desc" else tuple_(*columns) > tuple_(*values)
+
+    first = keys[0]
+    if first not in NULLABLE_KEYS:
+        return beyond(keys, after)
+    if after[0] is None:
+        # 游标在 NULL 区间内：同为 NULL 的按其余列比较；降序时 NULL 在前，之后是全部非 NULL 行
+        within_nulls = and_(first.is_(None), beyond(keys[1:], after[1:]))
+        return or_(within_nulls, first.is_not(None)) if order == "desc" else within_nulls
+    # 升序时 NULL 行排在所有非 NULL 行之后
+    return beyond(keys, after) if order == "desc" else or_(beyond(keys, after), first.is_(None))
+
+
+async def fetch_user_page(
+    db: AsyncSession,
+    limit: int,
+    cursor: Optional[str] = None,
+    sort: str = "created_at",
+    order: str = "desc",
+    **filters,
+) -> Tuple[List[Any], Optional[str]]:
+    keys = SORT_KEYS[sort]
+    query = build_user_query(sort=sort, order=order, **filters)
+    if cursor:
+        values = decode_cursor(cursor, len(keys) + 2)
+        if values[:2] != [sort, order]:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="分页游标与排序方式不一致")
+        after = [_decode_key(key, value) for key, value in zip(keys, values[2:])]
+        query = query.where(_after_condition(keys, after, order))
+
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor(sort, order, *(last[key.key] for key in keys))
+    return rows, next_cursor
+
+
+def user_row(row) -> Dict[str, Any]:
+    created_at: Optional[datetime] = row.created_at
+    return {
+        "id": str(row.id),
+        "email": row.email,
+        "username": row.username,
+        "created_at": created_at.isoformat() if created_at else None,
+        "is_admin": row.is_admin,
+        "status": "active" if row.is_active == 1 else "inactive",
+    }
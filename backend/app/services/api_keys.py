@@ -0,0 +1,85 @@
+"""
+Dify 应用 API Key 注册表
+
+运行应用时按 app_id 选择 Bearer Key，原先每次运行都查询一次 dify_apps。
+现在启动时从 dify_apps 预热到进程内字典，之后解析 Key 只是一次字典查找：
+- 未登记的应用 (使用全局 settings.dify_api_key) 写入负缓存，api_key_negative_ttl 内不再查库
+- create_dify_app 写入新 Key 后调用 invalidate()，通过 invalidation_bus 通知所有 worker
+  丢弃该 app_id 的本地条目 (广播内容只有 app_id，不含 Key)，下次解析时重新查库
+"""
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy import select
+
+from app.cache import TTLCache, invalidation_bus
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.metrics import API_KEY_LOOKUPS
+from app.models import DifyApp
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_KIND = "dify_app_key"
+
+
+class AppCredentials:
+    __slots__ = ("api_key", "name")
+
+    def __init__(self, api_key: str, name: str):
+        self.api_key = api_key
+        self.name = name
+
+
+class ApiKeyRegistry:
+    def __init__(self):
+        self._apps: Dict[str, AppCredentials] = {}
+        self._missing = TTLCache(maxsize=settings.api_key_negative_size, ttl=settings.api_key_negative_ttl)
+        # 每次失效递增；查库期间发生失效时丢弃查询结果，避免旧结果覆盖新写入的 Key
+        self._generation = 0
+        invalidation_bus.subscribe(INVALIDATION_KIND, self._evict)
+
+    def _evict(self, app_id: str):
+        self._generation += 1
+        self._apps.pop(app_id, None)
+        self._missing.pop(app_id)
+
+    async def warm(self):
+        """启动时加载全部已登记应用"""
+        generation = self._generation
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(select(DifyApp.app_id, DifyApp.api_key, DifyApp.name))).all()
+        if generation != self._generation:
+            return
+        self._apps = {row.app_id: AppCredentials(row.api_key, row.name) for row in rows}
+        logger.info("已加载 %d 个 Dify 应用 API Key", len(self._apps))
+
+    async def resolve(self, app_id: str) -> Optional[AppCredentials]:
+        """返回应用登记的 Key 与名称；未登记返回 None，由调用方回退到全局 Key"""
+        credentials = self._apps.get(app_id)
+        if credentials is not None:
+            API_KEY_LOOKUPS.labels(result="hit").inc()
+            return credentials
+        if self._missing.get(app_id) is not None:
+            API_KEY_LOOKUPS.labels(result="negative").inc()
+            return None
+
+        API_KEY_LOOKUPS.labels(result="miss").inc()
+        generation = self._generation
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(
+                select(DifyApp.api_key, DifyApp.name).where(DifyApp.app_id == app_id)
+            )).first()
+        credentials = AppCredentials(row.api_key, row.name) if row else None
+        if generation == self._generation:
+            if credentials is not None:
+                self._apps[app_id] = credentials
+            else:
+                self._missing.set(app_id, True)
+        return credentials
+
+    async def invalidate(self, app_id: str):
+        await invalidation_bus.publish(INVALIDATION_KIND, app_id)
+
+
+api_key_registry = ApiKeyRegistry()
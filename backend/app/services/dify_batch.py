@@ -0,0 +1,113 @@
+"""
+Dify 应用批量运行
+
+对同一个应用的 N 组输入按并发上限扇出执行，并受每应用令牌桶 (Redis，与交互请求分开计数) 限速，
+发往 Dify 时以低于交互请求的优先级占用并发槽位；
+每完成一项立即以 NDJSON 输出一行，全部结束 (或客户端断开) 后一次性批量写入历史记录。
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List
+
+from anyio import CancelScope
+from fastapi import HTTPException
+from sqlalchemy import insert
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import WorkflowHistory
+from app.payloads import payload_columns
+from app.request_context import deadline_var
+from app.services.dify_limiter import BATCH, dify_limiter
+from app.services.dify_runs import DifyRunError, run_workflow_blocking
+from app.services.rate_limit import batch_bucket, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+def _output_text(outputs: Dict[str, Any]) -> str:
+    if not outputs:
+        return ""
+    text = outputs.get("text")
+    return text if text is not None else json.dumps(outputs, ensure_ascii=False)
+
+
+async def save_batch_history(rows: List[Dict[str, Any]]):
+    """单条多行 INSERT 写入批量运行记录"""
+    if not rows:
+        return
+    with CancelScope(shield=True):
+        async with AsyncSessionLocal() as db:
+            try:
+                await db.execute(insert(WorkflowHistory), rows)
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                logger.error("保存批量运行记录失败 (%s 条): %s", len(rows), e)
+
+
+async def run_batch(
+    app_id: str,
+    api_key: str,
+    name: str,
+    items: List[Dict[str, Any]],
+    concurrency: int,
+    user_id: int,
+    user_email: str,
+) -> AsyncIterator[bytes]:
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = batch_bucket(app_id)
+
+    async def run_one(index: int, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        # 整批的耗时由限速决定，可能远超单个请求的截止时间；每项只受上游超时约束
+        # (每个任务有自己的 context 副本，不影响响应流本身)
+        deadline_var.set(None)
+        async with semaphore:
+            await rate_limiter.acquire(bucket)
+            started = time.perf_counter()
+            try:
+                async with dify_limiter.slot(BATCH):
+                    data = await run_workflow_blocking(
+                        inputs, user=user_email, api_key=api_key, app_id=app_id, user_id=user_id, source="batch"
+                    )
+                result = {"index": index, "status": "completed", "outputs": data.get("outputs")}
+            except DifyRunError as e:
+                result = {"index": index, "status": "failed", "error": str(e)}
+            except HTTPException as e:
+                # 并发槽位不可用等准入错误只影响本项，不中断整批的响应流
+                result = {"index": index, "status": "failed", "error": str(e.detail)}
+            result["elapsed_ms"] = int((time.perf_counter() - started) * 1000)
+            return result
+
+    tasks = [asyncio.create_task(run_one(index, inputs)) for index, inputs in enumerate(items)]
+    rows: List[Dict[str, Any]] = []
+    completed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result["status"] == "completed":
+                completed += 1
+            rows.append({
+                "user_id": user_id,
+                "name": name,
+                **payload_columns("input", json.dumps(items[result["index"]], ensure_ascii=False)),
+                **payload_columns(
+                    "output",
+                    _output_text(result.get("outputs")) if result["status"] == "completed" else result["error"]
+                ),
+                "status": result["status"],
+                "error": result.get("error"),
+                "attempts": 1,
+            })
+            yield (json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8")
+
+        yield (json.dumps(
+            {"done": True, "total": len(items), "completed": completed, "failed": len(items) - completed}
+        ) + "\n").encode("utf-8")
+    finally:
+        # 客户端中途断开时取消尚未完成的项，已完成的照常落库
+        for task in tasks:
+            task.cancel()
+        await save_batch_history(rows)
@@ -0,0 +1,217 @@
+"""
+Dify 应用目录
+
+应用列表快照保存在 Redis (哈希表 id -> JSON)，按 apps.updated_at 水位增量刷新，
+各 worker 在本地保留一份按 (created_at, id) 排序的副本，
+分页、筛选与字段投影都在内存中完成，不再每次全表扫描 Dify 数据库。
+
+快照版本 (即 ETag) 只在内容确实变化时递增：增量查询取回的行与 Redis 中的 JSON 逐条比较，
+相同的不写入；Dify 删除应用是物理删除，每 dify_catalogue_full_sync_interval 秒全量比对一次。
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlalchemy.exc import DatabaseError, OperationalError
+
+from app.cache import redis_client, release_lock
+from app.config import settings
+from app.database import dify_engine
+from app.pagination import decode_cursor, decode_str, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+APPS_KEY = "amz:dify:apps"
+META_KEY = "amz:dify:apps:meta"
+REFRESH_LOCK_KEY = "amz:dify:apps:lock"
+
+APP_FIELDS = ("id", "name", "mode", "description", "status", "icon", "created_at", "updated_at")
+
+APPS_QUERY = """
+    SELECT id, name, mode, description, status, icon, created_at, updated_at
+    FROM apps
+"""
+
+
+def _row_to_app(row) -> Dict[str, Any]:
+    return {
+        "id": str(row.id),
+        "name": row.name,
+        "mode": row.mode,
+        "description": row.description,
+        "status": row.status,
+        "icon": row.icon,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+    }
+
+
+def _sort_key(app: Dict[str, Any]) -> Tuple[str, str]:
+    return (app["created_at"] or "", app["id"])
+
+
+class CatalogueSnapshot:
+    """按 (created_at, id) 升序排列的应用列表；分页时倒序遍历"""
+
+    def __init__(self, apps: Iterable[Dict[str, Any]], version: str):
+        self.apps = sorted(apps, key=_sort_key)
+        self.keys = [_sort_key(app) for app in self.apps]
+        self.by_id = {app["id"]: app for app in self.apps}
+        self.version = version
+
+
+class DifyCatalogue:
+    def __init__(self):
+        self._snapshot: Optional[CatalogueSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _fetch(self, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        if dify_engine is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Dify 数据库连接未初始化"
+            )
+        try:
+            async with dify_engine.connect() as conn:
+                if since is None:
+                    result = await conn.execute(text(APPS_QUERY))
+                else:
+                    # >= 而非 >：同一时间戳的多行不会因水位而漏掉，重复写入是幂等的
+                    result = await conn.execute(
+                        text(APPS_QUERY + " WHERE updated_at >= :since"), {"since": since}
+                    )
+                return [_row_to_app(row) for row in result]
+        except (OperationalError, DatabaseError) as e:
+            logger.error("数据库操作失败: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="无法连接到 Dify 数据库，请确保 Dify 服务正在运行"
+            )
+
+    async def _refresh_redis(self):
+        """由一个 worker 持锁更新 Redis 快照，其余 worker 直接读取"""
+        token = uuid.uuid4().hex
+        if not await redis_client.set(REFRESH_LOCK_KEY, token, nx=True, ex=30):
+            return
+        try:
+            meta = await redis_client.hgetall(META_KEY)
+            watermark = meta.get(b"watermark")
+            full = (
+                watermark is None
+                or time.time() - float(meta.get(b"synced_at", 0)) >= settings.dify_catalogue_full_sync_interval
+            )
+            apps = await self._fetch(None if full else datetime.fromisoformat(watermark.decode()))
+            encoded = {app["id"]: json.dumps(app, ensure_ascii=False) for app in apps}
+
+            if full:
+                stored = {key.decode(): value.decode() for key, value in (await redis_client.hgetall(APPS_KEY)).items()}
+                removed = [app_id for app_id in stored if app_id not in encoded]
+            else:
+                values = await redis_client.hmget(APPS_KEY, list(encoded)) if encoded else []
+                stored = {app_id: value.decode() for app_id, value in zip(encoded, values) if value is not None}
+                removed = []
+            changed = {app_id: value for app_id, value in encoded.items() if stored.get(app_id) != value}
+
+            pipe = redis_client.pipeline(transaction=True)
+            if removed:
+                pipe.hdel(APPS_KEY, *removed)
+            if changed:
+                pipe.hset(APPS_KEY, mapping=changed)
+            updated = [app["updated_at"] for app in apps if app["updated_at"]]
+            if updated and max(updated).encode() != watermark:
+                pipe.hset(META_KEY, "watermark", max(updated))
+            if full:
+                pipe.hset(META_KEY, "synced_at", time.time())
+            if changed or removed or b"version" not in meta:
+                pipe.hincrby(META_KEY, "version", 1)
+            await pipe.execute()
+        finally:
+            await release_lock(REFRESH_LOCK_KEY, token)
+
+    async def _load(self) -> CatalogueSnapshot:
+        try:
+            await self._refresh_redis()
+            version = await redis_client.hget(META_KEY, "version")
+            if version is None:
+                raise RuntimeError("Redis 中没有应用目录快照")
+            version = version.decode()
+            if self._snapshot is not None and self._snapshot.version == version:
+                return self._snapshot
+            raw = await redis_client.hgetall(APPS_KEY)
+            return CatalogueSnapshot((json.loads(value) for value in raw.values()), version)
+        except HTTPException:
+            raise
+        except Exception as e:
+            # Redis 不可用时直接读库，保证列表可用
+            logger.warning("读取 Redis 应用目录失败，回退到数据库: %s", e)
+            apps = await self._fetch()
+            version = hashlib.sha1(json.dumps(apps, sort_keys=True).encode()).hexdigest()[:16]
+            return CatalogueSnapshot(apps, f"db-{version}")
+
+    async def snapshot(self) -> CatalogueSnapshot:
+        if self._snapshot is not None and time.monotonic() - self._checked_at < settings.dify_catalogue_refresh_interval:
+            return self._snapshot
+        async with self._lock:
+            if self._snapshot is None or time.monotonic() - self._checked_at >= settings.dify_catalogue_refresh_interval:
+                self._snapshot = await self._load()
+                self._checked_at = time.monotonic()
+        return self._snapshot
+
+    def mark_stale(self):
+        """本进程新建/修改应用后调用，下一次读取立即刷新"""
+        self._checked_at = 0.0
+
+    async def get_app(self, app_id: str) -> Optional[Dict[str, Any]]:
+        return (await self.snapshot()).by_id.get(app_id)
+
+    async def list_apps(
+        self,
+        mode: Optional[str] = None,
+        app_status: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str], str]:
+        """
+        返回 (当前页应用, 下一页游标, 快照版本)
+        按 created_at DESC, id DESC 排序，游标为上一页最后一条的排序键
+        """
+        snapshot = await self.snapshot()
+        end = len(snapshot.apps)
+        if cursor:
+            created_at, app_id = decode_cursor(cursor, 2)
+            end = bisect.bisect_left(snapshot.keys, (decode_str(created_at), decode_str(app_id)))
+        prefix = name_prefix.lower() if name_prefix else None
+
+        page: List[Dict[str, Any]] = []
+        next_cursor = None
+        for index in range(end - 1, -1, -1):
+            app = snapshot.apps[index]
+            if mode and app["mode"] != mode:
+                continue
+            if app_status and app["status"] != app_status:
+                continue
+            if prefix and not (app["name"] or "").lower().startswith(prefix):
+                continue
+            if len(page) == limit:
+                next_cursor = encode_cursor(*_sort_key(page[-1]))
+                break
+            page.append(app)
+
+        if fields:
+            selected = [field for field in APP_FIELDS if field in fields or field == "id"]
+            page = [{field: app[field] for field in selected} for app in page]
+        return page, next_cursor, snapshot.version
+
+
+dify_catalogue = DifyCatalogue()
@@ -0,0 +1,144 @@
+"""
+共享的 Dify HTTP 客户端
+
+Service API (dify_api_url) 与 Console API (dify_base_url) 各自维护一个长连接池，
+生命周期跟随 FastAPI 应用 (startup 创建, shutdown 关闭)，避免每次调用都重新握手。
+两个连接池各自带一个熔断器，重试与截止时间见 app.services.dify_resilience。
+"""
+import importlib.util
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from app.config import settings
+from app.metrics import DIFY_POOL_CONNECTIONS, DIFY_POOL_MAX_CONNECTIONS, DIFY_REQUEST_DURATION
+from app.request_context import inject_request_id
+from app.services.dify_resilience import CircuitBreaker, ResilientTransport
+
+logger = logging.getLogger(__name__)
+
+# 各类调用的读超时 (秒)，连接超时统一使用 dify_connect_timeout
+ENDPOINT_TIMEOUTS = {
+    "workflow_run": lambda: settings.dify_timeout_workflow_run,
+    "service": lambda: settings.dify_timeout_service,
+    "console": lambda: settings.dify_timeout_console,
+}
+
+
+def trace_hook(api: str):
+    """
+    httpx 请求钩子：通过 httpcore 的 trace 扩展记录各阶段耗时。
+    connect 只在新建连接时记录；total 在响应关闭时记录 (流式响应即整个流的时长)
+    """
+    connect = DIFY_REQUEST_DURATION.labels(api=api, phase="connect")
+    ttfb = DIFY_REQUEST_DURATION.labels(api=api, phase="ttfb")
+    total = DIFY_REQUEST_DURATION.labels(api=api, phase="total")
+
+    async def hook(request: httpx.Request):
+        started = time.perf_counter()
+        marks = {}
+
+        async def trace(event_name: str, info: dict):
+            now = time.perf_counter()
+            if event_name.endswith("connect_tcp.started"):
+                marks["connect"] = now
+            elif event_name.endswith("send_request_headers.started"):
+                if "connect" in marks:
+                    connect.observe(now - marks.pop("connect"))
+                marks["sent"] = now
+            elif event_name.endswith("receive_response_headers.complete"):
+                ttfb.observe(now - marks.get("sent", started))
+            elif event_name.endswith("response_closed.complete"):
+                total.observe(now - started)
+
+        request.extensions["trace"] = trace
+
+    return hook
+
+
+class DifyClient:
+    """持有 Service API 与 Console API 两个 httpx.AsyncClient"""
+
+    def __init__(self):
+        self._service: Optional[httpx.AsyncClient] = None
+        self._console: Optional[httpx.AsyncClient] = None
+        self.breakers = {api: CircuitBreaker(api) for api in ("service", "console")}
+
+    @staticmethod
+    def _http2_available() -> bool:
+        if not settings.dify_http2:
+            return False
+        if importlib.util.find_spec("h2") is None:
+            logger.warning("未安装 h2，Dify 客户端回退到 HTTP/1.1")
+            return False
+        return True
+
+    def _build_client(self, base_url: str, api: str) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=settings.dify_pool_max_connections,
+            max_keepalive_connections=settings.dify_pool_max_keepalive,
+            keepalive_expiry=settings.dify_pool_keepalive_expiry,
+        )
+        transport = httpx.AsyncHTTPTransport(http2=self._http2_available(), limits=limits)
+        return httpx.AsyncClient(
+            base_url=base_url,
+            transport=ResilientTransport(transport, self.breakers[api]),
+            timeout=self.timeout("service"),
+            event_hooks={"request": [inject_request_id, trace_hook(api)]},
+        )
+
+    async def start(self):
+        if self._service is None:
+            self._service = self._build_client(settings.dify_api_url, "service")
+        if self._console is None:
+            self._console = self._build_client(settings.dify_base_url, "console")
+        self._register_metrics()
+
+    async def aclose(self):
+        for client in (self._service, self._console):
+            if client is not None:
+                await client.aclose()
+        self._service = None
+        self._console = None
+
+    @property
+    def service(self) -> httpx.AsyncClient:
+        """Service API 客户端 (Bearer 应用 API Key)"""
+        if self._service is None:
+            raise RuntimeError("Dify 客户端尚未启动")
+        return self._service
+
+    @property
+    def console(self) -> httpx.AsyncClient:
+        """Console API 客户端 (Bearer 管理员 Token)"""
+        if self._console is None:
+            raise RuntimeError("Dify 客户端尚未启动")
+        return self._console
+
+    @staticmethod
+    def timeout(endpoint: str) -> httpx.Timeout:
+        """按调用类型返回超时配置"""
+        read = ENDPOINT_TIMEOUTS[endpoint]()
+        return httpx.Timeout(read, connect=settings.dify_connect_timeout)
+
+    def pool_stats(self, api: str) -> dict:
+        """连接池使用情况；httpx 未公开连接池接口，这里通过 transport 读取"""
+        client = self._service if api == "service" else self._console
+        transport = getattr(getattr(client, "_transport", None), "_transport", None)
+        pool = getattr(transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {"total": len(connections), "idle": idle, "active": len(connections) - idle}
+
+    def _register_metrics(self):
+        for api in ("service", "console"):
+            DIFY_POOL_MAX_CONNECTIONS.labels(api=api).set(settings.dify_pool_max_connections)
+            for state in ("total", "idle", "active"):
+                DIFY_POOL_CONNECTIONS.labels(api=api, state=state).set_function(
+                    lambda api=api, state=state: self.pool_stats(api)[state]
+                )
+
+
+dify_client = DifyClient()
@@ -0,0 +1,163 @@
+"""
+Dify Console API 管理员 Token 管理
+
+缓存 access_token / refresh_token 并跟踪过期时间：
+- 过期前由后台任务提前刷新
+- 并发调用者通过锁共享同一次登录 (single-flight)
+- Console 请求遇到 401 时强制刷新后重试一次
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException, status
+from jose import jwt
+
+from app.config import settings
+from app.services.dify_client import dify_client
+
+logger = logging.getLogger(__name__)
+
+
+class ConsoleTokenManager:
+    def __init__(self):
+        self._access_token: Optional[str] = None
+        self._refresh_token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _token_expiry(token: str) -> float:
+        """读取 JWT 的 exp (不校验签名)；无法解析时按默认有效期计算"""
+        try:
+            exp = jwt.get_unverified_claims(token).get("exp")
+            if exp:
+                return float(exp)
+        except Exception:
+            pass
+        return time.time() + settings.dify_console_token_default_ttl
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._access_token is not None
+            and self._expires_at - time.time() > settings.dify_console_token_refresh_margin
+        )
+
+    def _store(self, data: dict):
+        self._access_token = data.get("access_token")
+        self._refresh_token = data.get("refresh_token") or self._refresh_token
+        if not self._access_token:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="无法认证 Dify 管理员账户"
+            )
+        self._expires_at = self._token_expiry(self._access_token)
+
+    async def _login(self):
+        try:
+            response = await dify_client.console.post(
+                "/console/api/login",
+                json={
+                    "email": settings.dify_admin_email,
+                    "password": settings.dify_admin_password,
+                    "provider": "email"
+                },
+                timeout=dify_client.timeout("console")
+            )
+        except httpx.RequestError as e:
+            logger.error("Dify 连接失败: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="无法连接到 Dify 服务"
+            )
+
+        if response.status_code != 200:
+            logger.error("Dify 登录失败: %s", response.text)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="无法认证 Dify 管理员账户"
+            )
+        self._store(response.json().get("data", {}))
+        logger.info("Dify 管理员登录成功")
+
+    async def _refresh(self):
+        """优先使用 refresh_token，失败时回退到完整登录"""
+        if self._refresh_token:
+            try:
+                response = await dify_client.console.post(
+                    "/console/api/refresh-token",
+                    json={"refresh_token": self._refresh_token},
+                    timeout=dify_client.timeout("console")
+                )
+                if response.status_code == 200:
+                    self._store(response.json().get("data", {}))
+                    return
+                logger.warning("Dify Token 刷新失败: %s，改为重新登录", response.status_code)
+            except httpx.RequestError as e:
+                logger.warning("Dify Token 刷新请求失败: %s，改为重新登录", e)
+        await self._login()
+
+    async def get_token(self, stale_token: Optional[str] = None) -> str:
+        """
+        获取可用的 access_token
+        stale_token: 调用方确认已失效的 token (如收到 401)，若仍是当前 token 则强制刷新
+        """
+        if self._is_fresh() and stale_token is None:
+            return self._access_token
+
+        async with self._lock:
+            # 排队期间其他协程可能已经刷新完成
+            must_refresh = not self._is_fresh() or (stale_token is not None and stale_token == self._access_token)
+            if must_refresh:
+                await self._refresh()
+            self._ensure_background_refresh()
+            return self._access_token
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """带管理员 Token 调用 Console API，401 时强制刷新并重试一次"""
+        headers = dict(kwargs.pop("headers", None) or {})
+        kwargs.setdefault("timeout", dify_client.timeout("console"))
+
+        token = await self.get_token()
+        headers["Authorization"] = f"Bearer {token}"
+        response = await dify_client.console.request(method, path, headers=headers, **kwargs)
+        if response.status_code != 401:
+            return response
+
+        logger.info("Dify Console 返回 401，刷新 Token 后重试")
+        token = await self.get_token(stale_token=token)
+        headers["Authorization"] = f"Bearer {token}"
+        return await dify_client.console.request(method, path, headers=headers, **kwargs)
+
+    def _ensure_background_refresh(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            delay = self._expires_at - settings.dify_console_token_refresh_margin - time.time()
+            await asyncio.sleep(max(delay, 5))
+            try:
+                async with self._lock:
+                    if not self._is_fresh():
+                        await self._refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("后台刷新 Dify Token 失败: %s", e)
+                await asyncio.sleep(30)
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+
+console_tokens = ConsoleTokenManager()
@@ -0,0 +1,131 @@
+"""
+发往 Dify 的并发上限 (每进程)
+
+所有实际调用 Dify 的路径 (阻塞运行、流式运行、批量运行、创建应用) 先取得一个槽位：
+- 同时进行的调用不超过 dify_max_concurrency，其中批量运行最多占 dify_batch_max_concurrency，
+  始终为交互请求留出余量
+- 槽位空出时优先唤醒交互请求，其次才是批量运行
+- 交互请求的等待队列有上限 (dify_max_queue)，队列已满或等待超过 dify_queue_timeout 时
+  (或请求剩余时间) 立即返回 503 + Retry-After，而不是让所有请求一起排队直到超时
+- 批量运行不受队列上限约束 (已由单批并发数限制)，一直等待到取得槽位或被取消
+
+多 worker 部署时发往 Dify 的总并发为 worker 数 × dify_max_concurrency。
+"""
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+from fastapi import HTTPException, status
+
+from app.config import settings
+from app.metrics import ADMISSION_REJECTED, DIFY_INFLIGHT, DIFY_QUEUED
+from app.request_context import remaining_time
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+
+class DifySlot:
+    """已取得的槽位；release() 可重复调用"""
+
+    def __init__(self, limiter: "DifyLimiter", priority: str):
+        self._limiter = limiter
+        self.priority = priority
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release(self.priority)
+
+
+class DifyLimiter:
+    def __init__(self):
+        self._active: Dict[str, int] = {INTERACTIVE: 0, BATCH: 0}
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {INTERACTIVE: deque(), BATCH: deque()}
+
+    def _can_start(self, priority: str) -> bool:
+        if sum(self._active.values()) >= settings.dify_max_concurrency:
+            return False
+        return priority == INTERACTIVE or self._active[BATCH] < settings.dify_batch_max_concurrency
+
+    def _grant(self, priority: str) -> DifySlot:
+        self._active[priority] += 1
+        DIFY_INFLIGHT.labels(priority=priority).inc()
+        return DifySlot(self, priority)
+
+    def _release(self, priority: str):
+        self._active[priority] -= 1
+        DIFY_INFLIGHT.labels(priority=priority).dec()
+        self._wake()
+
+    def _wake(self):
+        for priority in (INTERACTIVE, BATCH):
+            waiters = self._waiters[priority]
+            while waiters and self._can_start(priority):
+                future = waiters.popleft()
+                DIFY_QUEUED.labels(priority=priority).dec()
+                future.set_result(self._grant(priority))
+
+    def _overloaded(self, reason: str) -> HTTPException:
+        ADMISSION_REJECTED.labels(reason=reason).inc()
+        logger.warning("Dify 调用已饱和 (%s): active=%s queued=%s", reason, self._active, len(self._waiters[INTERACTIVE]))
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="服务繁忙，请稍后重试",
+            headers={"Retry-After": str(settings.dify_overload_retry_after)},
+        )
+
+    async def acquire(self, priority: str = INTERACTIVE) -> DifySlot:
+        # 交互请求只需排在交互队列之后；批量运行还要让位于所有排队的交互请求
+        ahead = self._waiters[INTERACTIVE] if priority == INTERACTIVE else (
+            self._waiters[INTERACTIVE] or self._waiters[BATCH]
+        )
+        if not ahead and self._can_start(priority):
+            return self._grant(priority)
+
+        waiters = self._waiters[priority]
+        if priority == INTERACTIVE and len(waiters) >= settings.dify_max_queue:
+            raise self._overloaded("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        DIFY_QUEUED.labels(priority=priority).inc()
+        timeout = settings.dify_queue_timeout if priority == INTERACTIVE else None
+        remaining = remaining_time()
+        if remaining is not None:
+            # 排队不越过请求截止时间
+            timeout = max(min(timeout, remaining) if timeout is not None else remaining, 0)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if future.done():
+                return future.result()
+            self._dequeue(priority, future)
+            raise self._overloaded("queue_timeout")
+        except asyncio.CancelledError:
+            if future.done():
+                # 取消与分配槽位同时发生：已分配的槽位立即归还
+                future.result().release()
+            else:
+                self._dequeue(priority, future)
+            raise
+
+    def _dequeue(self, priority: str, future: asyncio.Future):
+        self._waiters[priority].remove(future)
+        DIFY_QUEUED.labels(priority=priority).dec()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = INTERACTIVE):
+        acquired = await self.acquire(priority)
+        try:
+            yield acquired
+        finally:
+            acquired.release()
+
+
+dify_limiter = DifyLimiter()
@@ -0,0 +1,192 @@
+"""
+Dify 调用的容错层 (挂在 httpx transport 上，所有经 dify_client 的请求都经过这里)
+
+- 熔断：连续 dify_breaker_failure_threshold 次失败 (连接错误、超时、5xx) 后断开，
+  dify_breaker_reset_timeout 秒内直接抛出 DifyUnavailable，不再占用连接和协程；
+  到期后进入半开状态，只放行 dify_breaker_half_open_max 个探测请求，成功即恢复，失败重新断开
+- 重试：带抖动的指数退避 (full jitter)。幂等请求 (GET 等) 在连接错误、超时、502/503/504 时重试；
+  非幂等请求 (运行工作流等 POST) 只在请求确定没有发出 (连接失败、连接池等待超时) 时重试
+- 截止时间：每次尝试的超时都不超过当前请求剩余时间，剩余时间不足时抛出 DeadlineExceeded，
+  退避等待也不会越过截止时间；被截止时间缩短的超时 (客户端 X-Request-Timeout) 不计入熔断，
+  只有达到配置的上游超时才算 Dify 故障
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException, status
+
+from app.config import settings
+from app.metrics import DIFY_CIRCUIT_STATE, DIFY_RETRIES
+from app.request_context import remaining_time
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRYABLE_STATUSES = {502, 503, 504}
+# 请求确定没有发出的错误，非幂等请求也可以安全重试
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class DifyUnavailable(httpx.TransportError):
+    """熔断器断开，未发出请求"""
+
+    def __init__(self, message: str, retry_after: float, *, request: Optional[httpx.Request] = None):
+        super().__init__(message, request=request)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """请求剩余时间已用完，未发出 (或不再重试) Dify 调用"""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        DIFY_CIRCUIT_STATE.labels(api=name).set(STATE_VALUES[CLOSED])
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning("Dify %s 熔断器: %s -> %s", self.name, self.state, state)
+            self.state = state
+            DIFY_CIRCUIT_STATE.labels(api=self.name).set(STATE_VALUES[state])
+
+    def before_call(self) -> bool:
+        """放行则返回是否为半开探测请求，否则抛出 DifyUnavailable"""
+        if self.state == OPEN:
+            retry_after = self._opened_at + settings.dify_breaker_reset_timeout - time.monotonic()
+            if retry_after > 0:
+                raise DifyUnavailable(f"Dify {self.name} 暂不可用 (熔断中)", retry_after)
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probes >= settings.dify_breaker_half_open_max:
+                raise DifyUnavailable(f"Dify {self.name} 暂不可用 (恢复探测中)", 1.0)
+            self._probes += 1
+            return True
+        return False
+
+    def on_success(self, probe: bool):
+        if probe:
+            self._probes -= 1
+        self._failures = 0
+        self._set_state(CLOSED)
+
+    def on_failure(self, probe: bool):
+        if probe:
+            self._probes -= 1
+        self._failures += 1
+        if probe or self._failures >= settings.dify_breaker_failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def on_abandon(self, probe: bool):
+        """请求被取消，结果未知"""
+        if probe:
+            self._probes -= 1
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(settings.dify_retry_max_delay, settings.dify_retry_base_delay * 2 ** attempt))
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, breaker: CircuitBreaker):
+        self._transport = transport
+        self.breaker = breaker
+
+    @staticmethod
+    def _apply_deadline(request: httpx.Request, timeouts: dict) -> bool:
+        """按剩余时间设置本次尝试的超时，返回是否有超时被截止时间缩短"""
+        remaining = remaining_time()
+        if remaining is None:
+            request.extensions["timeout"] = timeouts
+            return False
+        if remaining <= 0:
+            raise DeadlineExceeded("请求已超过截止时间，未调用 Dify", request=request)
+        request.extensions["timeout"] = {
+            key: remaining if value is None else min(value, remaining) for key, value in timeouts.items()
+        }
+        return any(value is None or value > remaining for value in timeouts.values())
+
+    async def _should_retry(self, attempt: int, request: httpx.Request, error: Optional[Exception]) -> bool:
+        """还能重试时等待退避并返回 True"""
+        if attempt >= settings.dify_retry_attempts:
+            return False
+        delay = _backoff(attempt)
+        remaining = remaining_time()
+        if remaining is not None and remaining <= delay:
+            return False
+        DIFY_RETRIES.labels(api=self.breaker.name).inc()
+        logger.info(
+            "Dify %s %s 第 %d 次重试 (%.2fs 后): %s",
+            request.method, request.url.path, attempt + 1, delay, error or "可重试的状态码"
+        )
+        await asyncio.sleep(delay)
+        return True
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        idempotent = request.method in IDEMPOTENT_METHODS or bool(request.extensions.get("idempotent"))
+        # 每次尝试都从配置的超时重新计算，不沿用上一次被截止时间缩短的值
+        timeouts = dict(request.extensions.get("timeout") or {})
+        attempt = 0
+        while True:
+            capped = self._apply_deadline(request, timeouts)
+            probe = self.breaker.before_call()
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                if capped and isinstance(e, httpx.TimeoutException):
+                    # 调用方给的时间不够，不代表 Dify 故障
+                    self.breaker.on_abandon(probe)
+                else:
+                    self.breaker.on_failure(probe)
+                if (idempotent or isinstance(e, NOT_SENT_ERRORS)) and await self._should_retry(attempt, request, e):
+                    attempt += 1
+                    continue
+                raise
+            except BaseException:
+                self.breaker.on_abandon(probe)
+                raise
+
+            if response.status_code < 500:
+                self.breaker.on_success(probe)
+                return response
+            self.breaker.on_failure(probe)
+            if idempotent and response.status_code in RETRYABLE_STATUSES:
+                if await self._should_retry(attempt, request, None):
+                    await response.aclose()
+                    attempt += 1
+                    continue
+            return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def gateway_error(error: BaseException, detail: str) -> HTTPException:
+    """
+    Dify 调用失败对应的 HTTP 错误：熔断 503 (带 Retry-After)、超时 504、其余 502。
+    DifyRunError 等以 raise ... from 包装的异常按原始异常判断。
+    """
+    source = error.__cause__ or error
+    if isinstance(source, DifyUnavailable):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(max(1, int(source.retry_after + 0.999)))},
+        )
+    if isinstance(source, httpx.TimeoutException):
+        return HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=detail)
+    return HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=detail)
@@ -0,0 +1,80 @@
+"""
+Dify 工作流阻塞式运行 (response_mode=blocking)
+
+调用失败时抛出 DifyRunError，并标明是否值得重试，供同步接口与后台任务共用；
+连接错误、超时、熔断等以 raise ... from 保留原始异常，接口层据此返回 502 / 503 / 504。
+每次调用 (含失败) 记录一条运行事件。
+"""
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.config import settings
+from app.services.dify_client import dify_client
+from app.services.result_cache import default_app_id
+from app.services.run_events import elapsed_ms, run_events
+
+logger = logging.getLogger(__name__)
+
+
+class DifyRunError(Exception):
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+async def run_workflow_blocking(
+    inputs: Dict[str, Any],
+    user: str = "amz-user",
+    api_key: Optional[str] = None,
+    app_id: Optional[str] = None,
+    user_id: Optional[int] = None,
+    source: str = "workflow",
+) -> Dict[str, Any]:
+    """运行工作流并返回 Dify 响应中的 data 部分；app_id 为空表示使用全局 Key 的默认应用"""
+    started = time.perf_counter()
+    data: Dict[str, Any] = {}
+    status = "failed"
+    try:
+        data = await _post_workflow(inputs, user, api_key)
+        status = data.get("status") or "succeeded"
+    finally:
+        run_events.record(source, app_id or default_app_id(), user_id, status, elapsed_ms(started), data)
+
+    if status == "failed":
+        raise DifyRunError(data.get("error") or "工作流执行失败")
+    return data
+
+
+async def _post_workflow(inputs: Dict[str, Any], user: str, api_key: Optional[str]) -> Dict[str, Any]:
+    try:
+        response = await dify_client.service.post(
+            "/workflows/run",
+            headers={
+                "Authorization": f"Bearer {api_key or settings.dify_api_key}",
+                "Content-Type": "application/json"
+            },
+            json={
+                "inputs": inputs,
+                "response_mode": "blocking",
+                "user": user
+            },
+            timeout=dify_client.timeout("workflow_run")
+        )
+    except httpx.TimeoutException as e:
+        raise DifyRunError(f"调用Dify API超时: {str(e) or type(e).__name__}", retryable=True) from e
+    except httpx.RequestError as e:
+        raise DifyRunError(f"调用Dify API时发生错误: {str(e)}", retryable=True) from e
+
+    if response.status_code != 200:
+        # 429 与 5xx 属于暂时性错误
+        retryable = response.status_code == 429 or response.status_code >= 500
+        raise DifyRunError(f"Dify API返回错误: {response.status_code}", retryable=retryable)
+
+    return response.json().get("data", {})
+
+
+def extract_output_text(data: Dict[str, Any]) -> str:
+    return (data.get("outputs") or {}).get("text", "工作流执行成功")
@@ -0,0 +1,148 @@
+"""
+Dify 工作流流式运行 (response_mode=streaming) 的 SSE 转发
+
+逐行读取 Dify 返回的事件流并立即写给浏览器，不在内存中缓冲整段输出：
+StreamingResponse 在客户端读得慢时会阻塞写入，本生成器随之停止从 Dify 读取，
+背压沿 TCP 一路传回 Dify。
+"""
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+from anyio import CancelScope
+
+from app.database import AsyncSessionLocal
+from app.models import WorkflowHistory
+from app.services.dify_client import dify_client
+from app.services.run_events import elapsed_ms, run_events
+
+logger = logging.getLogger(__name__)
+
+# 转发给浏览器的 Dify 事件，其余事件 (如 node_finished 的大体积输出) 丢弃
+RELAYED_EVENTS = {"workflow_started", "node_started", "text_chunk", "workflow_finished", "error"}
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # 关闭 Nginx 等反向代理的响应缓冲
+    "X-Accel-Buffering": "no",
+}
+
+
+class WorkflowStreamResult:
+    """流结束后用于落库的运行结果"""
+
+    def __init__(self):
+        self.status: str = "cancelled"
+        self.outputs: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        # workflow_finished 事件的 data (含 elapsed_time / total_tokens / total_steps)
+        self.finished: Optional[Dict[str, Any]] = None
+        self.started = time.perf_counter()
+
+    @property
+    def output_text(self) -> str:
+        if self.error:
+            return self.error
+        if not self.outputs:
+            return ""
+        text = self.outputs.get("text")
+        if text is not None:
+            return text
+        return json.dumps(self.outputs, ensure_ascii=False)
+
+
+def format_sse(event: str, data: str) -> bytes:
+    return f"event: {event}\ndata: {data}\n\n".encode("utf-8")
+
+
+async def relay_workflow_stream(
+    api_key: str,
+    inputs: Dict[str, Any],
+    user: str,
+    result: WorkflowStreamResult,
+) -> AsyncIterator[bytes]:
+    """调用 Dify 流式接口，将事件转发为 SSE，并把最终状态记录到 result"""
+    try:
+        async with dify_client.service.stream(
+            "POST",
+            "/workflows/run",
+            json={"inputs": inputs, "response_mode": "streaming", "user": user},
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            },
+            timeout=dify_client.timeout("workflow_run"),
+        ) as response:
+            if response.status_code != 200:
+                body = (await response.aread()).decode("utf-8", errors="replace")
+                result.status = "failed"
+                result.error = f"Dify API返回错误: {response.status_code}"
+                logger.error("Dify 流式运行失败: %s - %s", response.status_code, body)
+                yield format_sse("error", json.dumps(
+                    {"status": response.status_code, "message": body}, ensure_ascii=False
+                ))
+                return
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                try:
+                    event = json.loads(payload)
+                except ValueError:
+                    continue
+
+                name = event.get("event")
+                if name == "ping":
+                    # SSE 注释行，保持代理连接不断开
+                    yield b": ping\n\n"
+                    continue
+                if name == "workflow_finished":
+                    data = event.get("data") or {}
+                    result.finished = data
+                    result.outputs = data.get("outputs")
+                    result.status = "completed" if data.get("status") == "succeeded" else "failed"
+                    if result.status == "failed":
+                        result.error = data.get("error") or "工作流执行失败"
+                elif name == "error":
+                    result.status = "failed"
+                    result.error = event.get("message") or "工作流执行失败"
+
+                if name in RELAYED_EVENTS:
+                    yield format_sse(name, payload)
+    except httpx.RequestError as e:
+        result.status = "failed"
+        result.error = f"调用Dify API时发生错误: {str(e)}"
+        logger.error("Dify 流式连接失败: %s", e)
+        yield format_sse("error", json.dumps({"message": result.error}, ensure_ascii=False))
+
+
+def record_stream_run(app_id: str, user_id: int, result: WorkflowStreamResult):
+    """流结束 (含客户端断开) 后记录运行事件"""
+    if result.finished:
+        status = result.finished.get("status") or "succeeded"
+    else:
+        status = "failed" if result.status == "failed" else "cancelled"
+    run_events.record("stream", app_id, user_id, status, elapsed_ms(result.started), result.finished)
+
+
+async def save_stream_history(user_id: int, name: str, input_data: str, result: WorkflowStreamResult):
+    """流结束 (含客户端断开) 后写入 WorkflowHistory"""
+    # 客户端断开时外层任务已被取消，屏蔽取消以保证记录能写完
+    with CancelScope(shield=True):
+        async with AsyncSessionLocal() as db:
+            try:
+                db.add(WorkflowHistory(
+                    user_id=user_id,
+                    name=name,
+                    input_data=input_data,
+                    output_data=result.output_text,
+                    status=result.status
+                ))
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                logger.error("保存流式运行记录失败: %s", e)
@@ -0,0 +1,255 @@
+"""
+HTML 商品页 -> 紧凑文本 (在进程池中执行，不依赖 app 配置，供子进程直接导入)
+
+lxml HTMLParser 的 target 接口按文档顺序回调 start / end / data，分块 feed，
+不构建 DOM 树，内存占用与页面大小无关：
+- 丢弃非内容节点 (script、style、svg、导航、页脚、按钮等) 下的全部文本
+- 识别 Amazon 商品页字段 (标题、价格、五点描述、描述、评分、评论数、图片、评论)，
+  识别到标题或五点描述时输出 ProductRawData 字段名的紧凑 JSON
+- 其他页面输出去除空白的可见文本，块级元素之间换行
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+from lxml import etree
+
+FEED_CHUNK_CHARS = 64 * 1024
+
+SKIP_TAGS = {
+    "script", "style", "noscript", "svg", "template", "iframe", "object", "canvas",
+    "nav", "footer", "header", "aside", "button", "select", "option",
+}
+# Amazon 页面的导航、推荐位、页脚等模块
+SKIP_IDS = {
+    "navbar", "nav-main", "nav-belt", "nav-subnav", "navFooter", "rhf", "skiplink",
+    "sp_detail", "sp_detail2", "sims-consolidated-1_feature_div", "HLCXComparisonWidget_feature_div",
+    "wayfinding-breadcrumbs_feature_div", "dp-ads-middle_feature_div",
+}
+BLOCK_TAGS = {
+    "p", "div", "li", "ul", "ol", "br", "tr", "table", "section", "article",
+    "h1", "h2", "h3", "h4", "h5", "h6", "title", "dd", "dt",
+}
+PRICE_CONTAINER_IDS = {
+    "corePrice_feature_div", "corePriceDisplay_desktop_feature_div", "apex_desktop",
+    "priceblock_ourprice", "priceblock_dealprice", "price",
+}
+REVIEW_HOOKS = {
+    "review-title": "title",
+    "review-body": "body",
+    "review-star-rating": "rating",
+    "cmps-review-star-rating": "rating",
+    "review-date": "date",
+}
+CURRENCIES = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "₹": "INR", "CA$": "CAD", "C$": "CAD"}
+
+_SPACES = re.compile(r"\s+")
+_NUMBER = re.compile(r"\d[\d,.]*")
+
+
+def _clean(text: str) -> str:
+    return _SPACES.sub(" ", text).strip()
+
+
+def _number(text: Optional[str]) -> Optional[str]:
+    match = _NUMBER.search(text or "")
+    return match.group(0) if match else None
+
+
+def _parse_price(text: str) -> Dict[str, Any]:
+    number = _number(text)
+    if number is None:
+        return {}
+    # 1.234,56 (欧洲格式) 与 1,234.56
+    if "," in number and number.rfind(",") > number.rfind("."):
+        number = number.replace(".", "").replace(",", ".")
+    else:
+        number = number.replace(",", "")
+    symbol = text[:text.find(number[0])].strip() if number[0] in text else ""
+    result: Dict[str, Any] = {"price": number}
+    if symbol in CURRENCIES:
+        result["currency"] = CURRENCIES[symbol]
+    return result
+
+
+class _Capture:
+    __slots__ = ("field", "depth", "parts")
+
+    def __init__(self, field: str, depth: int):
+        self.field = field
+        self.depth = depth
+        self.parts: List[str] = []
+
+
+class _PageCollector:
+    """lxml parser target"""
+
+    def __init__(self):
+        self.depth = 0
+        self.skip_depth = 0  # > 0 表示位于非内容节点内
+        self.scopes: List[tuple] = []  # (depth, 名称)：feature-bullets / altImages / 价格容器 / 评论
+        self.captures: List[_Capture] = []
+        self.text: List[str] = []
+        self.product: Dict[str, Any] = {}
+        self.bullets: List[str] = []
+        self.images: List[str] = []
+        self.reviews: List[Dict[str, Any]] = []
+        self.review: Optional[Dict[str, Any]] = None
+
+    def _in_scope(self, name: str) -> bool:
+        return any(scope == name for _, scope in self.scopes)
+
+    def _capture(self, field: str):
+        self.captures.append(_Capture(field, self.depth))
+
+    def _image(self, url: Optional[str]):
+        if url and url.startswith("http") and url not in self.images:
+            self.images.append(url)
+
+    def start(self, tag, attrib):
+        self.depth += 1
+        if self.skip_depth:
+            return
+        element_id = attrib.get("id", "")
+        if tag in SKIP_TAGS or element_id in SKIP_IDS:
+            self.skip_depth = self.depth
+            return
+        if tag in BLOCK_TAGS:
+            self._break()
+
+        classes = attrib.get("class", "").split()
+        hook = attrib.get("data-hook")
+        if element_id == "productTitle":
+            self._capture("title")
+        elif element_id == "productDescription":
+            self._capture("description")
+        elif element_id == "acrCustomerReviewText":
+            self._capture("review_count")
+        elif element_id == "acrPopover" and attrib.get("title"):
+            self.product.setdefault("rating", attrib["title"])
+        elif element_id == "feature-bullets":
+            self.scopes.append((self.depth, "bullets"))
+        elif element_id == "altImages":
+            self.scopes.append((self.depth, "images"))
+        elif element_id in PRICE_CONTAINER_IDS:
+            self.scopes.append((self.depth, "price"))
+        elif hook == "review":
+            self.scopes.append((self.depth, "review"))
+            self.review = {}
+        elif tag == "input" and (element_id == "ASIN" or attrib.get("name") == "ASIN"):
+            self.product.setdefault("asin", attrib.get("value"))
+
+        if tag == "li" and self._in_scope("bullets"):
+            self._capture("bullet")
+        elif tag == "img":
+            if element_id == "landingImage":
+                self._image(attrib.get("data-old-hires") or attrib.get("src"))
+            elif self._in_scope("images"):
+                self._image(attrib.get("src"))
+        elif "a-offscreen" in classes and "price" not in self.product and self._in_scope("price"):
+            self._capture("price")
+        elif self.review is not None:
+            if hook in REVIEW_HOOKS:
+                self._capture("review:" + REVIEW_HOOKS[hook])
+            elif "a-profile-name" in classes:
+                self._capture("review:author")
+
+    def end(self, tag):
+        if self.skip_depth:
+            if self.depth == self.skip_depth:
+                self.skip_depth = 0
+            self.depth -= 1
+            return
+        if tag in BLOCK_TAGS:
+            self._break()
+        while self.captures and self.captures[-1].depth == self.depth:
+            capture = self.captures.pop()
+            self._finish(capture.field, _clean("".join(capture.parts)))
+        while self.scopes and self.scopes[-1][0] == self.depth:
+            _, scope = self.scopes.pop()
+            if scope == "review" and self.review is not None:
+                if self.review.get("body") or self.review.get("title"):
+                    self.reviews.append(self.review)
+                self.review = None
+        self.depth -= 1
+
+    def _finish(self, field: str, value: str):
+        if not value:
+            return
+        if field == "bullet":
+            self.bullets.append(value)
+        elif field.startswith("review:"):
+            if self.review is not None:
+                self.review.setdefault(field[7:], value)
+        else:
+            self.product.setdefault(field, value)
+
+    def _break(self):
+        self.text.append("\n")
+        if self.captures:
+            self.captures[-1].parts.append(" ")
+
+    def data(self, data):
+        if self.skip_depth:
+            return
+        # 源码中的换行只是空白，输出的行只由块级元素划分
+        self.text.append(_SPACES.sub(" ", data))
+        # 只计入最内层字段：评论标题内嵌的星级不混进标题
+        if self.captures:
+            self.captures[-1].parts.append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return self
+
+
+def _product_fields(page: _PageCollector) -> Optional[Dict[str, Any]]:
+    product = page.product
+    if "title" not in product and not page.bullets:
+        return None
+    fields: Dict[str, Any] = {}
+    if product.get("asin"):
+        fields["asin"] = product["asin"]
+    if product.get("title"):
+        fields["title"] = product["title"]
+    if product.get("price"):
+        fields.update(_parse_price(product["price"]))
+    if page.images:
+        fields["images"] = page.images
+    if page.bullets:
+        fields["bullets"] = page.bullets
+    if product.get("description"):
+        fields["description"] = product["description"]
+    rating = _number(product.get("rating"))
+    if rating:
+        fields["rating"] = float(rating.replace(",", "."))
+    review_count = _number(product.get("review_count"))
+    if review_count:
+        fields["review_count"] = int(re.sub(r"\D", "", review_count))
+    if page.reviews:
+        for review in page.reviews:
+            if "rating" in review:
+                review["rating"] = float((_number(review["rating"]) or "0").replace(",", "."))
+        fields["reviews"] = page.reviews
+    return fields
+
+
+def _visible_text(page: _PageCollector) -> str:
+    lines = (_clean(line) for line in "".join(page.text).split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def compact_html(html: str) -> str:
+    """把 HTML 压缩为紧凑文本；识别为商品页时输出 JSON"""
+    page = _PageCollector()
+    parser = etree.HTMLParser(target=page, remove_comments=True, no_network=True)
+    for offset in range(0, len(html), FEED_CHUNK_CHARS):
+        parser.feed(html[offset:offset + FEED_CHUNK_CHARS])
+    parser.close()
+
+    fields = _product_fields(page)
+    if fields is not None:
+        return json.dumps(fields, ensure_ascii=False, separators=(",", ":"))
+    return _visible_text(page)
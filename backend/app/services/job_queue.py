@@ -0,0 +1,92 @@
+"""
+基于 Redis Streams 的工作流任务队列
+
+- 任务状态保存在 WorkflowHistory (queued / running / completed / failed)，
+  队列消息只携带 history_id
+- 消费组保证每条消息只投递给一个 worker；worker 崩溃后，超过 visibility timeout
+  仍未 ACK 的消息会被其他 worker 通过 XAUTOCLAIM 接管
+- 失败重试按指数退避写入延迟队列 (ZSET)，到期后重新投递
+"""
+import logging
+import random
+import time
+from typing import List, Tuple
+
+from app.cache import redis_client
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "amz:jobs:workflow"
+DELAYED_KEY = "amz:jobs:workflow:delayed"
+GROUP = "workflow-workers"
+
+
+async def ensure_group():
+    try:
+        await redis_client.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+    except Exception as e:
+        # BUSYGROUP: 消费组已存在
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+async def enqueue(history_id: int):
+    await redis_client.xadd(STREAM_KEY, {"history_id": str(history_id)})
+
+
+async def enqueue_many(history_ids: List[int]):
+    """一次往返投递多个任务"""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for history_id in history_ids:
+            pipe.xadd(STREAM_KEY, {"history_id": str(history_id)})
+        await pipe.execute()
+
+
+def retry_delay(attempt: int) -> float:
+    """指数退避 + 抖动，attempt 从 1 开始"""
+    base = settings.job_retry_base_delay * (2 ** (attempt - 1))
+    return base + random.uniform(0, base / 2)
+
+
+async def schedule_retry(history_id: int, attempt: int):
+    ready_at = time.time() + retry_delay(attempt)
+    await redis_client.zadd(DELAYED_KEY, {str(history_id): ready_at})
+
+
+async def promote_due() -> int:
+    """把到期的延迟任务移回主队列"""
+    due = await redis_client.zrangebyscore(DELAYED_KEY, 0, time.time(), start=0, num=100)
+    promoted = 0
+    for member in due:
+        # ZREM 成功的 worker 才负责投递，避免多个 worker 重复入队
+        if await redis_client.zrem(DELAYED_KEY, member):
+            await enqueue(int(member))
+            promoted += 1
+    return promoted
+
+
+def _parse(entries) -> List[Tuple[str, int]]:
+    return [(message_id.decode(), int(fields[b"history_id"])) for message_id, fields in entries]
+
+
+async def read(consumer: str, count: int, block_ms: int) -> List[Tuple[str, int]]:
+    response = await redis_client.xreadgroup(GROUP, consumer, {STREAM_KEY: ">"}, count=count, block=block_ms)
+    if not response:
+        return []
+    return _parse(response[0][1])
+
+
+async def reclaim(consumer: str, count: int) -> List[Tuple[str, int]]:
+    """接管超过 visibility timeout 仍未确认的消息 (原 worker 可能已崩溃)"""
+    result = await redis_client.xautoclaim(
+        STREAM_KEY, GROUP, consumer,
+        min_idle_time=int(settings.job_visibility_timeout * 1000),
+        start_id="0-0", count=count,
+    )
+    return _parse([entry for entry in result[1] if entry[1]])
+
+
+async def ack(message_id: str):
+    await redis_client.xack(STREAM_KEY, GROUP, message_id)
+    await redis_client.xdel(STREAM_KEY, message_id)
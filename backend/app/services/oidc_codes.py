@@ -0,0 +1,76 @@
+"""
+OIDC 授权码存储
+
+授权码只能使用一次、10 分钟内有效。/oauth/authorize 与 /oauth/token 可能落在
+不同的 worker / 副本上，因此生产环境使用 Redis (SET EX + GETDEL 原子取出)；
+本地开发可用进程内实现 (settings.oidc_code_store = "memory")。
+"""
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from app.cache import TTLCache, redis_client
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CODE_KEY_PREFIX = "amz:oidc:code:"
+
+
+class AuthCodeStore(ABC):
+    """授权码数据为 dict：user_id / client_id / redirect_uri / scope / nonce / code_challenge(_method)"""
+
+    @abstractmethod
+    async def save(self, code: str, data: dict):
+        """保存授权码，settings.oidc_code_ttl 秒后过期"""
+
+    @abstractmethod
+    async def take(self, code: str) -> Optional[dict]:
+        """原子地取出并删除授权码，不存在或已过期返回 None"""
+
+
+class MemoryCodeStore(AuthCodeStore):
+    """进程内实现，仅适用于单进程部署"""
+
+    def __init__(self, ttl: int, maxsize: int = 10000, sweep_interval: float = 60.0):
+        self._codes = TTLCache(maxsize, ttl)
+        self._sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+
+    async def save(self, code: str, data: dict):
+        # 写入时顺带清理过期未兑换的授权码，避免无限增长
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._codes.sweep()
+            self._next_sweep = now + self._sweep_interval
+        self._codes.set(code, data)
+
+    async def take(self, code: str) -> Optional[dict]:
+        return self._codes.take(code)
+
+
+class RedisCodeStore(AuthCodeStore):
+    """Redis 实现：过期由 Redis TTL 负责，GETDEL 保证多进程下只能兑换一次"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+
+    async def save(self, code: str, data: dict):
+        await redis_client.set(CODE_KEY_PREFIX + code, json.dumps(data), ex=self.ttl)
+
+    async def take(self, code: str) -> Optional[dict]:
+        raw = await redis_client.getdel(CODE_KEY_PREFIX + code)
+        return json.loads(raw) if raw else None
+
+
+def create_code_store() -> AuthCodeStore:
+    if settings.oidc_code_store == "memory":
+        return MemoryCodeStore(settings.oidc_code_ttl)
+    if settings.oidc_code_store != "redis":
+        logger.warning("未知的 oidc_code_store=%s，使用 redis", settings.oidc_code_store)
+    return RedisCodeStore(settings.oidc_code_ttl)
+
+
+auth_codes = create_code_store()
@@ -0,0 +1,88 @@
+"""
+OIDC 签名密钥
+
+进程启动时加载一次：
+- 配置了 oidc_keys_dir 时，目录下每个 <kid>.pem 是一把 RSA / EC 密钥 (RS256 / ES256)，
+  oidc_active_kid 指定当前签名用的密钥 (默认取文件名排序最后一个)，
+  其余密钥 (含仅公钥的 PEM) 继续在 JWKS 中发布，用于轮换窗口内校验旧 token。
+- 未配置时沿用 HS256 + settings.secret_key 派生的对称密钥 (kid=1)。
+
+轮换步骤：放入新密钥 → 重启 (JWKS 已发布新公钥，仍用旧 kid 签名) →
+等待 JWKS 缓存过期后切换 oidc_active_kid → id_token 全部过期后删除旧密钥。
+"""
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from authlib.jose import JsonWebKey, jwt
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+EC_CURVE_ALGS = {"P-256": "ES256", "P-384": "ES384", "P-521": "ES512"}
+
+
+class SigningKey:
+    def __init__(self, kid: str, alg: str, key: Any, public_jwk: Dict[str, Any], can_sign: bool = True):
+        self.kid = kid
+        self.alg = alg
+        self.key = key
+        self.public_jwk = public_jwk
+        self.can_sign = can_sign
+
+
+class OIDCKeySet:
+    def __init__(self, keys: List[SigningKey], active_kid: str):
+        self.keys = keys
+        self.active = next((key for key in keys if key.kid == active_kid), None)
+        if self.active is None or not self.active.can_sign:
+            raise ValueError(f"OIDC 签名密钥 {active_kid} 不存在或缺少私钥")
+        self._header = {"alg": self.active.alg, "kid": self.active.kid}
+
+    @property
+    def algorithms(self) -> List[str]:
+        return sorted({key.alg for key in self.keys})
+
+    def jwks(self) -> Dict[str, Any]:
+        return {"keys": [key.public_jwk for key in self.keys]}
+
+    def sign(self, payload: Dict[str, Any]) -> str:
+        return jwt.encode(self._header, payload, self.active.key).decode("utf-8")
+
+
+def _load_pem(kid: str, pem: bytes) -> SigningKey:
+    key = JsonWebKey.import_key(pem)
+    if key.kty == "RSA":
+        alg = "RS256"
+    elif key.kty == "EC":
+        alg = EC_CURVE_ALGS[key.as_dict()["crv"]]
+    else:
+        raise ValueError(f"不支持的密钥类型: {key.kty}")
+    public_jwk = key.as_dict(is_private=False)
+    public_jwk.update({"kid": kid, "alg": alg, "use": "sig"})
+    return SigningKey(kid, alg, key, public_jwk, can_sign=not key.public_only)
+
+
+def _shared_secret_key() -> SigningKey:
+    # 与旧实现一致：JWKS 中发布对称密钥，供 Dify 校验 HS256 id_token
+    jwk = {"kty": "oct", "k": settings.secret_key[:32], "alg": "HS256", "kid": "1"}
+    return SigningKey("1", "HS256", JsonWebKey.import_key(jwk), jwk)
+
+
+def load_key_set(keys_dir: Optional[str] = None, active_kid: Optional[str] = None) -> OIDCKeySet:
+    keys_dir = keys_dir or settings.oidc_keys_dir
+    if not keys_dir:
+        return OIDCKeySet([_shared_secret_key()], "1")
+
+    keys = [_load_pem(path.stem, path.read_bytes()) for path in sorted(Path(keys_dir).glob("*.pem"))]
+    if not keys:
+        raise ValueError(f"{keys_dir} 中没有 OIDC 签名密钥 (*.pem)")
+    signable = [key.kid for key in keys if key.can_sign]
+    active_kid = active_kid or settings.oidc_active_kid or (signable[-1] if signable else "")
+    key_set = OIDCKeySet(keys, active_kid)
+    logger.info("已加载 OIDC 密钥 %s，当前签名密钥 %s (%s)", [key.kid for key in keys], active_kid, key_set.active.alg)
+    return key_set
+
+
+oidc_keys = load_key_set()
@@ -0,0 +1,89 @@
+"""
+密码哈希与校验
+
+bcrypt 单次计算耗时数百毫秒，直接在 async 处理函数里执行会阻塞整个事件循环。
+这里把计算交给固定大小的线程池 (bcrypt 计算期间释放 GIL，可随核数扩展)，
+并限制排队深度：池子饱和时立即返回 429，而不是让请求无限堆积。
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.config import settings
+from app.metrics import PASSWORD_HASH_DURATION, PASSWORD_HASH_INFLIGHT
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(func, *args):
+    """在线程池内计时，只统计 bcrypt 计算本身"""
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        PASSWORD_HASH_DURATION.labels(op=func.__name__).observe(time.perf_counter() - started)
+
+
+class PasswordHasher:
+    def __init__(self, workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.workers = workers or settings.password_hash_workers or os.cpu_count() or 1
+        self.max_queue = settings.password_hash_max_queue if max_queue is None else max_queue
+        # rounds 变化后旧哈希会被标记为 needs_update，登录时透明重算
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__rounds=settings.bcrypt_rounds,
+        )
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self._inflight = 0
+
+    async def _run(self, func, *args):
+        if self._inflight >= self.workers + self.max_queue:
+            logger.warning("密码哈希线程池已满 (inflight=%s)，拒绝请求", self._inflight)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="登录请求过多，请稍后重试",
+                headers={"Retry-After": str(settings.password_hash_retry_after)},
+            )
+        future = self._executor.submit(_timed, func, *args)
+        self._inflight += 1
+        PASSWORD_HASH_INFLIGHT.inc()
+        # 请求被取消 (客户端断开) 时线程里的 bcrypt 仍在计算，直到 future 结束才归还名额
+        future.add_done_callback(self._finished(asyncio.get_running_loop()))
+        return await asyncio.wrap_future(future)
+
+    def _finished(self, loop: asyncio.AbstractEventLoop):
+        """线程池任务结束回调 (在工作线程中执行)，回到事件循环线程计数"""
+        def callback(future: Future):
+            try:
+                loop.call_soon_threadsafe(self._release)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+        return callback
+
+    def _release(self):
+        self._inflight -= 1
+        PASSWORD_HASH_INFLIGHT.dec()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """校验密码；若哈希参数已过时，同时返回按当前参数重算的新哈希"""
+        return await self._run(self.context.verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+password_hasher = PasswordHasher()
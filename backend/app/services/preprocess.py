@@ -0,0 +1,125 @@
+"""
+发往 Dify 之前的输入预处理
+
+工作流输入 (inputs.query) 是原始商品页 HTML 时，大部分 token 是标签、脚本和页面模板，
+直接拉长 LLM 耗时并增加费用。这里把 HTML 压缩为紧凑文本 / 商品字段 JSON (见 html_compact)：
+- 解析是 CPU 密集型操作，交给进程池执行，不阻塞事件循环，也不受 GIL 限制
+- 不像 HTML 或短于 preprocess_min_chars 的输入原样返回，不经过进程池
+- 进程池排队已满、超时 (preprocess_timeout) 或解析失败时原样返回并计数，预处理不会让运行失败；
+  排队上限按子进程实际完成计数，超时返回后仍在解析的任务继续占用名额
+- 子进程异常退出 (OOM、lxml 崩溃) 后进程池不可再用，丢弃并在下次调用时重建
+- 每次压缩记录输入 / 输出字符数与耗时 (日志 + 指标)
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from app.config import settings
+from app.metrics import PREPROCESS_CHARS, PREPROCESS_DURATION, PREPROCESS_SKIPPED
+from app.services.html_compact import compact_html
+
+logger = logging.getLogger(__name__)
+
+_HTML_MARKERS = re.compile(r"<(!doctype|html|head|body|div|span|p|table|ul|meta)\b", re.IGNORECASE)
+
+
+def looks_like_html(text: str) -> bool:
+    return _HTML_MARKERS.search(text, 0, 4096) is not None
+
+
+class InputPreprocessor:
+    def __init__(self, workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.workers = workers or settings.preprocess_workers or os.cpu_count() or 1
+        self.max_queue = settings.preprocess_max_queue if max_queue is None else max_queue
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn：不 fork 带着事件循环、日志线程和连接池的父进程
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        if self._executor is executor:
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _finished(self, loop: asyncio.AbstractEventLoop):
+        """子进程任务结束回调 (在进程池管理线程中执行)，回到事件循环线程计数"""
+        def callback(future: Future):
+            try:
+                loop.call_soon_threadsafe(self._release)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+        return callback
+
+    def _release(self):
+        self._inflight -= 1
+
+    async def warm(self):
+        """启动时拉起全部子进程并导入 lxml (spawn 冷启动需数秒)，避免首批请求超时回退"""
+        if not settings.preprocess_enabled:
+            return
+        loop = asyncio.get_running_loop()
+        pool = self._pool()
+        await asyncio.gather(*(loop.run_in_executor(pool, compact_html, "<p></p>") for _ in range(self.workers)))
+
+    async def compact(self, text: str) -> str:
+        """返回发给 Dify 的文本；无需或无法压缩时返回原文"""
+        if not settings.preprocess_enabled or len(text) < settings.preprocess_min_chars or not looks_like_html(text):
+            return text
+        if self._inflight >= self.workers + self.max_queue:
+            PREPROCESS_SKIPPED.labels(reason="saturated").inc()
+            logger.warning("预处理进程池已满 (inflight=%s)，原样发送 %s 字符", self._inflight, len(text))
+            return text
+
+        started = time.perf_counter()
+        executor = self._pool()
+        try:
+            future = executor.submit(compact_html, text)
+            self._inflight += 1
+            future.add_done_callback(self._finished(asyncio.get_running_loop()))
+            compacted = await asyncio.wait_for(asyncio.wrap_future(future), settings.preprocess_timeout)
+        except asyncio.TimeoutError:
+            PREPROCESS_SKIPPED.labels(reason="timeout").inc()
+            logger.warning("预处理超时，原样发送 %s 字符", len(text))
+            return text
+        except BrokenProcessPool as e:
+            PREPROCESS_SKIPPED.labels(reason="broken").inc()
+            logger.error("预处理子进程异常退出，重建进程池: %s", e)
+            self._discard(executor)
+            return text
+        except Exception as e:
+            PREPROCESS_SKIPPED.labels(reason="error").inc()
+            logger.warning("预处理失败，原样发送 %s 字符: %s", len(text), e)
+            return text
+
+        elapsed = time.perf_counter() - started
+        if not compacted:
+            PREPROCESS_SKIPPED.labels(reason="empty").inc()
+            return text
+        PREPROCESS_DURATION.observe(elapsed)
+        PREPROCESS_CHARS.labels(stage="input").inc(len(text))
+        PREPROCESS_CHARS.labels(stage="output").inc(len(compacted))
+        logger.info(
+            "输入预处理: %s -> %s 字符 (减少 %.1f%%)，耗时 %.1fms",
+            len(text), len(compacted), 100 * (1 - len(compacted) / len(text)), elapsed * 1000
+        )
+        return compacted
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._discard(self._executor)
+
+
+input_preprocessor = InputPreprocessor()
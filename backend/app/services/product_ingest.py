@@ -0,0 +1,214 @@
+"""
+商品采集入库
+
+浏览器插件按批提交结构化商品数据 (ProductRawData)：
+- 每条按 JSON 序列化结果 (pydantic 按模型字段顺序输出，不含 url，url 常带追踪参数) 计算 sha256 content_hash
+- 同一批内相同 (asin, marketplace) 只保留最后一条
+- 先用一次索引查询取回已有的 content_hash，哈希相同的商品直接跳过，不把整行发给数据库
+- 其余商品按 (marketplace, asin) 排序 (并发批次以相同顺序加行锁，避免死锁)，
+  一条 INSERT ... ON CONFLICT (asin, marketplace) DO UPDATE ... WHERE content_hash 不同，
+  SQLAlchemy 以多行 VALUES 分页发送；与预查询之间的并发写入同样不会产生无效更新，
+  RETURNING 只返回新增 / 变化的行
+- 可选为新增 / 变化的商品批量创建工作流任务；幂等键包含 content_hash，同一内容最多运行一次
+- 任务入队失败时任务记为 failed (attempts 为 0，从未执行) 并返回 503；商品已入库，
+  客户端重试同一批时内容未变化，此类任务按幂等键恢复为 queued 并重新入队，不会丢失
+"""
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, literal_column, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Product, WorkflowHistory
+from app.payloads import payload_columns
+from app.schemas.product import ProductIngestItem, ProductIngestResponse, ProductRawData
+from app.services import job_queue
+
+logger = logging.getLogger(__name__)
+
+CONTENT_COLUMNS = (
+    "url", "title", "price", "currency", "rating", "review_count",
+    "images", "bullets", "reviews", "description", "content_hash", "captured_by",
+)
+
+_insert = pg_insert(Product)
+UPSERT = _insert.on_conflict_do_update(
+    constraint="uq_products_asin_marketplace",
+    set_={**{column: _insert.excluded[column] for column in CONTENT_COLUMNS}, "updated_at": func.now()},
+    where=Product.content_hash != _insert.excluded.content_hash,
+).returning(
+    Product.id,
+    Product.asin,
+    Product.marketplace,
+    Product.content_hash,
+    # 本事务新插入的行 xmax 为 0，被更新的行不为 0
+    literal_column("xmax = 0").label("inserted"),
+)
+
+ENQUEUE_JOBS = pg_insert(WorkflowHistory).on_conflict_do_nothing(
+    constraint="uq_workflow_history_user_idempotency",
+).returning(WorkflowHistory.id, WorkflowHistory.idempotency_key)
+
+# 之前因入队失败而从未执行的任务 (走 (user_id, idempotency_key) 唯一索引)
+REQUEUE_JOBS_SQL = text("""
+    UPDATE workflow_history SET status = 'queued', error = NULL
+    WHERE user_id = :user_id AND idempotency_key = ANY(CAST(:keys AS varchar[]))
+      AND status = 'failed' AND attempts = 0
+    RETURNING id, idempotency_key
+""")
+
+
+class _Capture:
+    __slots__ = ("item", "content", "content_hash")
+
+    def __init__(self, item: ProductRawData):
+        self.item = item
+        # 同时作为工作流输入
+        self.content = item.model_dump_json(exclude={"url"})
+        self.content_hash = hashlib.sha256(self.content.encode("utf-8")).digest()
+
+    def row(self, user_id: int) -> Dict[str, Any]:
+        item = self.item
+        return {
+            "asin": item.asin,
+            "marketplace": item.marketplace,
+            "url": item.url,
+            "title": item.title,
+            "price": item.price,
+            "currency": item.currency,
+            "rating": item.rating,
+            "review_count": item.review_count,
+            "images": item.images,
+            "bullets": item.bullets,
+            "reviews": [review.model_dump() for review in item.reviews],
+            "description": item.description,
+            "content_hash": self.content_hash,
+            "captured_by": user_id,
+        }
+
+
+# 以两个数组参数传入整批键：语句文本与批大小无关，asyncpg 预编译语句可复用
+STORED_HASHES_SQL = text("""
+    SELECT p.marketplace, p.asin, p.id, p.content_hash
+    FROM unnest(CAST(:marketplaces AS varchar[]), CAST(:asins AS varchar[])) AS k(marketplace, asin)
+    JOIN products AS p ON p.marketplace = k.marketplace AND p.asin = k.asin
+""")
+
+
+async def _stored_hashes(db: AsyncSession, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Tuple[int, bytes]]:
+    """(marketplace, asin) -> (商品 ID, content_hash)"""
+    rows = await db.execute(
+        STORED_HASHES_SQL,
+        {"marketplaces": [marketplace for marketplace, _ in keys], "asins": [asin for _, asin in keys]}
+    )
+    return {(marketplace, asin): (product_id, content_hash) for marketplace, asin, product_id, content_hash in rows}
+
+
+def _idempotency_key(marketplace: str, asin: str, content_hash: bytes) -> str:
+    return f"product:{marketplace}:{asin}:{content_hash.hex()[:32]}"
+
+
+async def _enqueue_runs(
+    db: AsyncSession, user_id: int, changed: List[Any], captures: Dict[Tuple[str, str], _Capture]
+) -> Dict[str, int]:
+    """为变化的商品创建 queued 任务 (已存在相同幂等键的跳过)，返回 幂等键 -> 任务 ID"""
+    rows = [
+        {
+            "user_id": user_id,
+            "name": f"{row.asin} ({row.marketplace})",
+            **payload_columns("input", captures[(row.marketplace, row.asin)].content),
+            "status": "queued",
+            "attempts": 0,
+            "idempotency_key": _idempotency_key(row.marketplace, row.asin, row.content_hash),
+        }
+        for row in changed
+    ]
+    return {key: job_id for job_id, key in (await db.execute(ENQUEUE_JOBS, rows)).all()}
+
+
+async def _requeue_unsent(db: AsyncSession, user_id: int, keys: List[str]) -> Dict[str, int]:
+    """恢复从未执行的入队失败任务，返回 幂等键 -> 任务 ID"""
+    if not keys:
+        return {}
+    rows = await db.execute(REQUEUE_JOBS_SQL, {"user_id": user_id, "keys": keys})
+    return {key: job_id for job_id, key in rows}
+
+
+async def ingest_products(
+    db: AsyncSession, items: List[ProductRawData], user_id: int, run: bool = False
+) -> ProductIngestResponse:
+    captures = {(item.marketplace, item.asin): _Capture(item) for item in items}
+    stored = await _stored_hashes(db, list(captures))
+    pending = sorted(
+        key for key, capture in captures.items() if key not in stored or stored[key][1] != capture.content_hash
+    )
+
+    changed: List[Any] = []
+    jobs: Dict[str, int] = {}
+    requeued: List[Tuple[int, str, str, bytes]] = []
+    if pending:
+        changed = (await db.execute(UPSERT, [captures[key].row(user_id) for key in pending])).all()
+        if run and changed:
+            jobs = await _enqueue_runs(db, user_id, changed, captures)
+    if run:
+        # 幂等键已存在的任务 (内容未变化，或变回了之前的内容) 可能上一次因入队失败而从未执行
+        unchanged = {
+            _idempotency_key(marketplace, asin, content_hash): (product_id, asin, marketplace, content_hash)
+            for (marketplace, asin), (product_id, content_hash) in stored.items()
+            if captures[(marketplace, asin)].content_hash == content_hash
+        }
+        existing = [
+            key for key in (_idempotency_key(row.marketplace, row.asin, row.content_hash) for row in changed)
+            if key not in jobs
+        ]
+        revived = await _requeue_unsent(db, user_id, list(unchanged) + existing)
+        jobs.update(revived)
+        requeued = [unchanged[key] for key in revived if key in unchanged]
+    await db.commit()
+
+    if jobs:
+        try:
+            await job_queue.enqueue_many(list(jobs.values()))
+        except Exception as e:
+            logger.error("商品任务入队失败 (%s 个): %s", len(jobs), e)
+            await db.execute(
+                update(WorkflowHistory)
+                .where(WorkflowHistory.id.in_(list(jobs.values())))
+                .values(status="failed", error=f"任务入队失败: {str(e)}")
+            )
+            await db.commit()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="商品已入库，但任务队列不可用，请稍后重试"
+            )
+
+    inserted = sum(1 for row in changed if row.inserted)
+    results: List[ProductIngestItem] = []
+    for row in changed:
+        job_id: Optional[int] = jobs.get(_idempotency_key(row.marketplace, row.asin, row.content_hash))
+        results.append(ProductIngestItem(
+            product_id=row.id,
+            asin=row.asin,
+            marketplace=row.marketplace,
+            result="inserted" if row.inserted else "updated",
+            job_id=job_id,
+        ))
+    for product_id, asin, marketplace, content_hash in requeued:
+        results.append(ProductIngestItem(
+            product_id=product_id,
+            asin=asin,
+            marketplace=marketplace,
+            result="requeued",
+            job_id=jobs[_idempotency_key(marketplace, asin, content_hash)],
+        ))
+    return ProductIngestResponse(
+        received=len(items),
+        inserted=inserted,
+        updated=len(changed) - inserted,
+        unchanged=len(captures) - len(changed),
+        queued=len(jobs),
+        items=results,
+    )
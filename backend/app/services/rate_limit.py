@@ -0,0 +1,111 @@
+"""
+Dify 相关接口的令牌桶限流 (Redis，多 worker 共享同一组桶)
+
+每个桶是一个 Redis hash {t: 剩余令牌, ts: 上次补充时间(毫秒)}，由 Lua 脚本按 Redis 服务器时间补充并扣减，
+一次请求涉及的多个桶 (用户 + 应用) 在同一个脚本里原子地检查：任一桶不足则都不扣减，返回需要等待的毫秒数。
+
+- 交互请求: check() 不足时立即返回 429 + Retry-After
+- 批量运行: acquire() 在独立的 batch 桶上等待，不与交互请求争抢令牌
+- Redis 不可用时放行 (fail-open) 并记录警告，限流不应成为新的单点故障
+"""
+import asyncio
+import logging
+import math
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from app.cache import redis_client
+from app.config import settings
+from app.metrics import ADMISSION_REJECTED
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "amz:rl:"
+
+# KEYS: 桶；ARGV: 每个桶的 rate (个/秒)、burst 依次排列。返回 0 表示已扣减，否则为需要等待的毫秒数
+TOKEN_BUCKET_LUA = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local wait = 0
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 't', 'ts')
+    local t = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    t = math.min(burst, t + math.max(0, now - ts) * rate / 1000)
+    tokens[i] = t
+    if t < 1 then
+        wait = math.max(wait, math.ceil((1 - t) * 1000 / rate))
+    end
+end
+if wait > 0 then
+    return wait
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 't', tostring(tokens[i] - 1), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst * 1000 / rate) + 1000)
+end
+return 0
+"""
+
+Bucket = Tuple[str, float, int]
+
+
+def user_bucket(user_id: int) -> Bucket:
+    return f"{KEY_PREFIX}user:{user_id}", settings.rate_limit_user_rate, settings.rate_limit_user_burst
+
+
+def app_bucket(app_id: str) -> Bucket:
+    return f"{KEY_PREFIX}app:{app_id}", settings.rate_limit_app_rate, settings.rate_limit_app_burst
+
+
+def batch_bucket(app_id: str) -> Bucket:
+    return f"{KEY_PREFIX}batch:{app_id}", settings.batch_app_rate_limit, settings.batch_app_rate_burst
+
+
+class RateLimiter:
+    def __init__(self):
+        self._script = redis_client.register_script(TOKEN_BUCKET_LUA)
+
+    async def try_acquire(self, buckets: List[Bucket]) -> float:
+        """所有桶各扣一个令牌；返回 0 表示成功，否则为需要等待的秒数"""
+        if not settings.rate_limit_enabled:
+            return 0.0
+        keys = [key for key, _, _ in buckets]
+        args = [value for _, rate, burst in buckets for value in (rate, burst)]
+        try:
+            wait_ms = await self._script(keys=keys, args=args)
+        except Exception as e:
+            logger.warning("限流脚本执行失败，放行请求: %s", e)
+            return 0.0
+        return int(wait_ms) / 1000
+
+    async def check(self, user_id: int, app_id: Optional[str] = None):
+        """交互请求准入：用户桶与应用桶任一耗尽时返回 429"""
+        buckets = [user_bucket(user_id)]
+        if app_id is not None:
+            buckets.append(app_bucket(app_id))
+        wait = await self.try_acquire(buckets)
+        if wait > 0:
+            ADMISSION_REJECTED.labels(reason="rate_limited").inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="请求过于频繁，请稍后重试",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+    async def acquire(self, bucket: Bucket):
+        """批量运行：等待直到取得令牌"""
+        while True:
+            wait = await self.try_acquire([bucket])
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,234 @@
+"""
+Dify 工作流结果缓存 (settings.result_cache_enabled 开启)
+
+同一应用、同一版本、同一 inputs 的运行结果直接从 Redis 返回：
+- key = amz:result:{app_id}:{version}:{sha256(规范化 inputs)}，version 取 Dify 应用的 updated_at，
+  应用发布/修改后旧结果自然失效；另有 TTL 兜底。/api/workflows/run 的默认应用按
+  settings.dify_api_key 在 Dify 库 api_tokens 中查出应用 ID 后同样取 updated_at；
+  查不到时版本固定为 "static"，只能依赖 result_cache_unversioned_ttl 失效
+- 容量：单条超过 result_cache_max_entry_bytes 不缓存；索引 ZSET 按写入时间淘汰最旧的条目，
+  总条数不超过 result_cache_max_entries
+- single-flight：进程内相同 key 共享一个 Future；跨进程用 Redis 锁 (值为本次令牌，只释放自己的锁)，
+  未抢到锁的请求轮询结果
+- 请求头 X-Result-Cache: bypass 跳过读取，但会用新结果覆盖缓存
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.cache import TTLCache, redis_client, release_lock
+from app.config import settings
+from app.database import dify_engine
+from app.metrics import RESULT_CACHE_REQUESTS
+from app.services.dify_catalogue import dify_catalogue
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "amz:result:"
+INDEX_KEY = "amz:result:index"
+BYPASS_HEADER = "X-Result-Cache"
+UNVERSIONED = "static"
+
+DEFAULT_APP_QUERY = text("SELECT app_id FROM api_tokens WHERE token = :token AND type = 'app' LIMIT 1")
+
+
+def inputs_digest(inputs: Dict[str, Any]) -> str:
+    """键排序、无多余空白的 JSON，字段顺序不同的相同 inputs 得到同一个摘要"""
+    canonical = json.dumps(inputs, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def cache_key(app_id: str, version: str, inputs: Dict[str, Any]) -> str:
+        return f"{KEY_PREFIX}{app_id}:{version}:{inputs_digest(inputs)}"
+
+    async def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await redis_client.get(key)
+        except Exception as e:
+            logger.warning("读取结果缓存失败: %s", e)
+            return None
+        return json.loads(raw) if raw else None
+
+    async def _write(self, key: str, value: Dict[str, Any], ttl: int):
+        raw = json.dumps(value, ensure_ascii=False)
+        if len(raw.encode("utf-8")) > settings.result_cache_max_entry_bytes:
+            return
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.set(key, raw, ex=ttl)
+            pipe.zadd(INDEX_KEY, {key: time.time()})
+            pipe.zcard(INDEX_KEY)
+            size = (await pipe.execute())[-1]
+            overflow = size - settings.result_cache_max_entries
+            if overflow > 0:
+                evicted = [member for member, _ in await redis_client.zpopmin(INDEX_KEY, overflow)]
+                if evicted:
+                    await redis_client.delete(*evicted)
+        except Exception as e:
+            logger.warning("写入结果缓存失败: %s", e)
+
+    async def _run_and_store(self, key: str, run, should_cache, ttl: int) -> Dict[str, Any]:
+        value = await run()
+        if should_cache(value):
+            await self._write(key, value, ttl)
+        return value
+
+    async def _run_with_lock(self, key: str, run, should_cache, ttl: int) -> Tuple[Dict[str, Any], str]:
+        """跨进程 single-flight：抢到锁的进程执行，其余进程等待其写入结果"""
+        lock_key = key + ":lock"
+        token = uuid.uuid4().hex
+        timeout = settings.dify_timeout_workflow_run + settings.dify_connect_timeout
+        try:
+            acquired = await redis_client.set(lock_key, token, nx=True, ex=int(timeout) + 1)
+        except Exception as e:
+            logger.warning("获取结果缓存锁失败: %s", e)
+            acquired = True
+
+        if not acquired:
+            deadline = time.monotonic() + timeout
+            delay = 0.05
+            while time.monotonic() < deadline:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.5)
+                cached = await self._read(key)
+                if cached is not None:
+                    return cached, "coalesced"
+                try:
+                    if not await redis_client.exists(lock_key):
+                        # 持锁方失败 (失败结果不缓存)，由本请求自己执行
+                        break
+                except Exception:
+                    break
+
+        try:
+            return await self._run_and_store(key, run, should_cache, ttl), "miss"
+        finally:
+            if acquired:
+                try:
+                    # 执行超过锁的有效期时锁可能已被其他进程取得，不能直接 DEL
+                    await release_lock(lock_key, token)
+                except Exception as e:
+                    logger.warning("释放结果缓存锁失败: %s", e)
+
+    async def get_or_run(
+        self,
+        app_id: str,
+        version: Optional[str],
+        inputs: Dict[str, Any],
+        run: Callable[[], Awaitable[Dict[str, Any]]],
+        bypass: bool = False,
+        should_cache: Callable[[Dict[str, Any]], bool] = lambda value: True,
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        返回 (结果, 缓存状态)；状态为 hit / miss / coalesced / bypass / disabled。
+        run 抛出的异常不会被缓存；should_cache 用于排除以正常响应返回的失败结果。
+        version 为 UNVERSIONED 时结果只保留 result_cache_unversioned_ttl 秒。
+        """
+        if not settings.result_cache_enabled or version is None:
+            return await run(), "disabled"
+
+        key = self.cache_key(app_id, version, inputs)
+        ttl = settings.result_cache_unversioned_ttl if version == UNVERSIONED else settings.result_cache_ttl
+        if bypass:
+            value = await self._run_and_store(key, run, should_cache, ttl)
+            RESULT_CACHE_REQUESTS.labels(result="bypass").inc()
+            return value, "bypass"
+
+        cached = await self._read(key)
+        if cached is not None:
+            RESULT_CACHE_REQUESTS.labels(result="hit").inc()
+            return cached, "hit"
+
+        # 进程内 single-flight
+        future = self._inflight.get(key)
+        if future is not None:
+            try:
+                value = await asyncio.shield(future)
+                RESULT_CACHE_REQUESTS.labels(result="coalesced").inc()
+                return value, "coalesced"
+            except asyncio.CancelledError:
+                # 发起请求的客户端断开导致执行被取消，本请求自己执行；本请求被取消时照常抛出
+                if not future.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value, state = await self._run_with_lock(key, run, should_cache, ttl)
+            future.set_result(value)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        RESULT_CACHE_REQUESTS.labels(result=state).inc()
+        return value, state
+
+
+def is_bypass(header_value: Optional[str]) -> bool:
+    return (header_value or "").strip().lower() in ("bypass", "no-cache", "refresh")
+
+
+async def app_version(app_id: str) -> Optional[str]:
+    """Dify 应用目录中的 updated_at；缓存关闭或应用未知时返回 None (不缓存)"""
+    if not settings.result_cache_enabled:
+        return None
+    try:
+        app = await dify_catalogue.get_app(app_id)
+    except Exception as e:
+        logger.warning("读取应用 %s 版本失败，跳过结果缓存: %s", app_id, e)
+        return None
+    return (app or {}).get("updated_at")
+
+
+def default_app_id() -> str:
+    """/api/workflows/run 使用的默认应用 (settings.dify_api_key) 在本服务内的标识"""
+    return "default-" + hashlib.sha256(settings.dify_api_key.encode()).hexdigest()[:12]
+
+
+# 默认 Key 对应的 Dify 应用 ID；找不到时记为 "" (同样缓存，过期后重查)
+_default_app = TTLCache(maxsize=1, ttl=300)
+
+
+async def default_app_version() -> Optional[str]:
+    """
+    默认应用的版本：按 settings.dify_api_key 在 Dify 库中查出应用 ID 后取 updated_at；
+    无法确定时返回 UNVERSIONED (结果只按较短的 TTL 缓存)，缓存关闭时返回 None
+    """
+    if not settings.result_cache_enabled:
+        return None
+    app_id = _default_app.get(settings.dify_api_key)
+    if app_id is None:
+        if dify_engine is None:
+            return UNVERSIONED
+        try:
+            async with dify_engine.connect() as conn:
+                app_id = await conn.scalar(DEFAULT_APP_QUERY, {"token": settings.dify_api_key})
+        except Exception as e:
+            logger.warning("查询默认 Key 对应的 Dify 应用失败: %s", e)
+            return UNVERSIONED
+        app_id = str(app_id) if app_id else ""
+        _default_app.set(settings.dify_api_key, app_id)
+    if not app_id:
+        return UNVERSIONED
+    return await app_version(app_id) or UNVERSIONED
+
+
+result_cache = ResultCache()
@@ -0,0 +1,111 @@
+"""
+Dify 工作流运行事件记录
+
+每次实际调用 Dify (阻塞、流式、批量、后台任务) 结束后记录一条事件：本服务测得的耗时，
+以及 Dify 返回的 elapsed_time / total_tokens / total_steps。结果缓存命中不调用 Dify，不记录。
+
+record() 只把事件放进进程内缓冲区，不在请求路径上访问数据库；后台任务每 run_events_flush_interval 秒
+(或缓冲达到 run_events_flush_size 条) 以一条多行 INSERT 写入 workflow_run_events。
+缓冲区超过 run_events_buffer_max 时丢弃新事件并计数，数据库故障不会拖垮运行接口。
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.metrics import RUN_EVENTS_DROPPED
+from app.models import WorkflowRunEvent
+
+logger = logging.getLogger(__name__)
+
+
+def _int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def elapsed_ms(started: float) -> int:
+    """started 为 time.perf_counter() 的读数"""
+    return int((time.perf_counter() - started) * 1000)
+
+
+class RunEventRecorder:
+    def __init__(self):
+        self._buffer: List[Dict[str, Any]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def record(
+        self,
+        source: str,
+        app_id: str,
+        user_id: Optional[int],
+        status: str,
+        wall_ms: int,
+        data: Optional[Dict[str, Any]] = None,
+    ):
+        """data 为 Dify 响应 (或 workflow_finished 事件) 中的 data 部分"""
+        if len(self._buffer) >= settings.run_events_buffer_max:
+            RUN_EVENTS_DROPPED.inc()
+            return
+        data = data or {}
+        elapsed = data.get("elapsed_time")
+        self._buffer.append({
+            "app_id": app_id,
+            "user_id": user_id,
+            "source": source,
+            "status": status,
+            "wall_ms": wall_ms,
+            "dify_elapsed_ms": int(float(elapsed) * 1000) if isinstance(elapsed, (int, float)) else None,
+            "total_tokens": _int(data.get("total_tokens")),
+            "total_steps": _int(data.get("total_steps")),
+            "workflow_run_id": data.get("id") or data.get("workflow_run_id"),
+        })
+        if len(self._buffer) >= settings.run_events_flush_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(WorkflowRunEvent), rows)
+                await db.commit()
+        except Exception as e:
+            RUN_EVENTS_DROPPED.inc(len(rows))
+            logger.error("写入运行事件失败，丢弃 %s 条: %s", len(rows), e)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.run_events_flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """等待正在进行的写入结束 (不取消，避免丢失已取出的事件)，再写入剩余事件"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+run_events = RunEventRecorder()
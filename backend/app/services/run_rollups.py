@@ -0,0 +1,216 @@
+"""
+运行事件的小时汇总与查询
+
+后台任务每 run_rollup_interval 秒把 workflow_run_events 汇总进 workflow_run_rollups：
+- 一次扫描，GROUPING SETS 同时得到 按应用 / 按用户 / 全部 三个维度的每小时运行数、失败数、
+  耗时 p50/p95 (本服务测得与 Dify elapsed_time 各一组)、token 与步数
+- 每次整小时重算 (上次汇总时间 - run_rollup_lookback_hours) 之后的数据并 upsert，
+  结果幂等，晚到的事件 (缓冲写入、后台任务进程) 在下一轮被补上
+- 多 worker 部署时用 Redis 锁 (SET NX EX) 保证每个周期只有一个进程执行
+- 顺带分批删除超过 run_events_retention_days 的原始事件
+
+跨小时的 p95 无法由小时 p95 精确合并，区间汇总返回各小时 p95 的最大值 (最差小时)。
+"""
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import redis_client
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import WorkflowRunRollup
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "amz:analytics:rollup_lock"
+WATERMARK_KEY = "amz:analytics:rollup_watermark"
+
+ROLLUP_SQL = """
+    INSERT INTO workflow_run_rollups (
+        dimension, key, hour, runs, failed, wall_ms_total, wall_ms_p50, wall_ms_p95,
+        dify_ms_p50, dify_ms_p95, total_tokens, total_steps, updated_at
+    )
+    SELECT
+        CASE WHEN GROUPING(app_id) = 0 THEN 'app' WHEN GROUPING(user_id) = 0 THEN 'user' ELSE 'all' END,
+        CASE WHEN GROUPING(app_id) = 0 THEN app_id WHEN GROUPING(user_id) = 0 THEN user_id::text ELSE '' END,
+        hour,
+        count(*),
+        count(*) FILTER (WHERE status <> 'succeeded'),
+        sum(wall_ms),
+        percentile_disc(0.5) WITHIN GROUP (ORDER BY wall_ms),
+        percentile_disc(0.95) WITHIN GROUP (ORDER BY wall_ms),
+        percentile_disc(0.5) WITHIN GROUP (ORDER BY dify_elapsed_ms),
+        percentile_disc(0.95) WITHIN GROUP (ORDER BY dify_elapsed_ms),
+        coalesce(sum(total_tokens), 0),
+        coalesce(sum(total_steps), 0),
+        now()
+    FROM (
+        SELECT date_trunc('hour', created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS hour, *
+        FROM workflow_run_events
+        WHERE created_at >= :since
+    ) AS events
+    GROUP BY GROUPING SETS ((hour, app_id), (hour, user_id), (hour))
+    HAVING GROUPING(user_id) = 1 OR user_id IS NOT NULL
+    ON CONFLICT (dimension, key, hour) DO UPDATE SET
+        runs = EXCLUDED.runs,
+        failed = EXCLUDED.failed,
+        wall_ms_total = EXCLUDED.wall_ms_total,
+        wall_ms_p50 = EXCLUDED.wall_ms_p50,
+        wall_ms_p95 = EXCLUDED.wall_ms_p95,
+        dify_ms_p50 = EXCLUDED.dify_ms_p50,
+        dify_ms_p95 = EXCLUDED.dify_ms_p95,
+        total_tokens = EXCLUDED.total_tokens,
+        total_steps = EXCLUDED.total_steps,
+        updated_at = EXCLUDED.updated_at
+"""
+
+PRUNE_SQL = """
+    DELETE FROM workflow_run_events
+    WHERE id IN (
+        SELECT id FROM workflow_run_events WHERE created_at < :cutoff LIMIT :batch
+    )
+"""
+
+# 区间汇总的排序参数 -> 汇总列
+SUMMARY_SORTS = {"runs": "runs", "failed": "failed", "tokens": "total_tokens", "p95": "wall_ms_p95"}
+
+
+def _hour_floor(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+class RunRollupAggregator:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._owner = f"{socket.gethostname()}-{os.getpid()}"
+
+    async def run_once(self) -> int:
+        """重算回看窗口内的小时汇总并清理过期事件，返回 upsert 的行数"""
+        started = datetime.now(timezone.utc)
+        raw = await redis_client.get(WATERMARK_KEY)
+        watermark = datetime.fromtimestamp(float(raw), timezone.utc) if raw else (
+            started - timedelta(days=settings.run_events_retention_days)
+        )
+        since = _hour_floor(min(watermark, started) - timedelta(hours=settings.run_rollup_lookback_hours))
+
+        async with AsyncSessionLocal() as db:
+            upserted = (await db.execute(text(ROLLUP_SQL), {"since": since})).rowcount
+            await db.commit()
+
+            cutoff = started - timedelta(days=settings.run_events_retention_days)
+            pruned = 0
+            while True:
+                deleted = (await db.execute(
+                    text(PRUNE_SQL), {"cutoff": cutoff, "batch": settings.run_events_prune_batch}
+                )).rowcount
+                await db.commit()
+                pruned += deleted
+                if deleted < settings.run_events_prune_batch:
+                    break
+
+        await redis_client.set(WATERMARK_KEY, str(started.timestamp()))
+        logger.info("运行汇总完成: 自 %s 起 %s 行，清理过期事件 %s 条", since.isoformat(), upserted, pruned)
+        return upserted
+
+    async def _run(self):
+        while True:
+            try:
+                # 锁不主动释放，过期即下一个周期：整个集群每周期最多汇总一次
+                if await redis_client.set(LOCK_KEY, self._owner, nx=True, ex=settings.run_rollup_interval):
+                    await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("运行汇总失败: %s", e)
+            await asyncio.sleep(settings.run_rollup_interval)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def _rollup_row(row: WorkflowRunRollup) -> Dict[str, Any]:
+    return {
+        "hour": row.hour.isoformat(),
+        "runs": row.runs,
+        "failed": row.failed,
+        "wall_ms_avg": row.wall_ms_total // row.runs if row.runs else None,
+        "wall_ms_p50": row.wall_ms_p50,
+        "wall_ms_p95": row.wall_ms_p95,
+        "dify_ms_p50": row.dify_ms_p50,
+        "dify_ms_p95": row.dify_ms_p95,
+        "total_tokens": row.total_tokens,
+        "total_steps": row.total_steps,
+    }
+
+
+async def fetch_series(
+    db: AsyncSession, dimension: str, key: str, since: datetime, until: datetime
+) -> List[Dict[str, Any]]:
+    """某个应用 / 用户 (或全部) 在区间内的逐小时汇总"""
+    rows = (await db.scalars(
+        select(WorkflowRunRollup)
+        .where(
+            WorkflowRunRollup.dimension == dimension,
+            WorkflowRunRollup.key == key,
+            WorkflowRunRollup.hour >= _hour_floor(since),
+            WorkflowRunRollup.hour < until,
+        )
+        .order_by(WorkflowRunRollup.hour)
+    )).all()
+    return [_rollup_row(row) for row in rows]
+
+
+async def fetch_summary(
+    db: AsyncSession, dimension: str, since: datetime, until: datetime, sort: str, limit: int
+) -> List[Dict[str, Any]]:
+    """区间内按应用 / 用户汇总，按 sort 降序取前 limit 个"""
+    rollup = WorkflowRunRollup
+    columns = {
+        "runs": func.sum(rollup.runs).label("runs"),
+        "failed": func.sum(rollup.failed).label("failed"),
+        "wall_ms_total": func.sum(rollup.wall_ms_total).label("wall_ms_total"),
+        "wall_ms_p95": func.max(rollup.wall_ms_p95).label("wall_ms_p95"),
+        "dify_ms_p95": func.max(rollup.dify_ms_p95).label("dify_ms_p95"),
+        "total_tokens": func.sum(rollup.total_tokens).label("total_tokens"),
+        "total_steps": func.sum(rollup.total_steps).label("total_steps"),
+    }
+    rows = (await db.execute(
+        select(rollup.key, *columns.values())
+        .where(rollup.dimension == dimension, rollup.hour >= _hour_floor(since), rollup.hour < until)
+        .group_by(rollup.key)
+        .order_by(columns[SUMMARY_SORTS[sort]].desc().nulls_last(), rollup.key)
+        .limit(limit)
+    )).all()
+    return [
+        {
+            "key": row.key,
+            "runs": row.runs,
+            "failed": row.failed,
+            "wall_ms_avg": row.wall_ms_total // row.runs if row.runs else None,
+            "wall_ms_p95_max": row.wall_ms_p95,
+            "dify_ms_p95_max": row.dify_ms_p95,
+            "total_tokens": row.total_tokens,
+            "tokens_per_run": row.total_tokens // row.runs if row.runs else None,
+            "total_steps": row.total_steps,
+        }
+        for row in rows
+    ]
+
+
+run_rollups = RunRollupAggregator()
@@ -0,0 +1,165 @@
+"""
+管理后台统计与登录页初始化状态
+
+- 用户统计：一次扫描 users，COUNT(*) FILTER 同时得到总数 / 激活 / 管理员，另附按天注册数
+- Dify 统计：从 dify_engine 读取应用数、工作流运行数 (按状态) 与按天运行数
+- 结果以 JSON 缓存在 Redis (stats_users_ttl / stats_dify_ttl 秒)；用户注册、授权、禁用、删除
+  与创建 Dify 应用时删除对应的键，下次请求重新计算；同一进程内的并发未命中只计算一次
+- 初始化状态 (是否已有用户) 只缓存 true，删除用户后失效
+"""
+import asyncio
+import json
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import exists, func, select, text
+
+from app.cache import redis_client
+from app.config import settings
+from app.database import AsyncSessionLocal, dify_engine
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+USER_STATS_KEY = "amz:stats:users"
+DIFY_STATS_KEY = "amz:stats:dify"
+HAS_USERS_KEY = "amz:stats:has_users"
+
+DIFY_TOTALS_QUERY = """
+    SELECT
+        (SELECT count(*) FROM apps) AS total_apps,
+        count(*) AS total_runs,
+        count(*) FILTER (WHERE status = 'succeeded') AS succeeded_runs,
+        count(*) FILTER (WHERE status = 'failed') AS failed_runs
+    FROM workflow_runs
+"""
+
+DIFY_RUN_SERIES_QUERY = """
+    SELECT date_trunc('day', created_at) AS day,
+           count(*) AS runs,
+           count(*) FILTER (WHERE status = 'failed') AS failed
+    FROM workflow_runs
+    WHERE created_at >= :since
+    GROUP BY 1
+"""
+
+
+def _series_start(days: int) -> date:
+    return datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+
+
+def _fill_series(start: date, days: int, values: Dict[date, Dict[str, int]], fields: List[str]) -> List[Dict[str, Any]]:
+    """补齐没有数据的日期，保证前端拿到连续的 days 个点"""
+    series = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        counts = values.get(day, {})
+        series.append({"date": day.isoformat(), **{field: counts.get(field, 0) for field in fields}})
+    return series
+
+
+class StatsService:
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def _cached(self, key: str, ttl: int, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        try:
+            raw = await redis_client.get(key)
+        except Exception as e:
+            logger.warning("读取统计缓存失败: %s", e)
+            raw = None
+        if raw is not None:
+            return json.loads(raw)
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(self._compute_and_store(key, ttl, compute))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # 发起计算的请求断开时不取消计算，其余等待者仍可拿到结果
+        return await asyncio.shield(task)
+
+    @staticmethod
+    async def _compute_and_store(key: str, ttl: int, compute) -> Dict[str, Any]:
+        value = await compute()
+        try:
+            await redis_client.set(key, json.dumps(value), ex=ttl)
+        except Exception as e:
+            logger.warning("写入统计缓存失败: %s", e)
+        return value
+
+    async def _compute_user_stats(self) -> Dict[str, Any]:
+        days = settings.stats_series_days
+        start = _series_start(days)
+        async with AsyncSessionLocal() as db:
+            totals = (await db.execute(select(
+                func.count().label("total_users"),
+                func.count().filter(User.is_active == 1).label("active_users"),
+                func.count().filter(User.is_admin == 1).label("admin_users"),
+            ))).one()
+            day = func.date_trunc("day", func.timezone("UTC", User.created_at)).label("day")
+            rows = (await db.execute(
+                select(day, func.count().label("users"))
+                .where(User.created_at >= datetime.combine(start, datetime.min.time(), tzinfo=timezone.utc))
+                .group_by(day)
+            )).all()
+        growth = _fill_series(start, days, {row.day.date(): {"users": row.users} for row in rows}, ["users"])
+        return {**totals._asdict(), "user_growth": growth}
+
+    async def _compute_dify_stats(self) -> Dict[str, Any]:
+        days = settings.stats_series_days
+        start = _series_start(days)
+        async with dify_engine.connect() as conn:
+            totals = (await conn.execute(text(DIFY_TOTALS_QUERY))).one()
+            rows = (await conn.execute(
+                text(DIFY_RUN_SERIES_QUERY), {"since": datetime.combine(start, datetime.min.time())}
+            )).all()
+        series = _fill_series(
+            start, days, {row.day.date(): {"runs": row.runs, "failed": row.failed} for row in rows}, ["runs", "failed"]
+        )
+        return {**totals._asdict(), "run_series": series}
+
+    async def user_stats(self) -> Dict[str, Any]:
+        return await self._cached(USER_STATS_KEY, settings.stats_users_ttl, self._compute_user_stats)
+
+    async def dify_stats(self) -> Optional[Dict[str, Any]]:
+        """Dify 数据库不可用时返回 None，不影响用户统计"""
+        if dify_engine is None:
+            return None
+        try:
+            return await self._cached(DIFY_STATS_KEY, settings.stats_dify_ttl, self._compute_dify_stats)
+        except Exception as e:
+            logger.error("读取 Dify 统计失败: %s", e)
+            return None
+
+    async def has_users(self) -> bool:
+        try:
+            if await redis_client.get(HAS_USERS_KEY):
+                return True
+        except Exception as e:
+            logger.warning("读取初始化状态缓存失败: %s", e)
+
+        async with AsyncSessionLocal() as db:
+            found = bool(await db.scalar(select(exists().select_from(User))))
+        if found:
+            try:
+                await redis_client.set(HAS_USERS_KEY, "1", ex=settings.stats_setup_ttl)
+            except Exception as e:
+                logger.warning("写入初始化状态缓存失败: %s", e)
+        return found
+
+    async def invalidate_users(self, deleted: bool = False):
+        keys = [USER_STATS_KEY, HAS_USERS_KEY] if deleted else [USER_STATS_KEY]
+        try:
+            await redis_client.delete(*keys)
+        except Exception as e:
+            logger.warning("清理统计缓存失败: %s", e)
+
+    async def invalidate_dify(self):
+        try:
+            await redis_client.delete(DIFY_STATS_KEY)
+        except Exception as e:
+            logger.warning("清理统计缓存失败: %s", e)
+
+
+stats_service = StatsService()
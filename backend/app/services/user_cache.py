@@ -0,0 +1,114 @@
+"""
+已认证用户缓存 (按 JWT subject 即邮箱索引)
+
+两级缓存：进程内 TTLCache -> Redis -> 数据库。
+管理员修改用户后调用 invalidate()，通过 invalidation_bus 清理所有 worker 的本地缓存。
+
+未命中时先用 generation() 取得失效代数再查库，set() 只在代数未变化时回填：
+查库期间用户被禁用 / 改权限，旧数据不会被写回缓存。
+"""
+import logging
+from typing import Optional, Tuple
+
+from app.cache import TTLCache, invalidation_bus, redis_client
+from app.config import settings
+from app.metrics import USER_CACHE_REQUESTS
+from app.schemas.user import CurrentUser
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_KIND = "user"
+
+# (本进程失效代数, Redis 中该用户的失效代数；Redis 不可用时为 None)
+Generation = Tuple[int, Optional[bytes]]
+
+
+def _redis_key(subject: str) -> str:
+    return f"amz:user:{subject}"
+
+
+def _generation_key(subject: str) -> str:
+    return f"amz:user:gen:{subject}"
+
+
+# 比较失效代数后写入，与 invalidate() 的 INCR 互斥
+_SET_IF_GENERATION = redis_client.register_script("""
+if (redis.call("get", KEYS[2]) or "0") == ARGV[1] then
+    redis.call("set", KEYS[1], ARGV[2], "EX", ARGV[3])
+    return 1
+end
+return 0
+""")
+
+
+class UserCache:
+    def __init__(self):
+        self._local = TTLCache(maxsize=settings.user_cache_local_size, ttl=settings.user_cache_local_ttl)
+        self._generation = 0
+        invalidation_bus.subscribe(INVALIDATION_KIND, self._evict)
+
+    def _evict(self, subject: str):
+        self._generation += 1
+        self._local.pop(subject)
+
+    async def get(self, subject: str) -> Optional[CurrentUser]:
+        user = self._local.get(subject)
+        if user is not None:
+            USER_CACHE_REQUESTS.labels(tier="local", result="hit").inc()
+            return user
+
+        try:
+            raw = await redis_client.get(_redis_key(subject))
+        except Exception as e:
+            logger.warning("读取 Redis 用户缓存失败: %s", e)
+            raw = None
+        if raw is not None:
+            USER_CACHE_REQUESTS.labels(tier="redis", result="hit").inc()
+            user = CurrentUser.model_validate_json(raw)
+            self._local.set(subject, user)
+            return user
+
+        USER_CACHE_REQUESTS.labels(tier="redis", result="miss").inc()
+        return None
+
+    async def generation(self, subject: str) -> Generation:
+        """查库之前调用，结果传给 set()"""
+        try:
+            remote = await redis_client.get(_generation_key(subject)) or b"0"
+        except Exception as e:
+            logger.warning("读取 Redis 用户缓存代数失败: %s", e)
+            remote = None
+        return self._generation, remote
+
+    async def set(self, subject: str, user: CurrentUser, generation: Generation):
+        local, remote = generation
+        if remote is not None:
+            try:
+                written = await _SET_IF_GENERATION(
+                    keys=[_redis_key(subject), _generation_key(subject)],
+                    args=[remote, user.model_dump_json(), settings.user_cache_redis_ttl]
+                )
+            except Exception as e:
+                logger.warning("写入 Redis 用户缓存失败: %s", e)
+                written = True
+            if not written:
+                return
+        if local == self._generation:
+            self._local.set(subject, user)
+
+    async def invalidate(self, subject: str):
+        # 先在本进程生效：与下面的 Redis 操作并发完成的查库结果也不会回填本地缓存
+        self._evict(subject)
+        try:
+            pipe = redis_client.pipeline(transaction=True)
+            pipe.incr(_generation_key(subject))
+            # 代数只需覆盖一次查库的时间窗口
+            pipe.expire(_generation_key(subject), settings.user_cache_redis_ttl)
+            pipe.delete(_redis_key(subject))
+            await pipe.execute()
+        except Exception as e:
+            logger.warning("删除 Redis 用户缓存失败: %s", e)
+        await invalidation_bus.publish(INVALIDATION_KIND, subject)
+
+
+user_cache = UserCache()
@@ -0,0 +1,54 @@
+"""
+工作流历史查询 (按用户 keyset 分页)
+
+依赖索引 ix_workflow_history_user_created (user_id, created_at DESC, id DESC)，
+任意翻页深度都只扫描一页的索引范围。
+"""
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Select, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer_group
+
+from app.models import WorkflowHistory
+from app.pagination import decode_cursor, decode_datetime, decode_int, encode_cursor
+
+
+def build_history_query(
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    status: Optional[str] = None,
+    name: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    with_payload: bool = False,
+) -> Select:
+    """多取一行用于判断是否还有下一页；with_payload 时一并加载完整输入输出 (旧版列表接口)"""
+    query = select(WorkflowHistory).where(WorkflowHistory.user_id == user_id)
+    if with_payload:
+        query = query.options(undefer_group("payload"))
+    if cursor:
+        created_at, row_id = decode_cursor(cursor, 2)
+        query = query.where(
+            tuple_(WorkflowHistory.created_at, WorkflowHistory.id) < tuple_(decode_datetime(created_at), decode_int(row_id))
+        )
+    if status:
+        query = query.where(WorkflowHistory.status == status)
+    if name:
+        query = query.where(WorkflowHistory.name.icontains(name, autoescape=True))
+    if created_from:
+        query = query.where(WorkflowHistory.created_at >= created_from)
+    if created_to:
+        query = query.where(WorkflowHistory.created_at < created_to)
+    return query.order_by(WorkflowHistory.created_at.desc(), WorkflowHistory.id.desc()).limit(limit + 1)
+
+
+async def fetch_history_page(db: AsyncSession, limit: int, **filters) -> Tuple[List[WorkflowHistory], Optional[str]]:
+    rows = (await db.scalars(build_history_query(limit=limit, **filters))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
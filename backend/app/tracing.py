@@ -0,0 +1,92 @@
+"""
+OpenTelemetry 链路追踪 (可选，settings.otel_enabled 开启)
+
+- FastAPI: 每个路由一个 server span
+- SQLAlchemy: 每条 SQL 一个 span (应用库与 Dify 库)
+- httpx: 每次 Dify 调用一个 client span，并通过 traceparent 头 (W3C Trace Context) 传给 Dify
+- 采样: ParentBased(TraceIdRatioBased(otel_sample_ratio))，上游已采样的请求始终跟随
+- 导出: BatchSpanProcessor + OTLP/HTTP，后台线程批量发送
+
+未安装 opentelemetry 依赖时只记录警告，不影响启动。
+"""
+import importlib.util
+import logging
+from typing import Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_provider = None
+
+
+def _otel_available() -> bool:
+    for module in (
+        "opentelemetry.sdk",
+        "opentelemetry.exporter.otlp.proto.http",
+        "opentelemetry.instrumentation.fastapi",
+        "opentelemetry.instrumentation.sqlalchemy",
+        "opentelemetry.instrumentation.httpx",
+    ):
+        try:
+            found = importlib.util.find_spec(module) is not None
+        except ModuleNotFoundError:
+            found = False
+        if not found:
+            logger.warning("未安装 %s，OpenTelemetry 追踪未启用", module)
+            return False
+    return True
+
+
+def setup_tracing(app=None, service_name: Optional[str] = None):
+    """
+    初始化 TracerProvider 并挂载自动埋点；需在创建 Dify httpx 客户端之前调用。
+    API 进程传入 FastAPI app，worker 进程只埋点数据库与 httpx。
+    """
+    global _provider
+    if not settings.otel_enabled or _provider is not None or not _otel_available():
+        return
+
+    from opentelemetry import trace
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+    from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+    from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    from app.database import async_engine, dify_engine
+
+    _provider = TracerProvider(
+        resource=Resource.create({SERVICE_NAME: service_name or settings.otel_service_name}),
+        sampler=ParentBased(TraceIdRatioBased(settings.otel_sample_ratio)),
+    )
+    _provider.add_span_processor(BatchSpanProcessor(
+        OTLPSpanExporter(endpoint=f"{settings.otel_exporter_otlp_endpoint.rstrip('/')}/v1/traces")
+    ))
+    trace.set_tracer_provider(_provider)
+
+    engines = [engine.sync_engine for engine in (async_engine, dify_engine) if engine is not None]
+    SQLAlchemyInstrumentor().instrument(engines=engines, tracer_provider=_provider)
+    HTTPXClientInstrumentor().instrument(tracer_provider=_provider)
+
+    if app is not None:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+
+        FastAPIInstrumentor.instrument_app(
+            app, tracer_provider=_provider, excluded_urls=settings.otel_excluded_urls
+        )
+
+    logger.info(
+        "OpenTelemetry 追踪已启用: endpoint=%s sample_ratio=%s",
+        settings.otel_exporter_otlp_endpoint, settings.otel_sample_ratio
+    )
+
+
+def shutdown_tracing():
+    """导出队列中剩余的 span"""
+    global _provider
+    if _provider is not None:
+        _provider.shutdown()
+        _provider = None
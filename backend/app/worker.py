@@ -0,0 +1,175 @@
+"""
+工作流任务 worker (可独立于 API 进程横向扩展)
+
+用法 (在 backend 目录下):
+    python -m app.worker --concurrency 8
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+from datetime import datetime, timezone
+
+from sqlalchemy.orm import undefer_group
+
+from app.cache import redis_client
+from app.config import settings
+from app.database import AsyncSessionLocal, async_engine
+from app.logging_config import setup_logging
+from app.models import WorkflowHistory
+from app.request_context import request_id_var
+from app.services import job_queue
+from app.services.dify_client import dify_client
+from app.services.dify_runs import DifyRunError, extract_output_text, run_workflow_blocking
+from app.services.preprocess import input_preprocessor
+from app.services.run_events import run_events
+from app.tracing import setup_tracing, shutdown_tracing
+
+logger = logging.getLogger("app.worker")
+
+TERMINAL_STATUSES = {"completed", "failed"}
+
+
+async def execute_job(history_id: int):
+    """执行一次工作流任务并更新 WorkflowHistory 状态"""
+    async with AsyncSessionLocal() as db:
+        job = await db.get(WorkflowHistory, history_id, options=[undefer_group("payload")])
+        if job is None or job.status in TERMINAL_STATUSES:
+            # 重复投递或任务已被删除
+            return
+        if job.attempts >= settings.job_max_attempts:
+            # 被重新接管的消息：上一次执行中途退出 (进程崩溃等)，次数已用尽，不再调用 Dify
+            job.status = "failed"
+            job.error = job.error or "任务执行中断，重试次数已用尽"
+            job.finished_at = datetime.now(timezone.utc)
+            await db.commit()
+            logger.error("任务 %s 已执行 %s 次仍未完成，标记为失败", history_id, job.attempts)
+            return
+
+        job.status = "running"
+        job.attempts += 1
+        job.started_at = datetime.now(timezone.utc)
+        await db.commit()
+
+        try:
+            query = await input_preprocessor.compact(job.input_data)
+            data = await run_workflow_blocking({"query": query}, user_id=job.user_id, source="job")
+            job.output_data = extract_output_text(data)
+            job.status = "completed"
+            job.error = None
+            job.finished_at = datetime.now(timezone.utc)
+            await db.commit()
+        except Exception as e:
+            # 非 Dify 错误 (数据库、返回格式、解压等) 同样按次数重试，避免任务停留在 running 被反复接管
+            await db.rollback()
+            await db.refresh(job)
+            retryable = e.retryable if isinstance(e, DifyRunError) else True
+            job.error = str(e) or type(e).__name__
+            if retryable and job.attempts < settings.job_max_attempts:
+                job.status = "queued"
+                await db.commit()
+                await job_queue.schedule_retry(history_id, job.attempts)
+                logger.warning("任务 %s 第 %s 次执行失败，稍后重试: %s", history_id, job.attempts, e)
+                return
+            job.status = "failed"
+            job.finished_at = datetime.now(timezone.utc)
+            await db.commit()
+            if isinstance(e, DifyRunError):
+                logger.error("任务 %s 执行失败: %s", history_id, e)
+            else:
+                logger.exception("任务 %s 执行异常: %s", history_id, e)
+
+
+class JobWorker:
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set = set()
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def _handle(self, message_id: str, history_id: int):
+        # 每个任务运行在独立 task 中，关联 ID 只作用于本任务的日志与 Dify 调用
+        request_id_var.set(f"job-{history_id}")
+        try:
+            await execute_job(history_id)
+        except Exception as e:
+            # 未确认的消息会在 visibility timeout 后被重新接管
+            logger.exception("任务 %s 处理异常: %s", history_id, e)
+            return
+        finally:
+            self._slots.release()
+        await job_queue.ack(message_id)
+
+    async def _dispatch(self, messages):
+        for message_id, history_id in messages:
+            task = asyncio.create_task(self._handle(message_id, history_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _acquire_slots(self) -> int:
+        """至少占用一个并发槽位，再尽量多取空闲槽位"""
+        await self._slots.acquire()
+        acquired = 1
+        while acquired < self.concurrency and not self._slots.locked():
+            await self._slots.acquire()
+            acquired += 1
+        return acquired
+
+    async def run(self):
+        await job_queue.ensure_group()
+        logger.info("任务 worker %s 已启动，并发 %s", self.consumer, self.concurrency)
+        while not self._stopping.is_set():
+            slots = await self._acquire_slots()
+            try:
+                await job_queue.promote_due()
+                messages = await job_queue.reclaim(self.consumer, slots)
+                if not messages:
+                    messages = await job_queue.read(self.consumer, slots, block_ms=1000)
+            except Exception as e:
+                logger.warning("读取任务队列失败: %s", e)
+                messages = []
+                await asyncio.sleep(1)
+
+            # 归还本轮没有用上的槽位
+            for _ in range(slots - len(messages)):
+                self._slots.release()
+            await self._dispatch(messages)
+
+        if self._tasks:
+            logger.info("等待 %s 个进行中的任务完成", len(self._tasks))
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="AMZ Auto AI 工作流任务 worker")
+    parser.add_argument("--concurrency", type=int, default=settings.job_worker_concurrency)
+    args = parser.parse_args()
+
+    setup_logging()
+    setup_tracing(service_name=f"{settings.otel_service_name}-worker")
+    await dify_client.start()
+    await run_events.start()
+    await input_preprocessor.warm()
+    worker = JobWorker(args.concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        await run_events.stop()
+        input_preprocessor.shutdown()
+        await dify_client.aclose()
+        await redis_client.aclose()
+        await async_engine.dispose()
+        shutdown_tracing()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""
+并发请求吞吐基准：同步 Session (旧实现) vs AsyncSession (asyncpg)
+
+模拟 async 处理函数中执行一次数据库查询，比较两种会话在同一事件循环上的
+吞吐量以及事件循环的最大阻塞时间。
+
+用法 (在 backend 目录下):
+    python -m benchmarks.bench_db_concurrency --requests 2000 --concurrency 100 --query-ms 5
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from app.database import AsyncSessionLocal, SessionLocal, async_engine, engine
+
+QUERY = text("SELECT pg_sleep(:delay)")
+
+
+async def sync_handler(delay: float):
+    # 旧实现：async def 中直接使用同步 Session，查询期间阻塞事件循环
+    db = SessionLocal()
+    try:
+        db.execute(QUERY, {"delay": delay})
+    finally:
+        db.close()
+
+
+async def async_handler(delay: float):
+    async with AsyncSessionLocal() as db:
+        await db.execute(QUERY, {"delay": delay})
+
+
+async def loop_lag_probe(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """记录事件循环调度的最大延迟"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def run(handler, requests: int, concurrency: int, delay: float):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await handler(delay)
+
+    stop = asyncio.Event()
+    probe = asyncio.create_task(loop_lag_probe(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    worst_lag = await probe
+    return requests / elapsed, worst_lag
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--query-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    delay = args.query_ms / 1000
+
+    # 预热连接池
+    await run(async_handler, 20, 20, 0)
+    await run(sync_handler, 5, 1, 0)
+
+    for label, handler in (("sync Session", sync_handler), ("AsyncSession", async_handler)):
+        rps, lag = await run(handler, args.requests, args.concurrency, delay)
+        print(f"{label:<14} {rps:10.1f} req/s   最大事件循环阻塞 {lag * 1000:8.1f} ms")
+
+    await async_engine.dispose()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
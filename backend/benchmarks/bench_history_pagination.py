@@ -0,0 +1,124 @@
+"""
+工作流历史分页基准：keyset 游标 vs OFFSET
+
+向 workflow_history 写入大量数据 (默认 1000 万行，分布在若干用户上)，
+然后分别用 OFFSET 与 build_history_query 的游标条件读取不同深度的页，
+比较单页查询延迟。keyset 依赖 ix_workflow_history_user_created 索引，
+延迟应与翻页深度无关。
+
+用法 (在 backend 目录下，先执行 alembic upgrade head):
+    python -m benchmarks.bench_history_pagination --rows 10000000 --users 10
+    python -m benchmarks.bench_history_pagination --skip-populate --depths 0 1000 100000 900000
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import select, text
+
+from app.database import AsyncSessionLocal, async_engine
+from app.models import User, WorkflowHistory
+from app.pagination import encode_cursor
+from app.services.workflow_history import build_history_query
+
+BATCH = 1_000_000
+
+POPULATE = text(
+    """
+    INSERT INTO workflow_history (user_id, name, input_data, output_data, status, attempts, created_at)
+    SELECT
+        (CAST(:user_ids AS integer[]))[1 + (g % cardinality(CAST(:user_ids AS integer[])))],
+        'bench-' || g,
+        'input ' || g,
+        'output ' || g,
+        CASE WHEN g % 10 = 0 THEN 'failed' ELSE 'completed' END,
+        1,
+        now() - make_interval(secs => g)
+    FROM generate_series(CAST(:start AS bigint), CAST(:stop AS bigint)) AS g
+    """
+)
+
+
+async def populate(rows: int, users: int):
+    async with AsyncSessionLocal() as db:
+        user_ids = []
+        for i in range(users):
+            email = f"bench-history-{i}@example.com"
+            user = await db.scalar(select(User).where(User.email == email))
+            if not user:
+                user = User(email=email, username=f"bench-history-{i}", hashed_password="!")
+                db.add(user)
+                await db.flush()
+            user_ids.append(user.id)
+        await db.commit()
+
+        for start in range(1, rows + 1, BATCH):
+            stop = min(start + BATCH - 1, rows)
+            await db.execute(POPULATE, {"user_ids": user_ids, "start": start, "stop": stop})
+            await db.commit()
+            print(f"  inserted {stop}/{rows}")
+
+    async with async_engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("ANALYZE workflow_history"))
+    return user_ids[0]
+
+
+async def timed(db, query, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        (await db.scalars(query)).all()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+async def main(args):
+    if args.skip_populate:
+        async with AsyncSessionLocal() as db:
+            user_id = await db.scalar(select(User.id).where(User.email == "bench-history-0@example.com"))
+        if user_id is None:
+            raise SystemExit("未找到基准数据，请去掉 --skip-populate 先写入")
+    else:
+        print(f"populating {args.rows} rows ...")
+        user_id = await populate(args.rows, args.users)
+
+    async with AsyncSessionLocal() as db:
+        print(f"{'depth':>10} {'offset ms':>12} {'keyset ms':>12}")
+        for depth in args.depths:
+            offset_query = (
+                select(WorkflowHistory)
+                .where(WorkflowHistory.user_id == user_id)
+                .order_by(WorkflowHistory.created_at.desc(), WorkflowHistory.id.desc())
+                .offset(depth)
+                .limit(args.page_size)
+            )
+            offset_ms = await timed(db, offset_query, args.repeat)
+
+            # 先定位到该深度的游标 (不计入耗时)，再测量游标查询
+            anchor = None
+            if depth:
+                anchor = (await db.execute(
+                    select(WorkflowHistory.created_at, WorkflowHistory.id)
+                    .where(WorkflowHistory.user_id == user_id)
+                    .order_by(WorkflowHistory.created_at.desc(), WorkflowHistory.id.desc())
+                    .offset(depth - 1)
+                    .limit(1)
+                )).first()
+            cursor = encode_cursor(*anchor) if anchor else None
+            keyset_ms = await timed(db, build_history_query(user_id, cursor=cursor, limit=args.page_size), args.repeat)
+
+            print(f"{depth:>10} {offset_ms:>12.2f} {keyset_ms:>12.2f}")
+
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 1_000, 10_000, 100_000, 500_000])
+    parser.add_argument("--skip-populate", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,80 @@
+"""
+HTML 输入预处理基准
+
+生成一个带大量脚本、样式、导航与推荐位的合成 Amazon 商品页，
+按不同进程池大小并发压缩，输出吞吐、单次耗时与压缩率。
+
+用法 (在 backend 目录下):
+    python -m benchmarks.bench_html_preprocess --requests 64 --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from app.services.html_compact import compact_html
+from app.services.preprocess import InputPreprocessor
+
+
+def amazon_page(n_scripts=40, n_reviews=8):
+    script = "<script>var x = {" + ",".join(f'"k{i}": "{"v"*50}"' for i in range(200)) + "};</script>"
+    style = "<style>" + ".a-class{color:red;margin:0 auto;padding:1px}" * 300 + "</style>"
+    reviews = "".join(f'''<div data-hook="review" id="R{i}" class="a-section review"><div class="a-profile-content"><span class="a-profile-name">Buyer {i}</span></div>
+        <a data-hook="review-title" class="a-link-normal"><i data-hook="review-star-rating" class="a-icon"><span class="a-icon-alt">{4 + i % 2}.0 out of 5 stars</span></i><span>Great product {i}</span></a>
+        <span data-hook="review-date">Reviewed in the United States on May {i + 1}, 2026</span>
+        <span data-hook="review-body"><span>Works &amp; looks great. Item {i}   has
+        lots of   whitespace.</span></span><button class="a-button">Helpful</button></div>''' for i in range(n_reviews))
+    return f'''<!DOCTYPE html><html><head><title>Amazon.com: Widget</title>{style}{script * 3}</head>
+<body><header id="navbar"><nav><a href="/">Amazon</a><input name="field-keywords"/>{"<a>Link</a>" * 300}</nav></header>
+{script * n_scripts}
+<div id="dp"><div id="wayfinding-breadcrumbs_feature_div"><ul><li>Home</li><li>Kitchen</li></ul></div>
+<input type="hidden" id="ASIN" name="ASIN" value="B0TEST1234"/>
+<div id="imgTagWrapperId"><img id="landingImage" src="https://m.media-amazon.com/images/I/small.jpg" data-old-hires="https://m.media-amazon.com/images/I/large.jpg"/></div>
+<div id="altImages"><ul>{"".join(f'<li><img src="https://m.media-amazon.com/images/I/alt{i}.jpg"/></li>' for i in range(6))}</ul></div>
+<h1 id="title"><span id="productTitle" class="a-size-large">
+      Super Widget 3000 — Stainless   Steel, 2-Pack
+   </span></h1>
+<div id="averageCustomerReviews"><span id="acrPopover" title="4.6 out of 5 stars"><i class="a-icon"><span class="a-icon-alt">4.6 out of 5 stars</span></i></span>
+<a><span id="acrCustomerReviewText">12,345 ratings</span></a></div>
+<div id="corePrice_feature_div"><span class="a-price"><span class="a-offscreen">$1,299.99</span><span aria-hidden="true">$1,299<sup>99</sup></span></span></div>
+<form id="addToCart"><select><option>1</option><option>2</option></select><input id="add-to-cart-button" value="Add to Cart"/><span>Buy now with 1-Click</span></form>
+<div id="feature-bullets"><ul><li><span class="a-list-item"> Durable stainless steel body </span></li><li><span class="a-list-item">Dishwasher safe</span></li><li><span class="a-list-item">2-year warranty</span></li></ul></div>
+<div id="productDescription"><p>The Super Widget 3000 is the <b>best</b> widget.</p><p>Made in USA.</p></div>
+<div id="sp_detail">{"<div><a>Sponsored product</a><img src='x.jpg'/></div>" * 200}</div>
+<div id="cm-cr-dp-review-list">{reviews}</div>
+<div id="rhf">{"<div>Recently viewed</div>" * 100}</div>
+</div><footer id="navFooter">{"<a>Footer link</a>" * 300}</footer></body></html>'''
+
+
+
+async def run(workers: int, requests: int, page: str):
+    preprocessor = InputPreprocessor(workers=workers, max_queue=requests)
+    # 预热：启动 spawn 子进程并导入 lxml
+    await asyncio.gather(*(preprocessor.compact(page) for _ in range(workers)))
+    start = time.perf_counter()
+    await asyncio.gather(*(preprocessor.compact(page) for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    preprocessor.shutdown()
+    return requests / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    page = amazon_page()
+    start = time.perf_counter()
+    compacted = compact_html(page)
+    elapsed = time.perf_counter() - start
+    print(f"CPU 核数: {os.cpu_count()}")
+    print(f"单页: {len(page)} -> {len(compacted)} 字符 (减少 {100 * (1 - len(compacted) / len(page)):.1f}%)，"
+          f"进程内耗时 {elapsed * 1000:.1f}ms")
+    for workers in args.workers:
+        rps = await run(workers, args.requests, page)
+        print(f"workers={workers:<3} {rps:8.1f} pages/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+"""
+登录 (bcrypt 校验) 吞吐基准
+
+按不同线程池大小并发执行密码校验，观察吞吐是否随核数线性增长，
+同时统计在给定排队上限下被 429 快速拒绝的请求数。
+
+用法 (在 backend 目录下):
+    python -m benchmarks.bench_password_hashing --requests 64 --workers 1 2 4 8 --max-queue 32
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from fastapi import HTTPException
+
+from app.services.passwords import PasswordHasher
+
+PASSWORD = "correct horse battery staple"
+
+
+async def run(workers: int, requests: int, max_queue: int, hashed: str):
+    hasher = PasswordHasher(workers=workers, max_queue=max_queue)
+    rejected = 0
+
+    async def one():
+        nonlocal rejected
+        try:
+            await hasher.verify(PASSWORD, hashed)
+        except HTTPException:
+            rejected += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    hasher.shutdown()
+    return (requests - rejected) / elapsed, rejected
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--max-queue", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    hasher = PasswordHasher(workers=1)
+    hashed = await hasher.hash(PASSWORD)
+    hasher.shutdown()
+
+    print(f"CPU 核数: {os.cpu_count()}")
+    for workers in args.workers:
+        rps, rejected = await run(workers, args.requests, args.max_queue, hashed)
+        print(f"workers={workers:<3} {rps:8.1f} logins/s   429 拒绝 {rejected}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
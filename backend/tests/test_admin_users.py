@@ -0,0 +1,79 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.models import User
+from app.pagination import encode_cursor
+from app.services.admin_users import fetch_user_page
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def users(db):
+    """5 个有注册时间的用户 + 3 个 created_at 为 NULL 的用户 (旧数据迁移而来)，邮箱共用一个前缀"""
+    prefix = "pg" + uuid.uuid4().hex[:10]
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    rows = [
+        User(email=f"{prefix}-{index}@test.local", username=f"{prefix}-{index}", hashed_password="x",
+             created_at=base + timedelta(days=index % 3) if index < 5 else None)
+        for index in range(8)
+    ]
+    db.add_all(rows)
+    await db.commit()
+    # server_default 只在未提供值时生效，显式写入 NULL
+    for row in rows[5:]:
+        row.created_at = None
+    await db.commit()
+    return prefix, rows
+
+
+async def walk(db, prefix, limit, **options):
+    seen, cursor = [], None
+    while True:
+        page, cursor = await fetch_user_page(db, limit, cursor=cursor, q=prefix, **options)
+        seen.extend(page)
+        if cursor is None:
+            return seen
+
+
+@pytest.mark.parametrize("order", ["desc", "asc"])
+@pytest.mark.parametrize("limit", [1, 2, 3])
+async def test_created_at_pages_cover_null_rows_once(db, users, order, limit):
+    prefix, rows = users
+    seen = await walk(db, prefix, limit, sort="created_at", order=order)
+    assert sorted(row.id for row in seen) == sorted(row.id for row in rows)
+
+    # 与一次性排序的结果一致：NULL 视为最大值
+    full, _ = await fetch_user_page(db, 100, q=prefix, sort="created_at", order=order)
+    assert [row.id for row in seen] == [row.id for row in full]
+    nulls = [row.created_at is None for row in seen]
+    assert nulls == sorted(nulls, reverse=(order == "desc"))
+
+
+async def test_cursor_from_null_row_is_accepted(db, users):
+    prefix, rows = users
+    null_ids = sorted(row.id for row in rows[5:])
+    page, _ = await fetch_user_page(
+        db, 10, cursor=encode_cursor("created_at", "desc", None, null_ids[-1]), q=prefix, sort="created_at"
+    )
+    # 降序：剩余的 NULL 行之后是全部非 NULL 行
+    assert [row.id for row in page[:2]] == null_ids[-2::-1]
+    assert len(page) == 7
+
+
+@pytest.mark.parametrize("sort", ["email", "username", "id"])
+async def test_unique_sort_keys(db, users, sort):
+    prefix, rows = users
+    seen = await walk(db, prefix, 3, sort=sort, order="asc")
+    assert [getattr(row, sort) for row in seen] == sorted(getattr(row, sort) for row in rows)
+
+
+async def test_cursor_for_other_sort_rejected(db, users):
+    prefix, _ = users
+    _, cursor = await fetch_user_page(db, 2, q=prefix, sort="email")
+    with pytest.raises(HTTPException) as excinfo:
+        await fetch_user_page(db, 2, cursor=cursor, q=prefix, sort="created_at")
+    assert excinfo.value.status_code == 400
@@ -0,0 +1,73 @@
+import json
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import HTTPException
+
+from app.request_context import deadline_var
+from app.services import dify_batch
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    rows = []
+
+    async def no_wait(bucket):
+        return None
+
+    async def save(batch_rows):
+        rows.extend(batch_rows)
+
+    monkeypatch.setattr(dify_batch.rate_limiter, "acquire", no_wait)
+    monkeypatch.setattr(dify_batch, "save_batch_history", save)
+    return rows
+
+
+async def collect(stream):
+    return [json.loads(line) async for line in stream]
+
+
+async def test_items_run_without_request_deadline(monkeypatch, saved):
+    seen = []
+
+    async def run(inputs, **kwargs):
+        seen.append(deadline_var.get())
+        return {"outputs": {"text": inputs["q"]}}
+
+    monkeypatch.setattr(dify_batch, "run_workflow_blocking", run)
+    # 响应流所在请求的截止时间已过
+    deadline_var.set(time.monotonic() - 1)
+
+    lines = await collect(dify_batch.run_batch("app", "key", "b", [{"q": "a"}, {"q": "b"}], 2, 1, "u@x"))
+    assert lines[-1] == {"done": True, "total": 2, "completed": 2, "failed": 0}
+    assert seen == [None, None]
+    assert len(saved) == 2
+
+
+async def test_admission_error_fails_only_that_item(monkeypatch, saved):
+    real_slot = dify_batch.dify_limiter.slot
+
+    @asynccontextmanager
+    async def slot(priority):
+        if slot.calls == 0:
+            slot.calls += 1
+            raise HTTPException(status_code=503, detail="服务繁忙，请稍后重试")
+        async with real_slot(priority) as acquired:
+            yield acquired
+    slot.calls = 0
+
+    async def run(inputs, **kwargs):
+        return {"outputs": {"text": "ok"}}
+
+    monkeypatch.setattr(dify_batch.dify_limiter, "slot", slot)
+    monkeypatch.setattr(dify_batch, "run_workflow_blocking", run)
+
+    lines = await collect(dify_batch.run_batch("app", "key", "b", [{"q": "a"}, {"q": "b"}], 1, 1, "u@x"))
+    results = sorted(lines[:-1], key=lambda line: line["index"])
+    assert [result["status"] for result in results] == ["failed", "completed"]
+    assert results[0]["error"] == "服务繁忙，请稍后重试"
+    assert lines[-1]["failed"] == 1
+    assert [row["status"] for row in saved] == ["failed", "completed"]
@@ -0,0 +1,125 @@
+import base64
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.cache import release_lock
+from app.config import settings
+from app.pagination import encode_cursor
+from app.services.dify_catalogue import (
+    APPS_KEY, META_KEY, REFRESH_LOCK_KEY, CatalogueSnapshot, DifyCatalogue,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def app_row(app_id: str, name: str = "App", updated_at: str = "2026-01-01T00:00:00") -> dict:
+    return {
+        "id": app_id, "name": name, "mode": "workflow", "description": "", "status": "normal", "icon": None,
+        "created_at": "2026-01-01T00:00:00", "updated_at": updated_at,
+    }
+
+
+@pytest.fixture
+async def catalogue(redis, monkeypatch):
+    await redis.delete(APPS_KEY, META_KEY, REFRESH_LOCK_KEY)
+    rows = {}
+    queries = []
+
+    async def fetch(since=None):
+        queries.append(since)
+        return [
+            row for row in rows.values()
+            if since is None or row["updated_at"] >= since.isoformat()
+        ]
+
+    catalogue = DifyCatalogue()
+    monkeypatch.setattr(catalogue, "_fetch", fetch)
+    catalogue.rows = rows
+    catalogue.queries = queries
+    yield catalogue
+    await redis.delete(APPS_KEY, META_KEY, REFRESH_LOCK_KEY)
+
+
+async def version(redis) -> bytes:
+    return await redis.hget(META_KEY, "version")
+
+
+async def test_unchanged_refresh_keeps_version(catalogue, redis):
+    catalogue.rows["a"] = app_row("a")
+    await catalogue._refresh_redis()
+    first = await version(redis)
+    assert first is not None
+
+    # 增量查询 (>=) 每次都会取回水位所在的行，内容相同不算变化
+    for _ in range(3):
+        await catalogue._refresh_redis()
+    assert catalogue.queries[-1] is not None
+    assert await version(redis) == first
+
+
+async def test_changed_row_bumps_version(catalogue, redis):
+    catalogue.rows["a"] = app_row("a")
+    await catalogue._refresh_redis()
+    first = await version(redis)
+
+    catalogue.rows["a"] = app_row("a", name="Renamed", updated_at="2026-01-02T00:00:00")
+    await catalogue._refresh_redis()
+    assert int(await version(redis)) == int(first) + 1
+    assert b"Renamed" in await redis.hget(APPS_KEY, "a")
+
+
+async def test_full_sync_removes_deleted_apps(catalogue, redis, monkeypatch):
+    catalogue.rows.update(a=app_row("a"), b=app_row("b"))
+    await catalogue._refresh_redis()
+    first = await version(redis)
+
+    del catalogue.rows["b"]
+    await catalogue._refresh_redis()
+    assert await redis.hexists(APPS_KEY, "b")
+
+    monkeypatch.setattr(settings, "dify_catalogue_full_sync_interval", 0.0)
+    await catalogue._refresh_redis()
+    assert not await redis.hexists(APPS_KEY, "b")
+    assert int(await version(redis)) == int(first) + 1
+
+
+async def test_refresh_does_not_release_foreign_lock(redis):
+    await redis.set(REFRESH_LOCK_KEY, "other-worker", ex=30)
+    assert not await release_lock(REFRESH_LOCK_KEY, "mine")
+    assert await redis.get(REFRESH_LOCK_KEY) == b"other-worker"
+    assert await release_lock(REFRESH_LOCK_KEY, "other-worker")
+    assert not await redis.exists(REFRESH_LOCK_KEY)
+
+
+@pytest.fixture
+def cached_catalogue():
+    catalogue = DifyCatalogue()
+    apps = [dict(app_row(f"app-{index}"), created_at=f"2026-01-{index + 1:02d}T00:00:00") for index in range(5)]
+    catalogue._snapshot = CatalogueSnapshot(apps, "1")
+    catalogue._checked_at = time.monotonic() + 3600
+    return catalogue
+
+
+async def test_cursor_pages_through_snapshot(cached_catalogue):
+    page, cursor, _ = await cached_catalogue.list_apps(limit=2)
+    assert [app["id"] for app in page] == ["app-4", "app-3"]
+    page, cursor, _ = await cached_catalogue.list_apps(limit=2, cursor=cursor)
+    assert [app["id"] for app in page] == ["app-2", "app-1"]
+    page, cursor, _ = await cached_catalogue.list_apps(limit=2, cursor=cursor)
+    assert [app["id"] for app in page] == ["app-0"]
+    assert cursor is None
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-base64!",
+    encode_cursor("2026-01-01T00:00:00"),
+    encode_cursor(1, 2),
+    encode_cursor(None, "app-1"),
+    base64.urlsafe_b64encode(b'{"a": 1}').decode(),
+])
+async def test_malformed_cursor_is_rejected(cached_catalogue, cursor):
+    with pytest.raises(HTTPException) as excinfo:
+        await cached_catalogue.list_apps(cursor=cursor)
+    assert excinfo.value.status_code == 400
@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+from prometheus_client import REGISTRY
+
+from app.config import settings
+from app.request_context import deadline_var
+from app.services.dify_limiter import BATCH, INTERACTIVE, DifyLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def limiter_settings(monkeypatch):
+    monkeypatch.setattr(settings, "dify_max_concurrency", 2)
+    monkeypatch.setattr(settings, "dify_batch_max_concurrency", 1)
+    monkeypatch.setattr(settings, "dify_max_queue", 2)
+    monkeypatch.setattr(settings, "dify_queue_timeout", 5.0)
+    # 不在请求上下文中：只受 dify_queue_timeout 约束
+    deadline_var.set(None)
+
+
+def rejected(reason):
+    return REGISTRY.get_sample_value("dify_admission_rejected_total", {"reason": reason}) or 0
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+async def test_batch_cap_leaves_room_for_interactive():
+    limiter = DifyLimiter()
+    batch = await limiter.acquire(BATCH)
+    waiting_batch = asyncio.create_task(limiter.acquire(BATCH))
+    await settle()
+    # 批量已达上限，但交互请求仍可立即取得剩余槽位
+    assert not waiting_batch.done()
+    interactive = await asyncio.wait_for(limiter.acquire(INTERACTIVE), 0.1)
+
+    batch.release()
+    # 槽位空出后批量任务取得槽位
+    second = await asyncio.wait_for(waiting_batch, 0.1)
+    assert limiter._active == {INTERACTIVE: 1, BATCH: 1}
+    interactive.release()
+    second.release()
+    assert limiter._active == {INTERACTIVE: 0, BATCH: 0}
+
+
+async def test_interactive_woken_before_batch():
+    limiter = DifyLimiter()
+    held = [await limiter.acquire(INTERACTIVE), await limiter.acquire(INTERACTIVE)]
+    batch = asyncio.create_task(limiter.acquire(BATCH))
+    await settle()
+    interactive = asyncio.create_task(limiter.acquire(INTERACTIVE))
+    await settle()
+
+    held[0].release()
+    await settle()
+    # 批量先排队，但空出的槽位先给交互请求
+    assert interactive.done() and not batch.done()
+
+    held[1].release()
+    await asyncio.wait_for(batch, 0.1)
+    interactive.result().release()
+    batch.result().release()
+
+
+async def test_queue_timeout_returns_503(monkeypatch):
+    monkeypatch.setattr(settings, "dify_queue_timeout", 0.05)
+    limiter = DifyLimiter()
+    held = [await limiter.acquire(), await limiter.acquire()]
+    before = rejected("queue_timeout")
+    started = time.monotonic()
+    with pytest.raises(HTTPException) as excinfo:
+        await limiter.acquire()
+    assert excinfo.value.status_code == 503
+    assert rejected("queue_timeout") == before + 1
+    assert excinfo.value.headers["Retry-After"] == str(settings.dify_overload_retry_after)
+    assert time.monotonic() - started < 1
+    assert not limiter._waiters[INTERACTIVE]
+    for slot in held:
+        slot.release()
+
+
+async def test_queue_wait_capped_by_request_deadline():
+    limiter = DifyLimiter()
+    held = [await limiter.acquire(), await limiter.acquire()]
+    deadline_var.set(time.monotonic() + 0.05)
+    started = time.monotonic()
+    with pytest.raises(HTTPException):
+        await limiter.acquire()
+    # 远小于 dify_queue_timeout (5 秒)
+    assert time.monotonic() - started < 1
+    for slot in held:
+        slot.release()
+
+
+async def test_full_queue_rejected_immediately():
+    limiter = DifyLimiter()
+    held = [await limiter.acquire(), await limiter.acquire()]
+    queued = [asyncio.create_task(limiter.acquire()) for _ in range(settings.dify_max_queue)]
+    await settle()
+    before = rejected("queue_full")
+    with pytest.raises(HTTPException) as excinfo:
+        await limiter.acquire()
+    assert excinfo.value.status_code == 503
+    assert rejected("queue_full") == before + 1
+
+    # 批量运行不受队列上限约束
+    batch = asyncio.create_task(limiter.acquire(BATCH))
+    await settle()
+    assert not batch.done()
+
+    for task in queued + [batch]:
+        task.cancel()
+    await asyncio.gather(*queued, batch, return_exceptions=True)
+    for slot in held:
+        slot.release()
+    assert limiter._active == {INTERACTIVE: 0, BATCH: 0}
+
+
+async def test_cancelled_waiter_leaves_queue():
+    limiter = DifyLimiter()
+    held = [await limiter.acquire(), await limiter.acquire()]
+    waiter = asyncio.create_task(limiter.acquire())
+    await settle()
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert not limiter._waiters[INTERACTIVE]
+
+    held[0].release()
+    # 槽位没有分给已取消的等待者
+    assert limiter._active[INTERACTIVE] == 1
+    held[1].release()
+
+
+async def test_slot_released_on_error_and_release_is_idempotent():
+    limiter = DifyLimiter()
+    with pytest.raises(RuntimeError):
+        async with limiter.slot() as slot:
+            raise RuntimeError("boom")
+    slot.release()
+    assert limiter._active == {INTERACTIVE: 0, BATCH: 0}
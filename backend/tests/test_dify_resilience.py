@@ -0,0 +1,148 @@
+import time
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.request_context import deadline_var
+from app.services.dify_resilience import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, DeadlineExceeded, DifyUnavailable, ResilientTransport,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(settings, "dify_breaker_failure_threshold", 2)
+    monkeypatch.setattr(settings, "dify_breaker_reset_timeout", 30.0)
+    monkeypatch.setattr(settings, "dify_breaker_half_open_max", 1)
+    monkeypatch.setattr(settings, "dify_retry_attempts", 0)
+
+
+def deadline(seconds):
+    """在当前测试的 context 中设置请求截止时间 (None 为不限)"""
+    deadline_var.set(None if seconds is None else time.monotonic() + seconds)
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """记录每次尝试的超时设置，按给定结果依次响应 (异常或状态码)"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.timeouts = []
+
+    async def handle_async_request(self, request):
+        self.timeouts.append(dict(request.extensions["timeout"]))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, type) and issubclass(outcome, Exception):
+            raise outcome("boom", request=request)
+        return httpx.Response(outcome, request=request)
+
+
+def make_request(read=60.0):
+    return httpx.Request(
+        "POST", "http://dify/v1/workflows/run",
+        extensions={"timeout": {"connect": 5.0, "read": read, "write": 5.0, "pool": 5.0}},
+    )
+
+
+def test_breaker_opens_after_threshold_and_rejects():
+    breaker = CircuitBreaker("test")
+    for _ in range(2):
+        probe = breaker.before_call()
+        breaker.on_failure(probe)
+    assert breaker.state == OPEN
+    with pytest.raises(DifyUnavailable) as excinfo:
+        breaker.before_call()
+    assert 0 < excinfo.value.retry_after <= 30.0
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker("test")
+    breaker.on_failure(breaker.before_call())
+    breaker.on_success(breaker.before_call())
+    breaker.on_failure(breaker.before_call())
+    assert breaker.state == CLOSED
+
+
+def test_breaker_half_open_probe(monkeypatch):
+    breaker = CircuitBreaker("test")
+    for _ in range(2):
+        breaker.on_failure(breaker.before_call())
+    monkeypatch.setattr(settings, "dify_breaker_reset_timeout", 0.0)
+
+    assert breaker.before_call() is True
+    assert breaker.state == HALF_OPEN
+    # 半开状态只放行 dify_breaker_half_open_max 个探测请求
+    with pytest.raises(DifyUnavailable):
+        breaker.before_call()
+
+    breaker.on_success(True)
+    assert breaker.state == CLOSED
+    assert breaker.before_call() is False
+
+
+def test_breaker_failed_probe_reopens(monkeypatch):
+    breaker = CircuitBreaker("test")
+    for _ in range(2):
+        breaker.on_failure(breaker.before_call())
+    monkeypatch.setattr(settings, "dify_breaker_reset_timeout", 0.0)
+    breaker.on_failure(breaker.before_call())
+    assert breaker.state == OPEN
+
+
+async def test_deadline_caps_attempt_timeouts():
+    deadline(2.0)
+    inner = RecordingTransport(200)
+    transport = ResilientTransport(inner, CircuitBreaker("test"))
+    response = await transport.handle_async_request(make_request())
+    assert response.status_code == 200
+    timeouts = inner.timeouts[0]
+    assert timeouts["read"] <= 2.0
+    assert timeouts["connect"] <= 2.0
+
+
+async def test_no_deadline_keeps_configured_timeouts():
+    deadline(None)
+    inner = RecordingTransport(200)
+    await ResilientTransport(inner, CircuitBreaker("test")).handle_async_request(make_request())
+    assert inner.timeouts[0]["read"] == 60.0
+
+
+async def test_expired_deadline_does_not_call_dify():
+    deadline(-1.0)
+    inner = RecordingTransport(200)
+    with pytest.raises(DeadlineExceeded):
+        await ResilientTransport(inner, CircuitBreaker("test")).handle_async_request(make_request())
+    assert inner.timeouts == []
+
+
+async def test_deadline_capped_timeout_does_not_trip_breaker():
+    deadline(0.5)
+    breaker = CircuitBreaker("test")
+    transport = ResilientTransport(RecordingTransport(*[httpx.ReadTimeout] * 5), breaker)
+    for _ in range(5):
+        with pytest.raises(httpx.ReadTimeout):
+            await transport.handle_async_request(make_request())
+    assert breaker.state == CLOSED
+
+
+async def test_upstream_timeout_trips_breaker():
+    deadline(None)
+    breaker = CircuitBreaker("test")
+    transport = ResilientTransport(RecordingTransport(httpx.ReadTimeout, httpx.ReadTimeout), breaker)
+    for _ in range(2):
+        with pytest.raises(httpx.ReadTimeout):
+            await transport.handle_async_request(make_request())
+    assert breaker.state == OPEN
+
+
+async def test_connect_error_retried_for_post(monkeypatch):
+    deadline(None)
+    monkeypatch.setattr(settings, "dify_retry_attempts", 2)
+    monkeypatch.setattr(settings, "dify_retry_base_delay", 0.0)
+    inner = RecordingTransport(httpx.ConnectError, 200)
+    response = await ResilientTransport(inner, CircuitBreaker("test")).handle_async_request(make_request())
+    assert response.status_code == 200
+    assert len(inner.timeouts) == 2
@@ -0,0 +1,77 @@
+import json
+
+from app.services.html_compact import FEED_CHUNK_CHARS, compact_html
+
+PRODUCT_PAGE = """<!DOCTYPE html><html><head><title>Amazon.com: Widget</title>
+<style>.a{color:red}</style><script>var tracking = {"big": "blob"};</script></head>
+<body><header id="navbar"><nav><a href="/">Amazon</a>{nav_links}</nav></header>
+<div id="dp">
+<div id="wayfinding-breadcrumbs_feature_div"><ul><li>Home</li><li>Kitchen</li></ul></div>
+<form id="addToCart"><input type="hidden" id="ASIN" name="ASIN" value="B0TEST1234"/>
+<select><option>1</option></select></form>
+<img id="landingImage" src="https://img.example/small.jpg" data-old-hires="https://img.example/large.jpg"/>
+<div id="altImages"><ul><li><img src="https://img.example/alt0.jpg"/></li><li><img src="data:image/gif;base64,xx"/></li></ul></div>
+<h1 id="title"><span id="productTitle">
+    Super Widget 3000 &mdash; Stainless   Steel
+</span></h1>
+<span id="acrPopover" title="4.6 out of 5 stars"></span>
+<span id="acrCustomerReviewText">12,345 ratings</span>
+<div id="corePrice_feature_div"><span class="a-price"><span class="a-offscreen">$1,299.99</span>
+<span aria-hidden="true">$1,299<sup>99</sup></span></span></div>
+<div id="feature-bullets"><ul><li><span> Durable body </span></li><li><span>Dishwasher safe</span></li></ul></div>
+<div id="productDescription"><p>The <b>best</b> widget.</p><p>Made in USA.</p></div>
+<div id="sp_detail"><div><a>Sponsored product</a></div></div>
+<div data-hook="review"><span class="a-profile-name">Buyer</span>
+<a data-hook="review-title"><i data-hook="review-star-rating"><span>5.0 out of 5 stars</span></i><span>Great</span></a>
+<span data-hook="review-body"><span>Works   well.</span></span><button>Helpful</button></div>
+</div><footer id="navFooter"><a>Footer</a></footer></body></html>"""
+
+
+def product_page(nav_links: int = 0) -> str:
+    return PRODUCT_PAGE.replace("{nav_links}", "<a>Link</a>" * nav_links)
+
+
+def test_product_page_fields():
+    fields = json.loads(compact_html(product_page()))
+    assert fields == {
+        "asin": "B0TEST1234",
+        "title": "Super Widget 3000 — Stainless Steel",
+        "price": "1299.99",
+        "currency": "USD",
+        "images": ["https://img.example/large.jpg", "https://img.example/alt0.jpg"],
+        "bullets": ["Durable body", "Dishwasher safe"],
+        "description": "The best widget. Made in USA.",
+        "rating": 4.6,
+        "review_count": 12345,
+        "reviews": [{"author": "Buyer", "title": "Great", "rating": 5.0, "body": "Works well."}],
+    }
+
+
+def test_non_content_nodes_are_dropped():
+    compacted = compact_html(product_page())
+    for noise in ("tracking", "color:red", "Sponsored", "Footer", "Kitchen", "Helpful"):
+        assert noise not in compacted
+
+
+def test_page_larger_than_feed_chunk():
+    page = product_page(nav_links=FEED_CHUNK_CHARS // 4)
+    assert len(page) > 2 * FEED_CHUNK_CHARS
+    assert json.loads(compact_html(page))["title"] == "Super Widget 3000 — Stainless Steel"
+
+
+def test_european_price_format():
+    page = product_page().replace("$1,299.99", "1.299,99 €")
+    fields = json.loads(compact_html(page))
+    assert fields["price"] == "1299.99"
+    assert "currency" not in fields
+
+
+def test_generic_page_returns_visible_text_lines():
+    html = """<html><head><script>x()</script></head><body>
+    <nav>Menu</nav><h1>Title</h1><p>First   paragraph
+    continues.</p><ul><li>One</li><li>Two</li></ul></body></html>"""
+    assert compact_html(html) == "Title\nFirst paragraph continues.\nOne\nTwo"
+
+
+def test_malformed_html_does_not_raise():
+    assert compact_html("<div><p>Unclosed <b>tags<div>text") == "Unclosed tags\ntext"
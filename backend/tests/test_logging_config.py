@@ -0,0 +1,49 @@
+import json
+import logging
+import queue
+
+from app.logging_config import DroppingQueueHandler, JsonFormatter, TextFormatter
+
+
+def log_exception(handler):
+    logger = logging.getLogger("test.logging_config")
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("任务 %s 处理异常", 42)
+    finally:
+        logger.removeHandler(handler)
+
+
+def test_records_are_formatted_by_the_listener():
+    log_queue = queue.Queue()
+    log_exception(DroppingQueueHandler(log_queue))
+    record = log_queue.get_nowait()
+    # 入队时未格式化：参数与异常信息原样保留
+    assert (record.msg, record.args) == ("任务 %s 处理异常", (42,))
+    assert record.exc_info and record.exc_text is None
+
+
+def test_json_output_keeps_exc_info_separate():
+    log_queue = queue.Queue()
+    log_exception(DroppingQueueHandler(log_queue))
+    entry = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+    assert entry["message"] == "任务 42 处理异常"
+    assert "ValueError: boom" in entry["exc_info"]
+
+
+def test_text_output_appends_traceback():
+    log_queue = queue.Queue()
+    log_exception(DroppingQueueHandler(log_queue))
+    output = TextFormatter().format(log_queue.get_nowait())
+    assert "任务 42 处理异常" in output and "ValueError: boom" in output
+
+
+def test_full_queue_drops_records():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    log_exception(handler)
+    log_exception(handler)
+    assert handler.dropped == 1
@@ -0,0 +1,65 @@
+import secrets
+
+import pytest
+
+from app import cache as cache_module
+from app.services.oidc_codes import CODE_KEY_PREFIX, AuthCodeStore, MemoryCodeStore, RedisCodeStore
+
+pytestmark = pytest.mark.anyio
+
+DATA = {"user_id": 1, "client_id": "dify", "redirect_uri": "https://dify.local/cb", "scope": "openid"}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    monkeypatch.setattr("app.services.oidc_codes.time", clock)
+    return clock
+
+
+def test_interface_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        AuthCodeStore()
+
+
+async def test_memory_code_is_single_use(clock):
+    store = MemoryCodeStore(ttl=600)
+    await store.save("code-1", DATA)
+    assert await store.take("code-1") == DATA
+    assert await store.take("code-1") is None
+    assert await store.take("unknown") is None
+
+
+async def test_memory_code_expires(clock):
+    store = MemoryCodeStore(ttl=600)
+    await store.save("code-1", DATA)
+    clock.now += 601
+    assert await store.take("code-1") is None
+
+
+async def test_memory_expired_codes_swept_on_save(clock):
+    store = MemoryCodeStore(ttl=600, sweep_interval=60)
+    for index in range(5):
+        await store.save(f"old-{index}", DATA)
+    clock.now += 601
+    await store.save("new", DATA)
+    assert len(store._codes) == 1
+
+
+async def test_redis_code_is_single_use(redis):
+    store = RedisCodeStore(ttl=600)
+    code = secrets.token_urlsafe(16)
+    await store.save(code, DATA)
+    assert 0 < await redis.ttl(CODE_KEY_PREFIX + code) <= 600
+    assert await store.take(code) == DATA
+    assert await store.take(code) is None
+    assert not await redis.exists(CODE_KEY_PREFIX + code)
@@ -0,0 +1,54 @@
+import base64
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.pagination import decode_cursor, decode_datetime, decode_int, decode_str, encode_cursor
+
+
+def test_round_trip_preserves_values():
+    created_at = datetime(2026, 10, 17, 8, 30, 15, 123456, tzinfo=timezone.utc)
+    created, row_id = decode_cursor(encode_cursor(created_at, 42), 2)
+    assert decode_datetime(created) == created_at
+    assert decode_int(row_id) == 42
+
+
+def test_round_trip_mixed_values():
+    values = decode_cursor(encode_cursor("email", "asc", "a+b@x.com", None), 4)
+    assert values == ["email", "asc", "a+b@x.com", None]
+    assert decode_str(values[2]) == "a+b@x.com"
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor("??>>" * 20, 10 ** 12)
+    assert "+" not in cursor and "/" not in cursor
+
+
+@pytest.mark.parametrize("cursor", [
+    "%%%",
+    base64.urlsafe_b64encode(b"not json").decode(),
+    base64.urlsafe_b64encode(b'{"a": 1}').decode(),
+    encode_cursor(1),
+    encode_cursor(1, 2, 3),
+])
+def test_malformed_cursor_rejected(cursor):
+    with pytest.raises(HTTPException) as excinfo:
+        decode_cursor(cursor, 2)
+    assert excinfo.value.status_code == 400
+
+
+@pytest.mark.parametrize("decode, value", [
+    (decode_datetime, "yesterday"),
+    (decode_datetime, None),
+    (decode_datetime, 123),
+    (decode_int, "1"),
+    (decode_int, True),
+    (decode_int, 1.5),
+    (decode_str, 1),
+    (decode_str, None),
+])
+def test_wrong_value_types_rejected(decode, value):
+    with pytest.raises(HTTPException) as excinfo:
+        decode(value)
+    assert excinfo.value.status_code == 400
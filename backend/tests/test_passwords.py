@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.passwords import PasswordHasher
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, max_queue=1)
+    yield hasher
+    hasher.shutdown()
+
+
+async def test_hash_and_verify(hasher):
+    hashed = await hasher.hash("secret")
+    assert await hasher.verify("secret", hashed)
+    assert not await hasher.verify("wrong", hashed)
+    assert hasher._inflight == 0
+
+
+async def test_cancelled_request_keeps_slot_until_hash_finishes(hasher):
+    release = threading.Event()
+
+    def slow_hash(password):
+        release.wait(5)
+        return "hashed"
+
+    running = asyncio.create_task(hasher._run(slow_hash, "a"))
+    queued = asyncio.create_task(hasher._run(slow_hash, "b"))
+    await asyncio.sleep(0.05)
+    # 客户端断开：等待的协程被取消，但线程里的计算仍在进行
+    running.cancel()
+    await asyncio.gather(running, return_exceptions=True)
+    assert hasher._inflight == 2
+    with pytest.raises(HTTPException) as excinfo:
+        await hasher._run(slow_hash, "c")
+    assert excinfo.value.status_code == 429
+
+    release.set()
+    assert await queued == "hashed"
+    await asyncio.sleep(0.05)
+    assert hasher._inflight == 0
@@ -0,0 +1,113 @@
+import uuid
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import undefer_group
+
+from app import compact_payloads
+from app.config import settings
+from app.models import User, WorkflowHistory
+from app.payloads import make_preview, pack_payload, payload_columns, unpack_payload
+
+pytestmark = pytest.mark.anyio
+
+PAGE = "<div class='a-section'>商品标题 Widget 3000 ✓</div>\n" * 500
+
+
+@pytest.mark.parametrize("text", ["", "plain", "多字节 ✓ 😀", PAGE])
+def test_round_trip(text):
+    blob, _, size = pack_payload(text)
+    assert unpack_payload(blob) == text
+    assert size == len(text)
+
+
+def test_none_is_kept():
+    assert pack_payload(None) == (None, None, None)
+    assert unpack_payload(None) is None
+
+
+def test_repetitive_payload_is_compressed():
+    blob, _, _ = pack_payload(PAGE)
+    assert len(blob) < len(PAGE.encode("utf-8")) // 10
+
+
+def test_preview_truncated_by_characters():
+    limit = settings.payload_preview_chars
+    assert make_preview("短" * limit) == "短" * limit
+    assert make_preview("长" * (limit + 1)) == "长" * limit + "…"
+
+
+def test_legacy_column_used_until_migrated():
+    assert unpack_payload(None, "legacy text") == "legacy text"
+    blob, _, _ = pack_payload("new text")
+    assert unpack_payload(blob, "legacy text") == "new text"
+
+
+def test_payload_columns():
+    columns = payload_columns("output", "result")
+    assert set(columns) == {"output_blob", "output_preview", "output_size"}
+    assert unpack_payload(columns["output_blob"]) == "result"
+
+
+def test_model_properties_pack_and_clear_legacy_column():
+    row = WorkflowHistory(name="run", legacy_input="old")
+    row.input_data = PAGE
+    assert row.legacy_input is None
+    assert row.input_size == len(PAGE)
+    assert row.input_preview == make_preview(PAGE)
+    assert row.input_data == PAGE
+
+
+async def test_compaction_migrates_and_restores_legacy_rows(db):
+    prefix = "cp" + uuid.uuid4().hex[:10]
+    user = User(email=f"{prefix}@test.local", username=prefix, hashed_password="x")
+    db.add(user)
+    await db.commit()
+    db.add_all([
+        WorkflowHistory(user_id=user.id, name=prefix, legacy_input=f"input {index} " + PAGE, legacy_output="out")
+        for index in range(3)
+    ])
+    await db.commit()
+
+    def rows():
+        with compact_payloads.SessionLocal() as session:
+            return session.scalars(
+                select(WorkflowHistory).where(WorkflowHistory.user_id == user.id)
+                .order_by(WorkflowHistory.id).options(undefer_group("payload"))
+            ).all()
+
+    assert compact_payloads.run(batch=2, sleep=0) >= 3
+    for index, row in enumerate(rows()):
+        assert row.legacy_input is None and row.legacy_output is None
+        assert row.input_data == f"input {index} " + PAGE
+        assert row.output_data == "out"
+        assert row.output_size == 3
+
+    compact_payloads.run(batch=2, sleep=0, restore=True)
+    for index, row in enumerate(rows()):
+        assert row.input_blob is None and row.output_blob is None
+        assert row.legacy_input == f"input {index} " + PAGE
+
+
+async def test_locked_rows_are_reported(db, caplog):
+    prefix = "cl" + uuid.uuid4().hex[:10]
+    user = User(email=f"{prefix}@test.local", username=prefix, hashed_password="x")
+    db.add(user)
+    await db.commit()
+    rows = [WorkflowHistory(user_id=user.id, name=prefix, legacy_input="old") for _ in range(2)]
+    db.add_all(rows)
+    await db.commit()
+
+    # 另一个事务正在修改第一行
+    with compact_payloads.SessionLocal() as locker:
+        locker.scalar(select(WorkflowHistory.id).where(WorkflowHistory.id == rows[0].id).with_for_update())
+        with caplog.at_level("WARNING", logger="app.compact_payloads"):
+            compact_payloads.run(batch=10, sleep=0)
+    assert "仍有 1 行" in caplog.text
+
+    # 锁释放后重跑即可处理
+    assert compact_payloads.run(batch=10, sleep=0) == 1
+    with compact_payloads.SessionLocal() as session:
+        assert session.scalar(
+            select(WorkflowHistory.legacy_input).where(WorkflowHistory.id == rows[0].id)
+        ) is None
@@ -0,0 +1,115 @@
+import asyncio
+import uuid
+from concurrent.futures import Future
+
+import pytest
+
+from app.api import workflows
+from app.config import settings
+from app.services.preprocess import InputPreprocessor, looks_like_html
+
+pytestmark = pytest.mark.anyio
+
+PAGE = "<html><body>" + "<div><p>Hello   world</p></div>" * 200 + "</body></html>"
+
+
+class PendingExecutor:
+    """submit 返回由测试控制的 Future"""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        # 已交给子进程执行：不能再取消
+        future.set_running_or_notify_cancel()
+        self.futures.append(future)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def preprocess_settings(monkeypatch):
+    monkeypatch.setattr(settings, "preprocess_enabled", True)
+    monkeypatch.setattr(settings, "preprocess_min_chars", 100)
+    monkeypatch.setattr(settings, "preprocess_timeout", 30.0)
+
+
+def test_looks_like_html():
+    assert looks_like_html("<!DOCTYPE html><html>")
+    assert looks_like_html("  <div class='x'>")
+    assert not looks_like_html("Find me a <great> product title")
+
+
+async def test_short_or_plain_inputs_skip_the_pool():
+    preprocessor = InputPreprocessor(workers=1, max_queue=0)
+    assert await preprocessor.compact("<div>short</div>") == "<div>short</div>"
+    plain = "plain text " * 50
+    assert await preprocessor.compact(plain) == plain
+    assert preprocessor._executor is None
+
+
+async def test_timed_out_task_still_counts_until_finished(monkeypatch):
+    monkeypatch.setattr(settings, "preprocess_timeout", 0.01)
+    preprocessor = InputPreprocessor(workers=1, max_queue=0)
+    executor = PendingExecutor()
+    preprocessor._executor = executor
+
+    assert await preprocessor.compact(PAGE) == PAGE
+    # 子进程仍在解析，名额未归还：下一次调用直接判定为已满，不再提交
+    assert preprocessor._inflight == 1
+    assert await preprocessor.compact(PAGE) == PAGE
+    assert len(executor.futures) == 1
+
+    executor.futures[0].set_result("done")
+    await asyncio.sleep(0)
+    assert preprocessor._inflight == 0
+
+
+async def test_broken_pool_is_rebuilt():
+    preprocessor = InputPreprocessor(workers=1, max_queue=4)
+    try:
+        assert await preprocessor.compact(PAGE) != PAGE
+        broken = preprocessor._executor
+        # 模拟子进程被 OOM killer 杀掉
+        for process in list(broken._processes.values()):
+            process.kill()
+            process.join()
+
+        assert await preprocessor.compact(PAGE) == PAGE
+        assert preprocessor._executor is not broken
+        compacted = await preprocessor.compact(PAGE)
+        assert compacted.startswith("Hello world")
+        assert preprocessor._inflight == 0
+    finally:
+        preprocessor.shutdown()
+
+
+async def test_cache_hit_skips_preprocessing(redis, monkeypatch):
+    monkeypatch.setattr(settings, "result_cache_enabled", True)
+    monkeypatch.setattr(settings, "result_cache_unversioned_ttl", 60)
+    compacted = []
+    sent = []
+    app_version = "test-" + uuid.uuid4().hex
+
+    async def compact(text):
+        compacted.append(text)
+        return "compact"
+
+    async def run_workflow_blocking(inputs, **kwargs):
+        sent.append(inputs)
+        return {"status": "succeeded", "outputs": {"text": "ok"}}
+
+    async def version():
+        return app_version
+
+    monkeypatch.setattr(workflows.input_preprocessor, "compact", compact)
+    monkeypatch.setattr(workflows, "run_workflow_blocking", run_workflow_blocking)
+    monkeypatch.setattr(workflows, "default_app_version", version)
+
+    assert await workflows.call_dify_api(PAGE, user_id=1) == ("ok", "miss")
+    assert await workflows.call_dify_api(PAGE, user_id=1) == ("ok", "hit")
+    assert compacted == [PAGE]
+    assert sent == [{"query": "compact"}]
@@ -0,0 +1,116 @@
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import select
+
+from app.config import settings
+from app.models import User, WorkflowHistory
+from app.schemas.product import ProductIngestRequest, ProductRawData
+from app.services import product_ingest
+
+pytestmark = pytest.mark.anyio
+
+
+def random_asin() -> str:
+    return "B0" + uuid.uuid4().hex[:8].upper()
+
+
+def capture(asin: str, title: str = "Widget", **fields) -> ProductRawData:
+    return ProductRawData(asin=asin, title=title, **fields)
+
+
+@pytest.fixture
+async def user_id(db):
+    user = User(email=f"{uuid.uuid4().hex}@test.local", username=uuid.uuid4().hex, hashed_password="x")
+    db.add(user)
+    await db.commit()
+    return user.id
+
+
+@pytest.fixture
+def enqueued(monkeypatch):
+    calls = []
+
+    async def enqueue_many(history_ids):
+        if enqueue_many.fail:
+            raise ConnectionError("redis down")
+        calls.extend(history_ids)
+    enqueue_many.fail = False
+
+    monkeypatch.setattr(product_ingest.job_queue, "enqueue_many", enqueue_many)
+    return enqueue_many, calls
+
+
+async def test_unchanged_items_are_skipped(db, user_id):
+    asin = random_asin()
+    first = await product_ingest.ingest_products(db, [capture(asin, price="19.99")], user_id)
+    assert (first.inserted, first.updated, first.unchanged) == (1, 0, 0)
+
+    # url 不参与 content_hash
+    again = await product_ingest.ingest_products(db, [capture(asin, price="19.99", url="https://x/?ref=1")], user_id)
+    assert (again.inserted, again.updated, again.unchanged) == (0, 0, 1)
+    assert again.items == []
+
+    changed = await product_ingest.ingest_products(db, [capture(asin, price="17.99")], user_id)
+    assert (changed.inserted, changed.updated, changed.unchanged) == (0, 1, 0)
+    assert changed.items[0].result == "updated"
+
+
+async def test_duplicate_asins_in_batch_keep_last(db, user_id):
+    asin = random_asin()
+    result = await product_ingest.ingest_products(db, [capture(asin, "Old"), capture(asin, "New")], user_id)
+    assert (result.received, result.inserted) == (2, 1)
+    again = await product_ingest.ingest_products(db, [capture(asin, "New")], user_id)
+    assert again.unchanged == 1
+
+
+async def test_run_enqueues_once_per_content(db, user_id, enqueued):
+    _, calls = enqueued
+    asin = random_asin()
+    first = await product_ingest.ingest_products(db, [capture(asin)], user_id, run=True)
+    assert first.queued == 1
+    again = await product_ingest.ingest_products(db, [capture(asin)], user_id, run=True)
+    assert again.queued == 0
+    assert calls == [first.items[0].job_id]
+
+
+async def test_retry_after_enqueue_failure_requeues_job(db, user_id, enqueued):
+    enqueue_many, calls = enqueued
+    asin = random_asin()
+    enqueue_many.fail = True
+    with pytest.raises(HTTPException) as excinfo:
+        await product_ingest.ingest_products(db, [capture(asin)], user_id, run=True)
+    assert excinfo.value.status_code == 503
+    job = (await db.execute(select(WorkflowHistory).where(WorkflowHistory.user_id == user_id))).scalar_one()
+    assert (job.status, job.attempts) == ("failed", 0)
+
+    # 商品已入库，重试时内容未变化，但之前未执行的任务重新入队
+    enqueue_many.fail = False
+    retry = await product_ingest.ingest_products(db, [capture(asin)], user_id, run=True)
+    assert (retry.unchanged, retry.queued) == (1, 1)
+    assert retry.items[0].result == "requeued"
+    assert retry.items[0].job_id == job.id
+    assert calls == [job.id]
+    await db.refresh(job)
+    assert (job.status, job.error) == ("queued", None)
+
+
+async def test_executed_jobs_are_not_requeued(db, user_id, enqueued):
+    _, calls = enqueued
+    asin = random_asin()
+    first = await product_ingest.ingest_products(db, [capture(asin)], user_id, run=True)
+    job = await db.get(WorkflowHistory, first.items[0].job_id)
+    job.status, job.attempts = "failed", 1
+    await db.commit()
+
+    again = await product_ingest.ingest_products(db, [capture(asin)], user_id, run=True)
+    assert again.queued == 0
+    assert calls == [job.id]
+
+
+def test_oversized_batch_rejected_by_schema():
+    items = [{"asin": "B0AAAAAAAA", "title": "x"}] * (settings.product_ingest_max_items + 1)
+    with pytest.raises(ValidationError):
+        ProductIngestRequest.model_validate({"items": items})
@@ -0,0 +1,157 @@
+import uuid
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app.api import workflows
+from app.config import settings
+from app.services import result_cache as result_cache_module
+from app.services.result_cache import UNVERSIONED, ResultCache, default_app_version, inputs_digest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def cache(redis, monkeypatch):
+    monkeypatch.setattr(settings, "result_cache_enabled", True)
+    app_id = "test-" + uuid.uuid4().hex
+    yield ResultCache(), app_id
+    keys = [key async for key in redis.scan_iter(match=f"amz:result:{app_id}:*")]
+    if keys:
+        await redis.delete(*keys)
+        await redis.zrem("amz:result:index", *keys)
+
+
+def counting_run(value):
+    calls = []
+
+    async def run():
+        calls.append(1)
+        return value
+    return run, calls
+
+
+def test_inputs_digest_ignores_key_order():
+    assert inputs_digest({"a": 1, "b": "x"}) == inputs_digest({"b": "x", "a": 1})
+    assert inputs_digest({"a": 1}) != inputs_digest({"a": 2})
+
+
+async def test_hit_after_miss_and_new_version_misses(cache):
+    results, app_id = cache
+    run, calls = counting_run({"outputs": {"text": "ok"}})
+    assert (await results.get_or_run(app_id, "v1", {"q": 1}, run))[1] == "miss"
+    assert (await results.get_or_run(app_id, "v1", {"q": 1}, run))[1] == "hit"
+    # 应用更新后 (版本变化) 旧结果不再命中
+    assert (await results.get_or_run(app_id, "v2", {"q": 1}, run))[1] == "miss"
+    assert len(calls) == 2
+
+
+async def test_unversioned_results_use_short_ttl(cache, redis, monkeypatch):
+    results, app_id = cache
+    monkeypatch.setattr(settings, "result_cache_unversioned_ttl", 60)
+    run, _ = counting_run({"outputs": {}})
+    await results.get_or_run(app_id, UNVERSIONED, {"q": 1}, run)
+    assert 0 < await redis.ttl(results.cache_key(app_id, UNVERSIONED, {"q": 1})) <= 60
+    await results.get_or_run(app_id, "v1", {"q": 1}, run)
+    assert await redis.ttl(results.cache_key(app_id, "v1", {"q": 1})) > 60
+
+
+async def test_lock_release_keeps_lock_taken_by_another_process(cache, redis):
+    results, app_id = cache
+    lock_key = results.cache_key(app_id, "v1", {"q": 1}) + ":lock"
+
+    async def slow_run():
+        # 模拟执行超过锁有效期：锁过期后被另一个进程取得
+        await redis.set(lock_key, "other-process", ex=30)
+        return {"outputs": {}}
+
+    await results.get_or_run(app_id, "v1", {"q": 1}, slow_run)
+    assert await redis.get(lock_key) == b"other-process"
+    await redis.delete(lock_key)
+
+
+async def test_own_lock_released_after_run(cache, redis):
+    results, app_id = cache
+    run, _ = counting_run({"outputs": {}})
+    await results.get_or_run(app_id, "v1", {"q": 1}, run)
+    assert not await redis.exists(results.cache_key(app_id, "v1", {"q": 1}) + ":lock")
+
+
+class FakeDifyEngine:
+    def __init__(self, app_id):
+        self.app_id = app_id
+        self.queries = 0
+
+    @asynccontextmanager
+    async def connect(self):
+        engine = self
+
+        class Conn:
+            async def scalar(self, statement, params):
+                engine.queries += 1
+                return engine.app_id
+        yield Conn()
+
+
+@pytest.fixture
+def default_app(monkeypatch):
+    monkeypatch.setattr(settings, "result_cache_enabled", True)
+    result_cache_module._default_app.clear()
+    versions = {"app-1": {"updated_at": "2026-10-01T00:00:00"}}
+
+    async def get_app(app_id):
+        return versions.get(app_id)
+
+    monkeypatch.setattr(result_cache_module.dify_catalogue, "get_app", get_app)
+    yield versions
+    result_cache_module._default_app.clear()
+
+
+async def test_default_app_version_follows_app_updates(default_app, monkeypatch):
+    engine = FakeDifyEngine("app-1")
+    monkeypatch.setattr(result_cache_module, "dify_engine", engine)
+    assert await default_app_version() == "2026-10-01T00:00:00"
+    default_app["app-1"]["updated_at"] = "2026-10-02T00:00:00"
+    assert await default_app_version() == "2026-10-02T00:00:00"
+    # Key -> 应用 ID 的映射只查一次
+    assert engine.queries == 1
+
+
+async def test_default_app_version_unknown_key(default_app, monkeypatch):
+    monkeypatch.setattr(result_cache_module, "dify_engine", FakeDifyEngine(None))
+    assert await default_app_version() == UNVERSIONED
+    monkeypatch.setattr(result_cache_module, "dify_engine", None)
+    result_cache_module._default_app.clear()
+    assert await default_app_version() == UNVERSIONED
+
+
+async def test_default_app_version_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "result_cache_enabled", False)
+    assert await default_app_version() is None
+
+
+async def test_workflow_run_caches_only_succeeded_results(redis, monkeypatch):
+    monkeypatch.setattr(settings, "result_cache_enabled", True)
+    app_version = "test-" + uuid.uuid4().hex
+    results = [{"status": "stopped", "outputs": {"text": "partial"}}, {"status": "succeeded", "outputs": {"text": "ok"}}]
+
+    async def compact(text):
+        return text
+
+    async def run_workflow_blocking(inputs, **kwargs):
+        return results.pop(0)
+
+    async def version():
+        return app_version
+
+    monkeypatch.setattr(workflows.input_preprocessor, "compact", compact)
+    monkeypatch.setattr(workflows, "run_workflow_blocking", run_workflow_blocking)
+    monkeypatch.setattr(workflows, "default_app_version", version)
+
+    assert await workflows.call_dify_api("query", user_id=1) == ("partial", "miss")
+    # 被停止的运行没有写入缓存，下一次重新执行
+    assert await workflows.call_dify_api("query", user_id=1) == ("ok", "miss")
+    assert await workflows.call_dify_api("query", user_id=1) == ("ok", "hit")
+    keys = [key async for key in redis.scan_iter(match=f"amz:result:*:{app_version}:*")]
+    await redis.delete(*keys)
+    await redis.zrem("amz:result:index", *keys)
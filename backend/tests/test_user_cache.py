@@ -0,0 +1,56 @@
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from app.schemas.user import CurrentUser
+from app.services.user_cache import UserCache, _generation_key
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def subject(redis):
+    subject = f"{uuid.uuid4().hex}@example.com"
+    yield subject
+    await redis.delete(f"amz:user:{subject}", _generation_key(subject))
+
+
+def snapshot(subject: str, is_active: int = 1) -> CurrentUser:
+    return CurrentUser(
+        id=1, email=subject, username="u", is_admin=0, is_active=is_active,
+        created_at=datetime(2026, 1, 1, tzinfo=timezone.utc)
+    )
+
+
+async def test_set_after_miss_is_cached(subject):
+    cache = UserCache()
+    assert await cache.get(subject) is None
+    generation = await cache.generation(subject)
+    await cache.set(subject, snapshot(subject), generation)
+    assert (await cache.get(subject)).is_active == 1
+    # 其他 worker 从 Redis 命中
+    assert (await UserCache().get(subject)).email == subject
+
+
+async def test_invalidation_during_lookup_discards_stale_user(subject):
+    cache = UserCache()
+    generation = await cache.generation(subject)
+    # 查库期间管理员禁用了该用户
+    await cache.invalidate(subject)
+    await cache.set(subject, snapshot(subject), generation)
+    assert await cache.get(subject) is None
+    assert await UserCache().get(subject) is None
+
+    # 之后的查询正常回填
+    await cache.set(subject, snapshot(subject, is_active=0), await cache.generation(subject))
+    assert (await cache.get(subject)).is_active == 0
+
+
+async def test_invalidation_by_another_worker_discards_stale_user(subject, redis):
+    cache = UserCache()
+    generation = await cache.generation(subject)
+    # 另一进程的 invalidate() 已递增代数，本进程尚未收到广播
+    await redis.incr(_generation_key(subject))
+    await cache.set(subject, snapshot(subject), generation)
+    assert await cache.get(subject) is None
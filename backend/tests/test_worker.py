@@ -0,0 +1,85 @@
+import uuid
+
+import pytest
+
+from app import worker
+from app.config import settings
+from app.models import User, WorkflowHistory
+from app.services.dify_runs import DifyRunError
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def job(db):
+    user = User(email=f"{uuid.uuid4().hex}@test.local", username=uuid.uuid4().hex, hashed_password="x")
+    db.add(user)
+    await db.commit()
+    row = WorkflowHistory(user_id=user.id, name="job", status="queued", input_data="query")
+    db.add(row)
+    await db.commit()
+    return row
+
+
+@pytest.fixture
+def dify(monkeypatch):
+    """替换 Dify 调用与重试队列，记录调用次数"""
+    state = {"calls": 0, "result": {"outputs": {"text": "ok"}}, "retries": []}
+
+    async def compact(text):
+        return text
+
+    async def run_workflow_blocking(inputs, **kwargs):
+        state["calls"] += 1
+        result = state["result"]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def schedule_retry(history_id, attempt):
+        state["retries"].append(attempt)
+
+    monkeypatch.setattr(settings, "job_max_attempts", 2)
+    monkeypatch.setattr(worker.input_preprocessor, "compact", compact)
+    monkeypatch.setattr(worker, "run_workflow_blocking", run_workflow_blocking)
+    monkeypatch.setattr(worker.job_queue, "schedule_retry", schedule_retry)
+    return state
+
+
+async def test_completed_job(db, job, dify):
+    await worker.execute_job(job.id)
+    await db.refresh(job)
+    assert (job.status, job.attempts, job.output_preview) == ("completed", 1, "ok")
+
+
+async def test_unexpected_error_is_retried_then_failed(db, job, dify):
+    # Dify 返回了非 dict 结果：extract_output_text 抛出 AttributeError
+    dify["result"] = ["not", "a", "dict"]
+    await worker.execute_job(job.id)
+    await db.refresh(job)
+    assert (job.status, job.attempts) == ("queued", 1)
+    assert dify["retries"] == [1]
+
+    await worker.execute_job(job.id)
+    await db.refresh(job)
+    assert (job.status, job.attempts) == ("failed", 2)
+    assert job.finished_at is not None and job.error
+    assert dify["calls"] == 2
+
+
+async def test_non_retryable_dify_error_fails_immediately(db, job, dify):
+    dify["result"] = DifyRunError("bad request")
+    await worker.execute_job(job.id)
+    await db.refresh(job)
+    assert (job.status, job.error) == ("failed", "bad request")
+    assert dify["retries"] == []
+
+
+async def test_reclaimed_job_with_exhausted_attempts_is_not_rerun(db, job, dify):
+    # 上一次执行中途进程退出：停留在 running，消息被重新接管
+    job.status, job.attempts = "running", settings.job_max_attempts
+    await db.commit()
+    await worker.execute_job(job.id)
+    await db.refresh(job)
+    assert job.status == "failed" and job.finished_at is not None
+    assert dify["calls"] == 0
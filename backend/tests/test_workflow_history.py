@@ -0,0 +1,88 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.api import workflows
+from app.models import User, WorkflowHistory
+from app.schemas.workflow import WorkflowResponse
+from app.services.workflow_history import fetch_history_page
+
+pytestmark = pytest.mark.anyio
+
+BASE = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+async def history(db):
+    """一个用户的 7 条历史，created_at 有重复 (同一秒提交的任务)"""
+    prefix = "wh" + uuid.uuid4().hex[:10]
+    user = User(email=f"{prefix}@test.local", username=prefix, hashed_password="x")
+    db.add(user)
+    await db.commit()
+    rows = []
+    for index in range(7):
+        row = WorkflowHistory(
+            user_id=user.id,
+            name=f"run-{index}",
+            status="failed" if index % 3 == 0 else "completed",
+            created_at=BASE + timedelta(hours=index // 2)
+        )
+        row.input_data = f"input-{index} " + "x" * 1000
+        rows.append(row)
+    db.add_all(rows)
+    await db.commit()
+    return user, rows
+
+
+def newest_first(rows):
+    return [row.id for row in sorted(rows, key=lambda row: (row.created_at, row.id), reverse=True)]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7])
+async def test_pages_cover_every_row_once(db, history, limit):
+    user, rows = history
+    seen, cursor = [], None
+    while True:
+        page, cursor = await fetch_history_page(db, limit, user_id=user.id, cursor=cursor)
+        assert len(page) <= limit
+        seen.extend(row.id for row in page)
+        if cursor is None:
+            break
+    assert seen == newest_first(rows)
+
+
+async def test_filters(db, history):
+    user, rows = history
+    page, _ = await fetch_history_page(db, 50, user_id=user.id, status="failed")
+    assert [row.id for row in page] == newest_first([row for row in rows if row.status == "failed"])
+
+    page, _ = await fetch_history_page(
+        db, 50, user_id=user.id, created_from=BASE + timedelta(hours=1), created_to=BASE + timedelta(hours=3)
+    )
+    assert {row.name for row in page} == {"run-2", "run-3", "run-4", "run-5"}
+
+    page, _ = await fetch_history_page(db, 50, user_id=user.id, name="RUN-6")
+    assert [row.name for row in page] == ["run-6"]
+
+
+async def test_legacy_route_returns_full_list(db, history):
+    user, rows = history
+    items = await workflows.get_workflow_history(
+        status_filter=None, name=None, created_from=None, created_to=None, current_user=user, db=db
+    )
+    assert [row.id for row in items] == newest_first(rows)
+    # 旧版响应含完整输入
+    response = WorkflowResponse.model_validate(items[0])
+    assert response.input_data.startswith("input-6 ") and len(response.input_data) == 1008
+
+
+async def test_v2_route_returns_page(db, history):
+    user, rows = history
+    page = await workflows.get_workflow_history_page(
+        cursor=None, limit=4, status_filter=None, name=None, created_from=None, created_to=None,
+        current_user=user, db=db
+    )
+    assert [item.id for item in page.items] == newest_first(rows)[:4]
+    assert page.next_cursor is not None
+    assert page.items[0].input_size == 1008
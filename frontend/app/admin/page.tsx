@@ -33,14 +33,21 @@ export default function AdminPage() {
   const [stats, setStats] = useState<Stats | null>(null)
   const [searchTerm, setSearchTerm] = useState('')
   const [loading, setLoading] = useState(true)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [isAdmin, setIsAdmin] = useState(false)
 
   useEffect(() => {
     checkAdminAccess()
-    fetchUsers()
     fetchStats()
   }, [])
 
+  // 用户列表按页加载，搜索交给后端 (只过滤已加载的页会漏掉后面的用户)
+  useEffect(() => {
+    const timer = setTimeout(() => fetchUsers(), 300)
+    return () => clearTimeout(timer)
+  }, [searchTerm])
+
   const checkAdminAccess = async () => {
     try {
       const token = localStorage.getItem('token')
@@ -83,21 +90,32 @@ export default function AdminPage() {
     }
   }
 
-  const fetchUsers = async () => {
+  // 不带 cursor 时重新加载第一页，带 cursor 时追加下一页
+  const fetchUsers = async (cursor?: string) => {
     try {
+      if (cursor) setLoadingMore(true)
       const token = localStorage.getItem('token')
+      const keyword = searchTerm.trim()
       // Use relative path which is proxied
       const response = await axios.get('/api/admin/users', {
         headers: {
           Authorization: `Bearer ${token}`
+        },
+        params: {
+          cursor,
+          q: keyword || undefined,
+          match: keyword ? 'contains' : undefined
         }
       })
-      setUsers(response.data.data)
+      const page: User[] = response.data.data
+      setUsers(prev => (cursor ? [...prev, ...page] : page))
+      setNextCursor(response.data.next_cursor ?? null)
     } catch (error: any) {
       console.error('Failed to fetch users:', error)
       toast.error('获取用户列表失败')
     } finally {
       setLoading(false)
+      setLoadingMore(false)
     }
   }
 
@@ -202,11 +220,6 @@ export default function AdminPage() {
     }
   }
 
-  const filteredUsers = users.filter(user =>
-    user.email.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    user.username.toLowerCase().includes(searchTerm.toLowerCase())
-  )
-
   if (!isAdmin) {
     return (
       <div className="min-h-screen flex items-center justify-center bg-gradient-to-br from-blue-50 via-white to-purple-50 dark:from-gray-900 dark:via-gray-800 dark:to-gray-900 relative overflow-hidden">
@@ -343,7 +356,7 @@ export default function AdminPage() {
                         </tr>
                       </thead>
                       <tbody>
-                        {filteredUsers.map((user) => (
+                        {users.map((user) => (
                           <tr key={user.id} className="border-b border-gray-100 hover:bg-gray-50">
                             <td className="py-3 px-4">
                               <div className="flex items-center space-x-3">
@@ -383,7 +396,7 @@ export default function AdminPage() {
                               )}
                             </td>
                             <td className="py-3 px-4 text-sm text-gray-600">
-                              {new Date(user.created_at).toLocaleString('zh-CN')}
+                              {user.created_at ? new Date(user.created_at).toLocaleString('zh-CN') : '-'}
                             </td>
                             <td className="py-3 px-4">
                               <div className="flex items-center space-x-2">
@@ -436,12 +449,24 @@ export default function AdminPage() {
                       </tbody>
                     </table>
 
-                    {filteredUsers.length === 0 && (
+                    {users.length === 0 && (
                       <div className="text-center py-12">
                         <Users className="w-16 h-16 mx-auto text-gray-400 mb-4" />
                         <p className="text-gray-600">没有找到用户</p>
                       </div>
                     )}
+
+                    {nextCursor && (
+                      <div className="text-center mt-6">
+                        <AnimatedButton
+                          variant="outline"
+                          loading={loadingMore}
+                          onClick={() => fetchUsers(nextCursor)}
+                        >
+                          加载更多
+                        </AnimatedButton>
+                      </div>
+                    )}
                   </div>
                 )}
               </MagicCard>
@@ -46,21 +46,30 @@ export default function WorkflowListPage() {
     setLoading(true)
     try {
       const token = localStorage.getItem('token')
-      // Use proxied path to avoid CORS and port issues
-      const response = await fetch('/api/dify/apps', {
-        headers: {
-          'Authorization': `Bearer ${token}`,
-          'Content-Type': 'application/json',
-        },
-      })
+      // 接口按游标分页，沿 next_cursor 取完全部应用
+      const allApps: DifyApp[] = []
+      let cursor: string | null = null
+      do {
+        const params = new URLSearchParams({ limit: '1000' })
+        if (cursor) params.set('cursor', cursor)
+        // Use proxied path to avoid CORS and port issues
+        const response = await fetch(`/api/dify/apps?${params}`, {
+          headers: {
+            'Authorization': `Bearer ${token}`,
+            'Content-Type': 'application/json',
+          },
+        })
 
-      if (response.ok) {
+        if (!response.ok) {
+          console.error('获取 Dify 应用失败')
+          setApps([])
+          return
+        }
         const data = await response.json()
-        setApps(data.apps || [])
-      } else {
-        console.error('获取 Dify 应用失败')
-        setApps([])
-      }
+        allApps.push(...(data.apps || []))
+        cursor = data.next_cursor || null
+      } while (cursor)
+      setApps(allApps)
     } catch (error) {
       console.error('获取 Dify 应用失败:', error)
       setApps([])